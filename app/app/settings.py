@@ -53,6 +53,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.PerformanceMiddleware',
+    'core.middleware.RateLimitHeadersMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -79,17 +81,109 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# DB_POOL_MAX_SIZE > 0 shares at most that many connections between the
+# threads of a process, handing them back to the pool after every request.
+# Otherwise every thread keeps its connection for DB_CONN_MAX_AGE seconds.
+# Either way a reused connection is checked before it serves a request.
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': int(os.environ.get(
+            'DB_CONN_MAX_AGE',
+            0 if DB_POOL_MAX_SIZE else 60
+        )),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'MAX_SIZE': DB_POOL_MAX_SIZE,
+            'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 0)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            'CHECK_IDLE': float(os.environ.get('DB_POOL_CHECK_IDLE', 10)),
+        },
     }
 }
 
 
+# Read replicas of the default database, DB_REPLICA_HOSTS is a comma
+# separated list of hosts with the same database name and credentials.
+# Safe API requests read from them, unless the user wrote within the last
+# REPLICA_STICKY_SECONDS seconds.
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))
+):
+    alias = f'replica_{index + 1}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+# Cache remembering the users pinned to the primary, which must be shared
+# by all processes, as the next request may reach any of them
+REPLICA_PIN_CACHE = os.environ.get('REPLICA_PIN_CACHE', 'default')
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Token authentication cache: seconds and size of the per process tier,
+# seconds of the shared tier. A process local default cache is no shared
+# tier, revocations only reach the other processes once entries expire.
+TOKEN_AUTH_LOCAL_TTL = int(os.environ.get('TOKEN_AUTH_LOCAL_TTL', 5))
+TOKEN_AUTH_LOCAL_SIZE = int(os.environ.get('TOKEN_AUTH_LOCAL_SIZE', 1024))
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get(
+    'TOKEN_AUTH_CACHE_TTL',
+    5 if CACHES['default']['BACKEND'].endswith('.LocMemCache') else 300
+))
+
+# Seconds a cached list response of the API is kept
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT', 300))
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/3.0/topics/auth/passwords/
+#
+# PASSWORD_HASHER selects the hasher of new passwords, argon2 or pbkdf2.
+# Passwords stored with the other one or with another cost are rehashed
+# when their user logs in.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'argon2')
+PASSWORD_HASHERS = [
+    'core.hashers.Argon2PasswordHasher',
+    'core.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+if PASSWORD_HASHER == 'pbkdf2':
+    PASSWORD_HASHERS[:2] = reversed(PASSWORD_HASHERS[:2])
+
+# Argon2 cost: passes, KiB of memory and lanes
+ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 19456))
+ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 1))
+PBKDF2_ITERATIONS = int(os.environ.get('PBKDF2_ITERATIONS', 260000))
+
+# Threads per process hashing the passwords of logins and signups in the
+# async serving mode, so hashing neither blocks nor starves other requests
+LOGIN_WORKERS = int(os.environ.get('LOGIN_WORKERS', os.cpu_count() or 1))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -132,6 +226,30 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# Processing of uploaded recipe images: 'sync' inside the request,
+# 'thread' in a worker pool of the web process or 'queue' to leave
+# pending images to `manage.py process_images`. Only the queue survives
+# restarts of the web processes, their threads lose the images at hand.
+IMAGE_PROCESSING_MODE = os.environ.get('IMAGE_PROCESSING_MODE', 'queue')
+IMAGE_PROCESSING_WORKERS = int(os.environ.get('IMAGE_PROCESSING_WORKERS', 2))
+# Longest edge in pixels of the generated renditions
+IMAGE_RENDITION_SIZES = {
+    'small': 320,
+    'medium': 800,
+    'large': 1600,
+}
+IMAGE_RENDITION_FORMATS = ('WEBP', 'JPEG')
+IMAGE_RENDITION_QUALITY = 80
+# Limits enforced while an image upload is still streaming in
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.environ.get('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+)
+IMAGE_UPLOAD_MAX_DIMENSION = 10000
+IMAGE_UPLOAD_FORMATS = ('JPEG', 'PNG', 'WEBP')
+# Seconds a resumable image upload may go without a chunk before it
+# expires, after which `manage.py clear_expired_uploads` removes it
+IMAGE_UPLOAD_EXPIRY = int(os.environ.get('IMAGE_UPLOAD_EXPIRY', 24 * 60 * 60))
+
 
 # Overwriting the default user Model with the customized Model
 AUTH_USER_MODEL = 'core.user'
@@ -140,5 +258,70 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-    ]
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.UserTokenBucketThrottle',
+        'core.throttling.IPTokenBucketThrottle',
+    ],
+    # Requests per user (or address if anonymous) and per address, the
+    # login, upload and export scopes replace the user rate of their views
+    'DEFAULT_THROTTLE_RATES': {
+        'user': os.environ.get('THROTTLE_RATE_USER', '1200/min'),
+        'ip': os.environ.get('THROTTLE_RATE_IP', '3000/min'),
+        'login': os.environ.get('THROTTLE_RATE_LOGIN', '20/min'),
+        'upload': os.environ.get('THROTTLE_RATE_UPLOAD', '60/hour'),
+        'export': os.environ.get('THROTTLE_RATE_EXPORT', '30/hour'),
+    },
+    # Proxies in front of the app, to find the client address
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)) or None,
 }
+
+# Where the throttles keep their token buckets: in-process with
+# core.throttling.LocalBucketStore, or shared by all processes with
+# core.throttling.CacheBucketStore in the THROTTLE_CACHE. In-process
+# buckets allow every process the full rate.
+THROTTLE_STORE = os.environ.get(
+    'THROTTLE_STORE',
+    'core.throttling.LocalBucketStore'
+)
+THROTTLE_CACHE = os.environ.get('THROTTLE_CACHE', 'default')
+THROTTLE_LOCAL_SIZE = int(os.environ.get('THROTTLE_LOCAL_SIZE', 100000))
+
+# Default page size and upper bound for the page_size query parameter of
+# the paginated endpoints
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+
+# Text search configuration of the recipe search vectors on PostgreSQL
+SEARCH_CONFIG = os.environ.get('SEARCH_CONFIG', 'english')
+
+# Recipes read per database round trip of a recipe export
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# Views streaming content read from the database, served by the WSGI
+# handler under an ASGI server, which would iterate it in the event loop
+WSGI_STREAMED_VIEWS = ('recipe:recipe-export',)
+
+# Maximum number of items of a single bulk request
+API_MAX_BULK_SIZE = int(os.environ.get('API_MAX_BULK_SIZE', 1000))
+
+# Request metrics exported at /metrics to scrapers sending METRICS_TOKEN
+# as a bearer token, and the fraction of the requests profiled for their
+# database queries and serializer time
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0.05))
+
+# Directory the worker processes of a server share their metrics in, so
+# a scrape answered by any of them reports all. Without one every process
+# only exports its own. Observations reach it every METRICS_FLUSH_INTERVAL
+# seconds.
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+
+# Serve the API endpoints from async views, running reads on a pool of
+# ASYNC_READ_WORKERS threads and writes on one of ASYNC_WRITE_WORKERS.
+# Only pays off under an ASGI server.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+ASYNC_READ_WORKERS = int(os.environ.get('ASYNC_READ_WORKERS', 16))
+ASYNC_WRITE_WORKERS = int(os.environ.get('ASYNC_WRITE_WORKERS', 4))
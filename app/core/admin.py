@@ -36,3 +36,5 @@ admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Tag)
 admin.site.register(models.Ingredient)
 admin.site.register(models.Recipe)
+admin.site.register(models.RecipeImageRendition)
+admin.site.register(models.RecipeImageUpload)
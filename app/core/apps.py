@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from core import checks  # noqa: F401
+        from core.metrics import install_query_profiler
+
+        # Sampled requests time the queries of whichever thread serves them
+        connection_created.connect(install_query_profiler)
@@ -0,0 +1,58 @@
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.urls import Resolver404, resolve
+
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+    """Serve a WSGI request from a thread of its own
+
+    asgiref runs WSGI applications in the one thread shared by all sync
+    code, which a long stream would hold for its whole duration.
+    """
+
+    run_wsgi_app = sync_to_async(
+        WsgiToAsgiInstance.__dict__['run_wsgi_app'].func,
+        thread_sensitive=False
+    )
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """Serve a WSGI application under ASGI, each request in a thread"""
+
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiInstance(self.wsgi_application)(
+            scope, receive, send
+        )
+
+
+class StreamingRouter:
+    """ASGI application serving the WSGI_STREAMED_VIEWS as WSGI
+
+    Django's ASGI handler iterates streamed content in the event loop,
+    where database queries are not allowed. The content of these views
+    is iterated in the thread serving the request instead, and sent as
+    it is produced.
+    """
+
+    def __init__(self):
+        self.asgi_application = get_asgi_application()
+        self.wsgi_application = ThreadedWsgiToAsgi(get_wsgi_application())
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and self.is_streamed(scope['path']):
+            application = self.wsgi_application
+        else:
+            application = self.asgi_application
+        await application(scope, receive, send)
+
+    def is_streamed(self, path):
+        """Return whether a path is served by a streamed view"""
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return False
+        return match.view_name in settings.WSGI_STREAMED_VIEWS
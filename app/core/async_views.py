@@ -0,0 +1,71 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+def serve_in_thread(view, request, *args, **kwargs):
+    """Serve a request of a sync view from a pooled thread"""
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        # Render here instead of in the thread shared by sync code
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+async def run_in_pool(executor, view, request, *args, **kwargs):
+    """Serve a request of a sync view from a thread of `executor`"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor,
+        functools.partial(
+            context.run, serve_in_thread, view, request, *args, **kwargs
+        )
+    )
+
+
+# Methods served from the read pool, they only read
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_executors = {}
+
+
+def _get_executor(name, max_workers):
+    """Return the thread pool `name`, creating it on first use
+
+    Every thread keeps its own database connection, so the pool sizes
+    also bound the connections of a process.
+    """
+    if name not in _executors:
+        _executors[name] = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f'{name}-view'
+        )
+    return _executors[name]
+
+
+def concurrent_requests(view):
+    """Turn a sync view into an async one serving requests concurrently
+
+    Under ASGI, Django runs every sync view in one thread per process, so
+    a request waiting for the database blocks all others. Requests of the
+    returned view are served from thread pools instead: reads from one of
+    ASYNC_READ_WORKERS threads, writes from one of ASYNC_WRITE_WORKERS,
+    so writes waiting on row locks cannot starve the reads.
+    """
+    @functools.wraps(view)
+    async def async_view(request, *args, **kwargs):
+        if request.method in READ_METHODS:
+            executor = _get_executor('read', settings.ASYNC_READ_WORKERS)
+        else:
+            executor = _get_executor('write', settings.ASYNC_WRITE_WORKERS)
+        return await run_in_pool(executor, view, request, *args, **kwargs)
+
+    return async_view
@@ -0,0 +1,141 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+TOKEN_CACHE_KEY = 'auth-token:{digest}'
+# User fields kept with a cached token, enough for authentication and the
+# permission checks. Views needing more read the user themselves.
+CACHED_USER_FIELDS = (
+    'id', 'email', 'name', 'is_active', 'is_staff', 'is_superuser'
+)
+
+
+class LRUCache:
+    """Thread safe, size bounded in-process cache with expiring entries"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value of a key or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used on overflow"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Remove a key if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._entries.clear()
+
+
+_local_tokens = LRUCache(
+    settings.TOKEN_AUTH_LOCAL_SIZE,
+    settings.TOKEN_AUTH_LOCAL_TTL
+)
+
+
+def _shared_key(key):
+    """Return the shared cache key of a token without exposing the token"""
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return TOKEN_CACHE_KEY.format(digest=digest)
+
+
+def invalidate_cached_token(key):
+    """Drop a token from the shared and the in-process cache
+
+    Other processes only notice through the shared tier, their own
+    in-process entries expire after TOKEN_AUTH_LOCAL_TTL seconds.
+    """
+    cache.delete(_shared_key(key))
+    _local_tokens.delete(key)
+
+
+def clear_local_token_cache():
+    """Empty the in-process tier of this process"""
+    _local_tokens.clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that avoids the token and user query
+
+    Resolved tokens are kept in a bounded in-process LRU cache, backed by
+    the shared Django cache, as plain field values from which a fresh
+    user instance is built for every request. Only the CACHED_USER_FIELDS
+    are kept, so the password hash never reaches the cache.
+    """
+
+    def authenticate_credentials(self, key):
+        """Return the user and token of a key, from the cache if possible"""
+        entry = _local_tokens.get(key)
+        if entry is None:
+            entry = cache.get(_shared_key(key))
+            if entry is None:
+                entry = self._load_entry(key)
+                cache.set(
+                    _shared_key(key),
+                    entry,
+                    settings.TOKEN_AUTH_CACHE_TTL
+                )
+            _local_tokens.set(key, entry)
+
+        created, field_names, values = entry
+        user = get_user_model().from_db(DEFAULT_DB_ALIAS, field_names, values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        token = self.get_model()(key=key, user=user, created=created)
+
+        return (user, token)
+
+    def _load_entry(self, key):
+        """Read a token and its user from the database"""
+        try:
+            token = self.get_model().objects.select_related('user').get(
+                key=key
+            )
+        except self.get_model().DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        # from_db expects the fields in their model order
+        field_names = [
+            field.attname
+            for field in get_user_model()._meta.concrete_fields
+            if field.attname in CACHED_USER_FIELDS
+        ]
+        values = [getattr(token.user, name) for name in field_names]
+
+        return (token.created, field_names, values)
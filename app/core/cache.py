@@ -0,0 +1,56 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+USER_VERSION_KEY = 'user-data-version:{user_id}'
+USER_MODIFIED_KEY = 'user-data-modified:{user_id}'
+
+
+def get_user_version(user_id):
+    """Return the current version of the data owned by a user
+
+    A missing version is seeded from the clock instead of starting at 1,
+    so an evicted counter never points back at entries cached for an
+    older state.
+    """
+    key = USER_VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+
+    return version
+
+
+def get_user_modified(user_id):
+    """Return the epoch seconds of the last change to a user's data
+
+    Returns None if no change has been recorded since the cache was
+    emptied.
+    """
+    return cache.get(USER_MODIFIED_KEY.format(user_id=user_id))
+
+
+def bump_user_version(user_id):
+    """Invalidate every cached response of a user once the change commits
+
+    Bumping inside the transaction would let a concurrent request cache
+    the data from before the commit under the new version.
+    """
+    transaction.on_commit(lambda: increment_user_version(user_id))
+
+
+def increment_user_version(user_id):
+    """Invalidate every cached response of a user right away"""
+    key = USER_VERSION_KEY.format(user_id=user_id)
+    cache.set(
+        USER_MODIFIED_KEY.format(user_id=user_id),
+        int(time.time()),
+        timeout=None
+    )
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The counter is not in the cache (yet), seed a fresh one
+        return get_user_version(user_id)
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Cache backends whose entries only exist in the process setting them
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Require the caches shared by all processes in production
+
+    Revoked tokens, deactivated users, invalidated responses and replica
+    pins would otherwise only reach the other processes once the entries
+    expire, if ever.
+    """
+    errors = []
+    for alias in sorted({'default', settings.REPLICA_PIN_CACHE}):
+        backend = settings.CACHES[alias]['BACKEND']
+        if backend in PROCESS_LOCAL_CACHES:
+            errors.append(Error(
+                f'The {alias} cache {backend} is not shared between '
+                f'processes.',
+                hint='Point it to a shared cache, e.g. memcached.',
+                id='core.E001',
+            ))
+    return errors
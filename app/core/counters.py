@@ -0,0 +1,84 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+
+def user_counter(model):
+    """Return the user field counting the objects of a model"""
+    return f'{model._meta.model_name}_count'
+
+
+def _shifted(field, delta):
+    """Return an expression adding delta to a counter, floored at zero
+
+    Counters are positive integer fields, so a drifted counter must not
+    fail a delete by going negative.
+    """
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def adjust_counters(queryset, **deltas):
+    """Add deltas to counter fields of the matching rows in one UPDATE
+
+    The addition happens in the database, so concurrent adjustments are
+    never lost.
+    """
+    changes = {
+        field: _shifted(field, delta)
+        for field, delta in deltas.items()
+        if delta
+    }
+    if changes:
+        queryset.update(**changes)
+
+
+def adjust_recipe_counts(model, deltas):
+    """Apply recipe count deltas to tags or ingredients by primary key
+
+    Rows sharing a delta are updated together, so adding a single link
+    to many tags is still one UPDATE. Rows that gained links are marked
+    as used now.
+    """
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(pk)
+
+    now = timezone.now()
+    for delta, pks in by_delta.items():
+        changes = {'recipe_count': _shifted('recipe_count', delta)}
+        if delta > 0:
+            changes['last_used_at'] = now
+        model.objects.filter(pk__in=pks).update(**changes)
+
+
+def linked_recipe_count(model):
+    """Return a subquery counting the recipes of each tag or ingredient"""
+    field = model._meta.get_field('recipe').field
+    target = f'{field.m2m_reverse_field_name()}_id'
+    counts = (
+        field.remote_field.through.objects
+        .filter(**{target: OuterRef('pk')})
+        .order_by()
+        .values(target)
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def owned_count(owned_model):
+    """Return a subquery counting the objects of a model owned by a user"""
+    counts = (
+        owned_model.objects
+        .filter(user=OuterRef('pk'))
+        .order_by()
+        .values('user')
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
@@ -0,0 +1,144 @@
+import os
+import threading
+
+from django.db.backends.postgresql import base
+
+from core.db.pool import ConnectionPool, PoolExhausted
+
+Database = base.Database
+
+_pools = {}
+# Pools inherited from the parent of a forked process, kept referenced
+# since closing their connections would close them for the parent too
+_inherited_pools = []
+_pools_lock = threading.Lock()
+
+
+def _reset(connection):
+    """Roll back what a returned connection left open"""
+    status = connection.get_transaction_status()
+    if status == base.psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != base.psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    return True
+
+
+def _is_usable(connection):
+    """Return whether a raw connection still answers"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL backend with connection health checks and pooling
+
+    With CONN_HEALTH_CHECKS a persistent connection is checked before
+    its first use in every request, instead of failing that request.
+    With POOL['MAX_SIZE'] connections are checked out of a pool shared
+    by the threads of the process, and returned to it instead of being
+    closed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = True
+        self.connection_broken = False
+
+    @property
+    def pool(self):
+        """Return the pool of this database in this process, if enabled"""
+        options = self.settings_dict.get('POOL') or {}
+        if not options.get('MAX_SIZE'):
+            return None
+        # The test runner points an alias at another database by name
+        key = (self.alias, self.settings_dict['NAME'])
+        pool = _pools.get(key)
+        if pool is not None and pool.pid == os.getpid():
+            return pool
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None or pool.pid != os.getpid():
+                if pool is not None:
+                    _inherited_pools.append(pool)
+                conn_params = self.get_connection_params()
+                pool = _pools[key] = ConnectionPool(
+                    lambda: Database.connect(**conn_params),
+                    max_size=options['MAX_SIZE'],
+                    min_size=options.get('MIN_SIZE', 0),
+                    timeout=options.get('TIMEOUT', 30),
+                    check_idle=options.get('CHECK_IDLE', 10),
+                    is_usable=_is_usable,
+                    reset=_reset
+                )
+        return pool
+
+    def get_new_connection(self, conn_params):
+        """Check a connection out of the pool if pooling is enabled"""
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            connection = pool.checkout()
+        except PoolExhausted as error:
+            raise Database.OperationalError(str(error)) from error
+
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get(
+            'isolation_level', connection.isolation_level
+        )
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        base.psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x
+        )
+        return connection
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+        self.connection_broken = False
+
+    def _close(self):
+        """Return the connection to the pool instead of closing it"""
+        pool = self.pool
+        if pool is None:
+            return super()._close()
+        # A connection closed inside an atomic block stays referenced by
+        # this wrapper, so it may not be handed to anyone else
+        discard = (
+            self.in_atomic_block or self.errors_occurred
+            or self.connection_broken
+        )
+        pool.checkin(self.connection, discard=discard)
+
+    def close_if_unusable_or_obsolete(self):
+        """Schedule a health check before the connection is used again"""
+        super().close_if_unusable_or_obsolete()
+        if self.connection is not None:
+            self.health_check_done = False
+
+    def ensure_connection(self):
+        """Replace a persistent connection that stopped working"""
+        if (
+            self.connection is not None
+            and not self.health_check_done
+            and not self.in_atomic_block
+            and self.settings_dict.get('CONN_HEALTH_CHECKS')
+        ):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.connection_broken = True
+                self.close()
+        super().ensure_connection()
+
+    def warm_pool(self):
+        """Open the minimum number of pooled connections, return how many"""
+        pool = self.pool
+        if pool is None:
+            return 0
+        return pool.warm()
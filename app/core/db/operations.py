@@ -0,0 +1,122 @@
+from django.db import NotSupportedError
+from django.db.migrations.operations import AddIndex, AlterField, \
+    RemoveIndex
+from django.db.models import Index
+
+
+class ConcurrentOperationMixin:
+    """Run an index operation without blocking writes on PostgreSQL
+
+    PostgreSQL builds and drops the index CONCURRENTLY, which cannot run
+    in a transaction, so the migration must set atomic = False. Other
+    databases run the operation as usual.
+    """
+
+    def is_concurrent(self, schema_editor):
+        """Return whether the operation runs concurrently"""
+        if schema_editor.connection.vendor != 'postgresql':
+            return False
+        if schema_editor.connection.in_atomic_block:
+            raise NotSupportedError(
+                f'{type(self).__name__} needs a migration with '
+                f'atomic = False'
+            )
+        return True
+
+
+class AddIndexConcurrently(ConcurrentOperationMixin, AddIndex):
+    """Add an index without blocking writes on PostgreSQL"""
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if not self.is_concurrent(schema_editor):
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if not self.is_concurrent(schema_editor):
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class RemoveIndexConcurrently(ConcurrentOperationMixin, RemoveIndex):
+    """Remove an index without blocking writes on PostgreSQL"""
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if not self.is_concurrent(schema_editor):
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = from_state.models[
+                app_label, self.model_name_lower
+            ].get_index_by_name(self.name)
+            schema_editor.remove_index(model, index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if not self.is_concurrent(schema_editor):
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = to_state.models[
+                app_label, self.model_name_lower
+            ].get_index_by_name(self.name)
+            schema_editor.add_index(model, index, concurrently=True)
+
+
+class AlterIndexedFieldConcurrently(ConcurrentOperationMixin, AlterField):
+    """Only change whether a field is indexed, without blocking writes
+
+    Used to drop the index of a foreign key leading a composite index,
+    which makes it redundant. Any other change of the field is rejected.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        self._alter_index(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        self._alter_index(app_label, schema_editor, to_state, from_state)
+
+    def _alter_index(self, app_label, schema_editor, from_state, to_state):
+        from_model = from_state.apps.get_model(app_label, self.model_name)
+        to_model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(
+                schema_editor.connection.alias, to_model):
+            return
+        old_field = from_model._meta.get_field(self.name)
+        new_field = to_model._meta.get_field(self.name)
+        old_kwargs = {**old_field.deconstruct()[3], 'db_index': None}
+        new_kwargs = {**new_field.deconstruct()[3], 'db_index': None}
+        if old_kwargs != new_kwargs:
+            raise ValueError(f'{type(self).__name__} only changes db_index')
+
+        if not self.is_concurrent(schema_editor):
+            schema_editor.alter_field(from_model, old_field, new_field)
+        elif old_field.db_index and not new_field.db_index:
+            for name in schema_editor._constraint_names(
+                from_model, [old_field.column], index=True,
+                type_=Index.suffix
+            ):
+                schema_editor.execute(schema_editor._delete_index_sql(
+                    from_model, name, concurrently=True
+                ))
+        elif new_field.db_index and not old_field.db_index:
+            schema_editor.execute(schema_editor._create_index_sql(
+                to_model, fields=[new_field], concurrently=True
+            ))
@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection became available in time"""
+
+
+class ConnectionPool:
+    """Thread safe pool of raw database connections of one process
+
+    At most `max_size` connections are open at once. A connection that
+    sat idle for `check_idle` seconds or longer is checked with
+    `is_usable` before it is handed out again and replaced if it is
+    broken. Returned connections are cleaned up with `reset`, which
+    reports whether the connection can be reused.
+    """
+
+    def __init__(self, connect, max_size, min_size=0, timeout=30,
+                 check_idle=10, is_usable=None, reset=None):
+        self.connect = connect
+        self.max_size = max_size
+        self.min_size = min(min_size, max_size)
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.is_usable = is_usable or (lambda connection: True)
+        self.reset = reset or (lambda connection: True)
+        self.pid = os.getpid()
+        self._idle = []
+        self._size = 0
+        self._lock = threading.Condition()
+
+    @property
+    def size(self):
+        """Return the number of open connections"""
+        return self._size
+
+    @property
+    def idle(self):
+        """Return the number of connections waiting to be checked out"""
+        return len(self._idle)
+
+    def checkout(self):
+        """Return an idle connection, a new one or wait for a returned one"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._lock:
+                entry = self._take(deadline)
+            if entry is None:
+                return self._open()
+            connection, returned_at = entry
+            if self._healthy(connection, returned_at):
+                return connection
+            self._discard(connection)
+
+    def checkin(self, connection, discard=False):
+        """Return a connection to the pool, or close it if it is broken"""
+        if discard or not self._reusable(connection):
+            self._discard(connection)
+            return
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+            self._lock.notify()
+
+    def warm(self):
+        """Open connections until `min_size` are open
+
+        Connections opened before one fails to open are still handed to
+        the pool.
+        """
+        opened = []
+        try:
+            while True:
+                with self._lock:
+                    if self._size >= self.min_size:
+                        break
+                    self._size += 1
+                opened.append(self._open())
+        finally:
+            for connection in opened:
+                self.checkin(connection)
+        return len(opened)
+
+    def close(self):
+        """Close the idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, returned_at in idle:
+            self._discard(connection)
+
+    def _take(self, deadline):
+        """Pop an idle connection or reserve room for a new one
+
+        Must be called holding the lock. Returns None once a new
+        connection may be opened.
+        """
+        while True:
+            if self._idle:
+                # The most recently returned connection is the least likely
+                # to have been dropped by the server
+                return self._idle.pop()
+            if self._size < self.max_size:
+                self._size += 1
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolExhausted(
+                    f'No database connection available within '
+                    f'{self.timeout} seconds ({self.max_size} in use)'
+                )
+            self._lock.wait(remaining)
+
+    def _open(self):
+        """Open a connection whose room has been reserved"""
+        try:
+            return self.connect()
+        except Exception:
+            self._release()
+            raise
+
+    def _healthy(self, connection, returned_at):
+        """Return whether an idle connection can be handed out"""
+        if getattr(connection, 'closed', False):
+            return False
+        if time.monotonic() - returned_at < self.check_idle:
+            return True
+        return self.is_usable(connection)
+
+    def _reusable(self, connection):
+        """Clean up a returned connection, return whether it can be reused"""
+        if getattr(connection, 'closed', False):
+            return False
+        try:
+            return self.reset(connection)
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        """Close a connection and free its room"""
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self._release()
+
+    def _release(self):
+        """Free the room of a connection and wake up a waiting checkout"""
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
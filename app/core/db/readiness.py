@@ -0,0 +1,38 @@
+import time
+
+from django.db import connections
+from django.db.utils import OperationalError
+
+
+def wait_for_database(alias='default', interval=1, timeout=None, log=None):
+    """Block until a database accepts connections
+
+    `log` is called with a message before every retry. Raises
+    OperationalError once `timeout` seconds passed without a connection.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        connection = connections[alias]
+        try:
+            connection.ensure_connection()
+            break
+        except OperationalError:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise
+            if log is not None:
+                log(f'Database unavailable, waiting {interval} second')
+            time.sleep(interval)
+    # Hand the connection back, to the pool if there is one
+    connection.close()
+
+
+def warm_database(alias='default'):
+    """Open the pooled connections of a database, return how many
+
+    Only worth it in a process that goes on to serve requests, the pool
+    dies with the process.
+    """
+    connection = connections[alias]
+    if not hasattr(connection, 'warm_pool'):
+        return 0
+    return connection.warm_pool()
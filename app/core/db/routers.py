@@ -0,0 +1,102 @@
+import random
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_CACHE_KEY = 'replica-pin:{user_id}'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """Route the reads of the enclosed code to the replicas"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pin_to_primary(user):
+    """Read the data of a user from the primary for a while after a write
+
+    Replicas lag behind the primary, so without this a user might not
+    see their own changes.
+    """
+    caches[settings.REPLICA_PIN_CACHE].set(
+        PIN_CACHE_KEY.format(user_id=user.pk),
+        True,
+        settings.REPLICA_STICKY_SECONDS
+    )
+
+
+def is_pinned_to_primary(user):
+    """Return whether a user wrote recently"""
+    return caches[settings.REPLICA_PIN_CACHE].get(
+        PIN_CACHE_KEY.format(user_id=user.pk), False
+    )
+
+
+class ReplicaRouter:
+    """Send reads to a random replica where allowed, all else to default
+
+    Reads only go to the replicas inside `replica_reads`, so code that
+    reads what it just wrote, like management commands and signals,
+    keeps using the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every database holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema from the primary
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaReadMixin:
+    """Serve safe requests from the replicas unless the user wrote lately
+
+    Authentication still reads from the primary, so fresh tokens work.
+    A successful write pins the user to the primary for
+    REPLICA_STICKY_SECONDS.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with ExitStack() as self._routing:
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        """Switch to the replicas once the user is known"""
+        super().initial(request, *args, **kwargs)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and not is_pinned_to_primary(request.user)
+        ):
+            self._routing.enter_context(replica_reads())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Pin the user to the primary after a successful write"""
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2 with the cost of the ARGON2_* settings
+
+    Stored hashes made with another cost are rehashed on the next login.
+    """
+
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.ARGON2_PARALLELISM
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2 with the PBKDF2_ITERATIONS setting as iteration count"""
+
+    @property
+    def iterations(self):
+        return settings.PBKDF2_ITERATIONS
@@ -0,0 +1,159 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Recipe, RecipeImageRendition
+
+logger = logging.getLogger(__name__)
+
+FILE_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+_executor = None
+
+
+def _get_executor():
+    """Return the worker pool of the web process, creating it lazily"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS,
+            thread_name_prefix='recipe-images'
+        )
+    return _executor
+
+
+def _run_in_worker(recipe_id):
+    """Process an image in a pool thread with its own db connection"""
+    try:
+        process_recipe_image(recipe_id)
+    finally:
+        connection.close()
+
+
+def enqueue_image_processing(recipe_id):
+    """Hand a freshly uploaded recipe image over to processing
+
+    Depending on IMAGE_PROCESSING_MODE the image is processed right away
+    ('sync'), by the thread pool of this process once the upload is
+    committed ('thread') or left pending for manage.py process_images
+    ('queue').
+    """
+    mode = settings.IMAGE_PROCESSING_MODE
+    if mode == 'sync':
+        process_recipe_image(recipe_id)
+    elif mode == 'thread':
+        transaction.on_commit(
+            lambda: _get_executor().submit(_run_in_worker, recipe_id)
+        )
+
+
+def _set_status(recipe_id, image_status):
+    """Update the image status without touching the other columns"""
+    Recipe.objects.filter(pk=recipe_id).update(
+        image_status=image_status,
+        updated_at=timezone.now()
+    )
+
+
+def _rendition_formats():
+    """Return the configured formats the installed Pillow can encode"""
+    return [
+        image_format for image_format in settings.IMAGE_RENDITION_FORMATS
+        if image_format != 'WEBP' or features.check('webp')
+    ]
+
+
+def _decode(file, max_size):
+    """Decode an image once, upright and without metadata"""
+    image = Image.open(file)
+    # Let the JPEG decoder scale down while decoding
+    image.draft('RGB', (max_size, max_size))
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGB')
+    image.info = {}
+
+    return image
+
+
+def render_image(file):
+    """Return (name, format, width, height, bytes) for every rendition"""
+    sizes = sorted(
+        settings.IMAGE_RENDITION_SIZES.items(),
+        key=lambda item: item[1],
+        reverse=True
+    )
+    image = _decode(file, sizes[0][1])
+
+    renditions = []
+    for name, size in sizes:
+        # Every size is scaled down from the previous, larger one
+        image = image.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        for image_format in _rendition_formats():
+            buffer = io.BytesIO()
+            image.save(
+                buffer,
+                format=image_format,
+                quality=settings.IMAGE_RENDITION_QUALITY
+            )
+            renditions.append(
+                (name, image_format, image.width, image.height,
+                 buffer.getvalue())
+            )
+
+    return renditions
+
+
+def discard_renditions(recipe):
+    """Remove the renditions of a recipe together with their files"""
+    renditions = list(recipe.renditions.all())
+    RecipeImageRendition.objects.filter(recipe=recipe).delete()
+    for rendition in renditions:
+        rendition.image.delete(save=False)
+
+
+def process_recipe_image(recipe_id):
+    """Generate the renditions of a recipe image"""
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+
+    _set_status(recipe_id, Recipe.IMAGE_PROCESSING)
+    renditions = []
+    try:
+        with recipe.image.open('rb') as file:
+            rendered = render_image(file)
+
+        for name, image_format, width, height, content in rendered:
+            rendition = RecipeImageRendition(
+                recipe=recipe,
+                name=name,
+                format=image_format,
+                width=width,
+                height=height
+            )
+            rendition.image.save(
+                f'{name}.{FILE_EXTENSIONS[image_format]}',
+                ContentFile(content),
+                save=False
+            )
+            renditions.append(rendition)
+    except Exception:
+        logger.exception('Processing the image of recipe %s failed',
+                         recipe_id)
+        for rendition in renditions:
+            rendition.image.delete(save=False)
+        _set_status(recipe_id, Recipe.IMAGE_FAILED)
+        return
+
+    with transaction.atomic():
+        discard_renditions(recipe)
+        RecipeImageRendition.objects.bulk_create(renditions)
+        _set_status(recipe_id, Recipe.IMAGE_READY)
@@ -0,0 +1,129 @@
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from core.imports import FORMATS, import_recipes
+from core.models import User
+
+# Errors reported per worker, the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+def summarize(importer):
+    """Return the imported rows, the first errors and the skipped rows"""
+    return importer.imported, importer.errors[:MAX_REPORTED_ERRORS], \
+        importer.skipped
+
+
+def _import_partition(path, format, partition, options):
+    """Import one partition of a file in a worker process"""
+    try:
+        with open(path, newline='') as stream:
+            return summarize(
+                import_recipes(stream, format, partition, **options)
+            )
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    """Django command importing recipes with their tags and ingredients
+
+    Rows are read one at a time from NDJSON or CSV, in the format of the
+    recipe export plus an optional `user` email, and written in batches.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, - for stdin')
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Input format, by default csv for .csv files else ndjson'
+        )
+        parser.add_argument(
+            '--user',
+            help='Email of the user owning rows without a user'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes importing in parallel, each the rows of a '
+                 'share of the users'
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_false',
+            dest='use_copy',
+            help='Insert the links with INSERT instead of COPY on PostgreSQL'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or (
+            'csv' if path.lower().endswith('.csv') else 'ndjson'
+        )
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('At least one row and worker is required')
+        if options['workers'] > 1 and path == '-':
+            raise CommandError('Parallel workers need a file to read')
+        if options['workers'] > 1 and connection.vendor == 'sqlite':
+            raise CommandError('SQLite does not allow parallel writers')
+        if options['user'] and not User.objects.filter(
+            email=User.objects.normalize_email(options['user'])
+        ).exists():
+            raise CommandError(f'User "{options["user"]}" does not exist')
+
+        import_options = {
+            'default_user': options['user'],
+            'batch_size': options['batch_size'],
+            'use_copy': options['use_copy'],
+        }
+        start = time.perf_counter()
+        if path == '-':
+            results = [summarize(
+                import_recipes(sys.stdin, format, **import_options)
+            )]
+        elif options['workers'] == 1:
+            with open(path, newline='') as stream:
+                results = [summarize(
+                    import_recipes(stream, format, **import_options)
+                )]
+        else:
+            results = self.import_in_parallel(
+                path, format, options['workers'], import_options
+            )
+        elapsed = max(time.perf_counter() - start, 1e-6)
+
+        imported = sum(result[0] for result in results)
+        failed = sum(result[2] for result in results)
+        for result in results:
+            for error in result[1]:
+                self.stderr.write(error)
+        if failed:
+            self.stderr.write(f'Skipped {failed} rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes in {elapsed:.1f} s, '
+            f'{imported / elapsed:.0f} rows/s'
+        ))
+
+    def import_in_parallel(self, path, format, workers, options):
+        """Import the partitions of the users in forked worker processes"""
+        # Forked workers must not share the connections of this process
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('fork')
+        ) as executor:
+            return list(executor.map(
+                _import_partition,
+                [path] * workers,
+                [format] * workers,
+                [(index, workers) for index in range(workers)],
+                [options] * workers
+            ))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Tag, Ingredient
+from core.names import duplicate_groups, merge_duplicates
+
+
+class Command(BaseCommand):
+    """Django command merging tags and ingredients of duplicate names
+
+    Names a user has more than once after normalization are merged into
+    the oldest object, rewriting the recipe links chunk by chunk. This
+    runs online before the unique normalized name index is added.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Duplicated names merged per transaction'
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report how many names are duplicated'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('At least one name is merged per chunk')
+
+        total = 0
+        for model in (Tag, Ingredient):
+            name = model._meta.verbose_name_plural
+            if options['verify']:
+                count = duplicate_groups(model).count()
+                self.stdout.write(f'{name}: {count} duplicated names')
+            else:
+                count = merge_duplicates(model, options['chunk_size'])
+                self.stdout.write(f'{name}: {count} duplicates merged')
+            total += count
+
+        if options['verify']:
+            if total:
+                raise CommandError(f'{total} names are duplicated')
+            self.stdout.write(self.style.SUCCESS('No duplicated names'))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'Merged {total} duplicates')
+            )
@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.images import process_recipe_image
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """Django command processing the queue of uploaded recipe images"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no image is pending instead of polling'
+        )
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help='Seconds to wait before polling an empty queue again'
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=float,
+            default=600,
+            help='Seconds after which an image still processing is assumed '
+                 'abandoned by a crashed worker and processed again'
+        )
+
+    def claim_pending(self, batch_size):
+        """Mark a batch of pending images as processing and return it
+
+        Rows locked by other workers are skipped, so several workers can
+        share the queue.
+        """
+        with transaction.atomic():
+            recipe_ids = list(
+                Recipe.objects
+                .filter(image_status=Recipe.IMAGE_PENDING)
+                .select_for_update(skip_locked=True)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            # Restarts the stale period, update() skips auto_now
+            Recipe.objects.filter(id__in=recipe_ids).update(
+                image_status=Recipe.IMAGE_PROCESSING,
+                updated_at=timezone.now()
+            )
+        return recipe_ids
+
+    def reclaim_stale(self, stale_after):
+        """Return abandoned images to the queue, return how many
+
+        Processing sets the status along with updated_at, so images still
+        processing long after that belong to a worker that died.
+        """
+        return Recipe.objects.filter(
+            image_status=Recipe.IMAGE_PROCESSING,
+            updated_at__lt=timezone.now() - timedelta(seconds=stale_after)
+        ).update(image_status=Recipe.IMAGE_PENDING)
+
+    def handle(self, *args, **options):
+        self.stdout.write('Processing recipe images')
+        processed = 0
+        reclaimed_at = None
+        while True:
+            # Scans for processing images, so only once per stale period
+            now = time.monotonic()
+            if reclaimed_at is None or \
+                    now - reclaimed_at >= options['stale_after']:
+                reclaimed = self.reclaim_stale(options['stale_after'])
+                reclaimed_at = now
+                if reclaimed:
+                    self.stdout.write(
+                        f'Reclaimed {reclaimed} abandoned images'
+                    )
+
+            recipe_ids = self.claim_pending(options['batch_size'])
+            for recipe_id in recipe_ids:
+                process_recipe_image(recipe_id)
+            processed += len(recipe_ids)
+
+            if not recipe_ids:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Processed {processed} images')
+        )
@@ -0,0 +1,86 @@
+from functools import reduce
+from operator import and_
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.core.management.base import BaseCommand, CommandError
+
+from core.counters import linked_recipe_count, owned_count
+from core.models import User, Tag, Ingredient, Recipe
+
+
+class Command(BaseCommand):
+    """Django command recounting the denormalized usage counters
+
+    The counters are maintained by signals, this repairs drift, e.g.
+    after writes that bypassed the ORM.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report counters which are out of date'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def counters(self):
+        """Return the counted models with their counters' expressions"""
+        return (
+            (Tag, {'recipe_count': linked_recipe_count(Tag)}),
+            (Ingredient, {'recipe_count': linked_recipe_count(Ingredient)}),
+            (User, {
+                'recipe_count': owned_count(Recipe),
+                'tag_count': owned_count(Tag),
+                'ingredient_count': owned_count(Ingredient),
+            }),
+        )
+
+    def sync(self, model, counters, batch_size, verify):
+        """Count the stale rows batch by batch, fixing them unless verifying"""
+        actual = {f'actual_{field}': expr for field, expr in counters.items()}
+        up_to_date = reduce(and_, (
+            Q(**{field: F(f'actual_{field}')}) for field in counters
+        ))
+        stale = 0
+        last_pk = None
+        while True:
+            batch = model.objects.order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            pks = list(batch.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+
+            stale_pks = list(
+                model.objects.filter(pk__in=pks)
+                .annotate(**actual)
+                .exclude(up_to_date)
+                .values_list('pk', flat=True)
+            )
+            stale += len(stale_pks)
+            if stale_pks and not verify:
+                with transaction.atomic():
+                    model.objects.filter(pk__in=stale_pks).update(**counters)
+        return stale
+
+    def handle(self, *args, **options):
+        stale = 0
+        for model, counters in self.counters():
+            model_stale = self.sync(
+                model, counters, options['batch_size'], options['verify']
+            )
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {model_stale} stale'
+            )
+            stale += model_stale
+
+        if options['verify']:
+            if stale:
+                raise CommandError(f'{stale} rows have stale counters')
+            self.stdout.write(self.style.SUCCESS('All counters up to date'))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'Rebuilt the counters of {stale} rows')
+            )
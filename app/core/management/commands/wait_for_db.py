@@ -1,20 +1,26 @@
-import time
-
-from django.db import connections
+from django.core.management.base import BaseCommand, CommandError
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+
+from core.db.readiness import wait_for_database
 
 
 class Command(BaseCommand):
     """Djange command to pause execution until database is available"""
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            help='Give up after this many seconds'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write('Wait until Database is a availble')
-        db_connection = None
-        while not db_connection:
-            try:
-                db_connection = connections['default'].cursor()
-            except OperationalError:
-                self.stdout.write("Database unavailable, waiting 1 second")
-                time.sleep(1)
+        try:
+            wait_for_database(
+                timeout=options['timeout'],
+                log=self.stdout.write
+            )
+        except OperationalError as error:
+            raise CommandError(f'Database unavailable: {error}')
         self.stdout.write(self.style.SUCCESS('Database available!'))
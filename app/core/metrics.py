@@ -0,0 +1,334 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Upper bounds of the request duration histogram in seconds
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Registry attributes holding a summary per view
+SUMMARIES = ('sizes', 'queries', 'db_times', 'serializer_times')
+# Snapshot of the processes that exited, in a METRICS_DIR
+ARCHIVE = 'archive.json'
+
+# A context variable follows the request into threads run by asgiref
+_current = ContextVar('metrics_profile', default=None)
+
+
+class RequestProfile:
+    """Measurements of a sampled request while it is being handled"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Time a query, installed as a database execute wrapper"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+def current_profile():
+    """Return the profile of the sampled request being handled, if any"""
+    return _current.get()
+
+
+def profile_query(execute, sql, params, many, context):
+    """Record a query for the current profile, if any
+
+    Installed on every database connection, of whichever thread runs the
+    view, since the profile follows the request there.
+    """
+    profile = current_profile()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def install_query_profiler(connection, **kwargs):
+    """Add profile_query to a new database connection"""
+    if profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_query)
+
+
+@contextmanager
+def profiling(profile):
+    """Make a profile the current one for the block"""
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def serializer_timer():
+    """Add the time spent in the block to the current serializer time"""
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.serializer_time += time.perf_counter() - start
+
+
+class Histogram:
+    """Cumulative bucket counts with their count and sum"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Record a value"""
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Summary:
+    """Count and sum of the observed values"""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Record a value"""
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    """In-process metrics of the handled requests by view
+
+    Every request is counted with its duration and response size, only
+    sampled requests are profiled for their queries and serializer time.
+    With a METRICS_DIR, the observations are written there at most every
+    METRICS_FLUSH_INTERVAL seconds, for the process answering a scrape
+    to export those of all processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_flush = 0.0
+        self.reset()
+
+    def reset(self):
+        """Forget every observation"""
+        with self._lock:
+            self.durations = {}
+            self.sizes = {}
+            self.queries = {}
+            self.db_times = {}
+            self.serializer_times = {}
+
+    def observe(self, view, method, status_code, duration, size,
+                profile=None):
+        """Record a handled request"""
+        labels = (view, method, str(status_code))
+        with self._lock:
+            self.durations.setdefault(
+                labels, Histogram(DURATION_BUCKETS)
+            ).observe(duration)
+            self.sizes.setdefault(view, Summary()).observe(size)
+            if profile is not None:
+                self.queries.setdefault(view, Summary()).observe(
+                    profile.queries
+                )
+                self.db_times.setdefault(view, Summary()).observe(
+                    profile.db_time
+                )
+                self.serializer_times.setdefault(view, Summary()).observe(
+                    profile.serializer_time
+                )
+        if settings.METRICS_DIR and time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def snapshot(self):
+        """Return the observations as JSON serializable data"""
+        with self._lock:
+            return {
+                'durations': [
+                    [list(labels), histogram.counts, histogram.count,
+                     histogram.sum]
+                    for labels, histogram in self.durations.items()
+                ],
+                'summaries': {
+                    name: [
+                        [view, summary.count, summary.sum]
+                        for view, summary in getattr(self, name).items()
+                    ]
+                    for name in SUMMARIES
+                },
+            }
+
+    def merge(self, snapshot):
+        """Add the observations of a snapshot to this registry"""
+        with self._lock:
+            for labels, counts, count, total in snapshot['durations']:
+                histogram = self.durations.setdefault(
+                    tuple(labels), Histogram(DURATION_BUCKETS)
+                )
+                histogram.counts = [
+                    own + other
+                    for own, other in zip(histogram.counts, counts)
+                ]
+                histogram.count += count
+                histogram.sum += total
+            for name in SUMMARIES:
+                summaries = getattr(self, name)
+                for view, count, total in snapshot['summaries'][name]:
+                    summary = summaries.setdefault(view, Summary())
+                    summary.count += count
+                    summary.sum += total
+
+    def flush(self):
+        """Write the observations of this process to the METRICS_DIR"""
+        self._next_flush = time.monotonic() + settings.METRICS_FLUSH_INTERVAL
+        _write(
+            process_path(settings.METRICS_DIR, os.getpid()),
+            self.snapshot()
+        )
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP http_request_duration_seconds '
+                'Wall time of handling a request.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for (view, method, status_code), histogram in sorted(
+                    self.durations.items()):
+                labels = _labels(
+                    view=view, method=method, status=status_code
+                )
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(
+                        'http_request_duration_seconds_bucket{%s,le="%s"} %d'
+                        % (labels, bound, count)
+                    )
+                lines += [
+                    'http_request_duration_seconds_bucket{%s,le="+Inf"} %d'
+                    % (labels, histogram.count),
+                    'http_request_duration_seconds_count{%s} %d'
+                    % (labels, histogram.count),
+                    'http_request_duration_seconds_sum{%s} %r'
+                    % (labels, histogram.sum),
+                ]
+            for name, help_text, summaries in (
+                ('http_response_size_bytes',
+                 'Size of the response body.', self.sizes),
+                ('db_queries_per_request',
+                 'Database queries of a sampled request.', self.queries),
+                ('db_duration_seconds',
+                 'Database time of a sampled request.', self.db_times),
+                ('serializer_duration_seconds',
+                 'Serializer time of a sampled request.',
+                 self.serializer_times),
+            ):
+                lines += [
+                    f'# HELP {name} {help_text}',
+                    f'# TYPE {name} summary',
+                ]
+                for view, summary in sorted(summaries.items()):
+                    labels = _labels(view=view)
+                    lines += [
+                        '%s_count{%s} %d' % (name, labels, summary.count),
+                        '%s_sum{%s} %r' % (name, labels, summary.sum),
+                    ]
+        return '\n'.join(lines) + '\n'
+
+
+def process_path(directory, pid):
+    """Return the path of the snapshot of a process in a metrics dir"""
+    return os.path.join(directory, f'{pid}.json')
+
+
+def _write(path, snapshot):
+    """Replace a snapshot file at once, scrapes never see it half written"""
+    partial = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(partial, 'w') as output:
+        json.dump(snapshot, output)
+    os.replace(partial, path)
+
+
+def _read(path):
+    """Return the snapshot stored in a file, None if it is gone"""
+    try:
+        with open(path) as snapshot:
+            return json.load(snapshot)
+    except FileNotFoundError:
+        return None
+
+
+def collect():
+    """Return the registry with the observations of all processes
+
+    Without a METRICS_DIR, that is the registry of this process.
+    """
+    if not settings.METRICS_DIR:
+        return registry
+    registry.flush()
+    merged = Registry()
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+        snapshot = _read(path)
+        if snapshot is not None:
+            merged.merge(snapshot)
+    return merged
+
+
+def archive_process(directory, pid):
+    """Fold the snapshot of an exited process into the archive
+
+    Keeps the counters of all processes growing while the files of the
+    exited ones are removed. Only the gunicorn master calls this, so the
+    archive has a single writer.
+    """
+    path = process_path(directory, pid)
+    snapshot = _read(path)
+    if snapshot is None:
+        return
+    archive_path = os.path.join(directory, ARCHIVE)
+    archive = Registry()
+    for data in (_read(archive_path), snapshot):
+        if data is not None:
+            archive.merge(data)
+    _write(archive_path, archive.snapshot())
+    os.remove(path)
+
+
+def _labels(**labels):
+    """Return escaped Prometheus label pairs"""
+    return ','.join(
+        '%s="%s"' % (
+            name,
+            str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n')
+        )
+        for name, value in labels.items()
+    )
+
+
+registry = Registry()
@@ -0,0 +1,145 @@
+import asyncio
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+
+from core import metrics
+
+
+def view_name(view_func, method):
+    """Return the metrics label of a view, e.g. RecipeViewSet.list"""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        handler = actions.get(method.lower(), method.lower())
+    else:
+        handler = method.lower()
+    return f'{cls.__name__}.{handler}'
+
+
+def server_timing(duration, profile=None):
+    """Return the Server-Timing header of a request in milliseconds"""
+    entries = [f'app;dur={duration * 1000:.1f}']
+    if profile is not None:
+        entries += [
+            f'db;dur={profile.db_time * 1000:.1f};'
+            f'desc="{profile.queries} queries"',
+            f'serialize;dur={profile.serializer_time * 1000:.1f}',
+        ]
+    return ', '.join(entries)
+
+
+class HybridMiddleware:
+    """Middleware running natively under both WSGI and ASGI
+
+    Django adapts sync-only middleware under ASGI by running it in the one
+    thread shared by all sync code, which serializes the requests.
+    Subclasses implement handle for sync and __acall__ for async
+    handlers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Lets the middleware wrapping this one see it is async
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+class PerformanceMiddleware(HybridMiddleware):
+    """Record the wall time and response size of every request by view
+
+    A METRICS_SAMPLE_RATE fraction of the requests is profiled as well,
+    counting and timing their database queries and serializers. The
+    results are exported by the metrics view and as Server-Timing header.
+    """
+
+    def handle(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        profile = self.start(request)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            if profile is not None:
+                stack.enter_context(metrics.profiling(profile))
+            response = self.get_response(request)
+        return self.finish(request, response, start, profile)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        profile = self.start(request)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            if profile is not None:
+                stack.enter_context(metrics.profiling(profile))
+            response = await self.get_response(request)
+        return self.finish(request, response, start, profile)
+
+    def start(self, request):
+        """Return the profile of a request if it is sampled"""
+        if random.random() < settings.METRICS_SAMPLE_RATE:
+            return metrics.RequestProfile()
+        return None
+
+    def finish(self, request, response, start, profile):
+        """Record a handled request and add its Server-Timing header"""
+        duration = time.perf_counter() - start
+        if response.streaming:
+            size = 0
+        else:
+            size = len(response.content)
+        # Resolved by the handler, a process_view hook would be adapted
+        # into the one thread shared by sync code under ASGI
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            view = 'unresolved'
+        else:
+            view = view_name(match.func, request.method)
+        metrics.registry.observe(
+            view,
+            request.method,
+            response.status_code,
+            duration,
+            size,
+            profile
+        )
+        response['Server-Timing'] = server_timing(duration, profile)
+        return response
+
+
+class RateLimitHeadersMiddleware(HybridMiddleware):
+    """Report the remaining quota of the throttled API requests
+
+    The throttles record the tightest quota of a request, which is sent
+    as X-RateLimit-Limit and X-RateLimit-Remaining headers. Throttled
+    responses carry a Retry-After header as well.
+    """
+
+    def handle(self, request):
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    def add_headers(self, request, response):
+        """Add the quota recorded by the throttles to a response"""
+        quota = getattr(request, 'rate_limit', None)
+        if quota is not None:
+            response['X-RateLimit-Limit'] = quota[0]
+            response['X-RateLimit-Remaining'] = quota[1]
+        return response
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:32
+
+import core.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImageRendition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32)),
+                ('format', models.CharField(max_length=8)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('image', models.ImageField(upload_to=core.models.recipe_rendition_file_path)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('image_status', 'pending')), fields=['id'], name='recipe_image_pending_idx'),
+        ),
+        migrations.AddField(
+            model_name='recipeimagerendition',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='core.recipe'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImageUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveIntegerField()),
+                ('offset', models.PositiveIntegerField(default=0)),
+                ('image_format', models.CharField(blank=True, max_length=8)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_uploads', to='core.recipe')),
+            ],
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:39
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+# Recipes whose search vectors are filled per UPDATE
+BATCH_SIZE = 1000
+
+# The weighted vector of core.search as of this migration: titles weigh
+# most, followed by tag and then ingredient names. Copied, since the
+# migration must keep working whatever core.search becomes.
+FILL_SEARCH_VECTORS = '''
+UPDATE core_recipe SET search_vector =
+    setweight(to_tsvector(%(config)s::regconfig, COALESCE(title, '')), 'A')
+    || setweight(to_tsvector(%(config)s::regconfig, COALESCE((
+        SELECT string_agg(tag.name, ' ')
+        FROM core_recipe_tags link
+        JOIN core_tag tag ON tag.id = link.tag_id
+        WHERE link.recipe_id = core_recipe.id
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s::regconfig, COALESCE((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM core_recipe_ingredients link
+        JOIN core_ingredient ingredient ON ingredient.id = link.ingredient_id
+        WHERE link.recipe_id = core_recipe.id
+    ), '')), 'C')
+WHERE id IN (
+    SELECT id FROM core_recipe WHERE id > %(after)s
+    ORDER BY id LIMIT %(limit)s
+)
+RETURNING id
+'''
+
+
+def create_search_index(apps, schema_editor):
+    """Fill the search vectors and create their GIN index on PostgreSQL
+
+    Every batch commits on its own and the index is built concurrently,
+    so writes to the recipes are never blocked for long. Recipes added
+    while the vectors are filled are picked up by the later batches.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    after = 0
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(FILL_SEARCH_VECTORS, {
+                'config': settings.SEARCH_CONFIG,
+                'after': after,
+                'limit': BATCH_SIZE,
+            })
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+            after = max(ids)
+    schema_editor.execute(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS recipe_search_vector_idx '
+        'ON core_recipe USING gin (search_vector);'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX CONCURRENTLY IF EXISTS recipe_search_vector_idx;'
+    )
+
+
+class Migration(migrations.Migration):
+    # The vectors are filled in batches and indexed concurrently
+    atomic = False
+
+    dependencies = [
+        ('core', '0009_recipe_image_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
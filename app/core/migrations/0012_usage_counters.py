@@ -0,0 +1,94 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:47
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def linked_recipe_count(model):
+    """Return a subquery counting the recipes of each tag or ingredient"""
+    field = model._meta.get_field('recipe').field
+    target = f'{field.m2m_reverse_field_name()}_id'
+    counts = (
+        field.remote_field.through.objects
+        .filter(**{target: OuterRef('pk')})
+        .order_by()
+        .values(target)
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def owned_count(owned_model):
+    """Return a subquery counting the objects of a model owned by a user"""
+    counts = (
+        owned_model.objects
+        .filter(user=OuterRef('pk'))
+        .order_by()
+        .values('user')
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    """Count the existing recipes, tags and ingredients"""
+    Tag = apps.get_model('core', 'Tag')
+    Ingredient = apps.get_model('core', 'Ingredient')
+    Recipe = apps.get_model('core', 'Recipe')
+    User = apps.get_model('core', 'User')
+    for model in (Tag, Ingredient):
+        model.objects.update(recipe_count=linked_recipe_count(model))
+    User.objects.update(
+        recipe_count=owned_count(Recipe),
+        tag_count=owned_count(Tag),
+        ingredient_count=owned_count(Ingredient)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_attribute_user_name_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='last_used_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='last_used_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='ingredient_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='tag_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
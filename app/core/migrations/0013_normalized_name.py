@@ -0,0 +1,49 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+def normalize_name(name):
+    """core.names.normalize_name as of this migration"""
+    return ' '.join(name.split()).lower()
+
+
+def fill_normalized_names(apps, schema_editor):
+    """Normalize the names of the existing tags and ingredients"""
+    for model_name in ('Tag', 'Ingredient'):
+        model = apps.get_model('core', model_name)
+        last_pk = 0
+        while True:
+            batch = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk')
+                .only('pk', 'name')[:1000]
+            )
+            if not batch:
+                break
+            for instance in batch:
+                instance.normalized_name = normalize_name(instance.name)
+            model.objects.bulk_update(batch, ['normalized_name'])
+            last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_usage_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='normalized_name',
+            field=models.CharField(default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='normalized_name',
+            field=models.CharField(default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_normalized_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,138 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:12
+
+from django.db import migrations, models, transaction
+from django.db.models import Count, IntegerField, Max, Min, OuterRef, \
+    Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# Duplicate groups merged per transaction
+CHUNK_SIZE = 500
+
+
+def count_of(queryset, key):
+    """Return a subquery counting the rows of a queryset per key"""
+    counts = (
+        queryset.order_by()
+        .values(key)
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Merge what duplicates are left, see merge_duplicate_names
+
+    Running the command beforehand keeps this migration short on large
+    tables. The merge of core.names as of this migration, copied so the
+    migration keeps working whatever that module becomes.
+    """
+    for model_name in ('Tag', 'Ingredient'):
+        model = apps.get_model('core', model_name)
+        while True:
+            groups = list(
+                model.objects
+                .order_by()
+                .values('user_id', 'normalized_name')
+                .annotate(
+                    count=Count('pk'), keep=Min('pk'), used=Max('last_used_at')
+                )
+                .filter(count__gt=1)[:CHUNK_SIZE]
+            )
+            if not groups:
+                break
+            with transaction.atomic():
+                merge_groups(model, groups)
+
+
+def merge_groups(model, groups):
+    """Merge one chunk of duplicate groups into their oldest objects
+
+    Search vectors are left as they are: the merged names only differ
+    in case and whitespace, which the vectors ignore. Cached responses
+    expire on their own.
+    """
+    field = model._meta.get_field('recipe').field
+    through = field.remote_field.through
+    user_model = model._meta.get_field('user').related_model
+    source = f'{field.m2m_field_name()}_id'
+    target = f'{field.m2m_reverse_field_name()}_id'
+
+    keep_ids = {group['keep'] for group in groups}
+    keep_by_name = {
+        (group['user_id'], group['normalized_name']): group['keep']
+        for group in groups
+    }
+    candidates = model.objects.filter(
+        user_id__in={group['user_id'] for group in groups},
+        normalized_name__in={group['normalized_name'] for group in groups}
+    ).exclude(pk__in=keep_ids).values_list('pk', 'user_id', 'normalized_name')
+    keep_of = {
+        pk: keep_by_name[(user_id, name)]
+        for pk, user_id, name in candidates
+        if (user_id, name) in keep_by_name
+    }
+
+    linked = set(
+        through.objects.filter(**{f'{target}__in': keep_ids})
+        .values_list(source, target)
+    )
+    moved = {}
+    dropped = []
+    recipe_ids = set()
+    for pk, recipe_id, duplicate_id in through.objects.filter(
+        **{f'{target}__in': keep_of}
+    ).values_list('pk', source, target).iterator():
+        link = (recipe_id, keep_of[duplicate_id])
+        recipe_ids.add(recipe_id)
+        if link in linked:
+            dropped.append(pk)
+        else:
+            linked.add(link)
+            moved.setdefault(link[1], []).append(pk)
+
+    through.objects.filter(pk__in=dropped).delete()
+    for keep, pks in moved.items():
+        through.objects.filter(pk__in=pks).update(**{target: keep})
+    model.objects.filter(pk__in=keep_of).delete()
+
+    model.objects.filter(pk__in=keep_ids).update(recipe_count=count_of(
+        through.objects.filter(**{target: OuterRef('pk')}), target
+    ))
+    for group in groups:
+        if group['used'] is not None:
+            model.objects.filter(pk=group['keep']).update(
+                last_used_at=group['used']
+            )
+    user_model.objects.filter(
+        pk__in={group['user_id'] for group in groups}
+    ).update(**{
+        f'{model._meta.model_name}_count': count_of(
+            model.objects.filter(user=OuterRef('pk')), 'user'
+        )
+    })
+    field.model.objects.filter(pk__in=recipe_ids).update(
+        updated_at=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+    # Every merged chunk is committed on its own
+    atomic = False
+
+    dependencies = [
+        ('core', '0013_normalized_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'normalized_name'), name='ingredient_user_normalized_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'normalized_name'), name='tag_user_normalized_name_uniq'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from core.db.operations import AddIndexConcurrently, \
+    AlterIndexedFieldConcurrently, RemoveIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # Indexes are built and dropped concurrently on PostgreSQL, the new
+    # ones first so the per user queries always have an index to use
+    atomic = False
+
+    dependencies = [
+        ('core', '0014_unique_normalized_name'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'name', 'id'], name='ingredient_user_name_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='tag',
+            index=models.Index(fields=['user', 'name', 'id'], name='tag_user_name_id_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='ingredient',
+            name='ingredient_user_name_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='tag',
+            name='tag_user_name_idx',
+        ),
+        AlterIndexedFieldConcurrently(
+            model_name='ingredient',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.user'),
+        ),
+        AlterIndexedFieldConcurrently(
+            model_name='recipe',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.user'),
+        ),
+        AlterIndexedFieldConcurrently(
+            model_name='tag',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.user'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:20
+
+from django.db import migrations, models
+
+from core.db.operations import AddIndexConcurrently
+
+
+def create_title_prefix_index(apps, schema_editor):
+    """Create the index of case insensitive title prefixes on PostgreSQL
+
+    Matches the UPPER(title::text) LIKE UPPER(...) of istartswith, other
+    databases cannot use an index for it.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX CONCURRENTLY recipe_user_title_prefix_idx '
+        'ON core_recipe (user_id, UPPER(title::text) text_pattern_ops);'
+    )
+
+
+def drop_title_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX CONCURRENTLY recipe_user_title_prefix_idx;'
+    )
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently on PostgreSQL
+    atomic = False
+
+    dependencies = [
+        ('core', '0015_per_user_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'price', 'id'], name='recipe_user_price_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'time_minutes', 'id'], name='recipe_user_time_idx'),
+        ),
+        migrations.RunPython(
+            create_title_prefix_index, drop_title_prefix_index
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 05:02
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+# The default IMAGE_UPLOAD_EXPIRY as of this migration
+EXPIRY = timedelta(days=1)
+
+
+def expire_after_creation(apps, schema_editor):
+    """Let the uploads already started expire a day after they started"""
+    RecipeImageUpload = apps.get_model('core', 'RecipeImageUpload')
+    RecipeImageUpload.objects.update(expires_at=F('created_at') + EXPIRY)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_recipe_range_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeimageupload',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(expire_after_creation, migrations.RunPython.noop),
+    ]
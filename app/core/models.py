@@ -1,11 +1,26 @@
 import uuid
 import os
+from contextlib import contextmanager
+from contextvars import ContextVar
 
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.signals import post_save, post_delete, pre_delete, \
+    m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, \
     PermissionsMixin
 
+from rest_framework.authtoken.models import Token
+
 from app import settings
+from core.authentication import invalidate_cached_token
+from core.cache import bump_user_version
+from core.counters import adjust_counters, adjust_recipe_counts, \
+    user_counter
+from core.names import normalize_name
+from core.search import search_enabled, search_vector, update_search_vectors
 
 
 def recipe_image_file_path(instance, filename):
@@ -16,6 +31,60 @@ def recipe_image_file_path(instance, filename):
     return os.path.join('uploads/recipe', file_name)
 
 
+def recipe_rendition_file_path(instance, filename):
+    """Generate file path for a resized copy of a recipe image"""
+    file_extension = filename.split('.')[-1]
+    file_name = f'{uuid.uuid4()}-{instance.name}.{file_extension}'
+
+    return os.path.join('uploads/recipe/renditions', file_name)
+
+
+class CounterFieldsMixin:
+    """Leave the counter fields out when saving an existing row
+
+    Counters are only changed by atomic UPDATEs, writing back the values
+    an instance was loaded with would undo concurrent changes.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class NormalizedNameField(models.CharField):
+    """Normalized copy of the name of a tag or ingredient
+
+    Derived whenever the row is written, including by bulk_create, the
+    way auto_now fields are. Unique per user, so the names "Salt" and
+    "salt " cannot both exist.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 255)
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = normalize_name(model_instance.name)
+        setattr(model_instance, self.attname, value)
+        return value
+
+    def deconstruct(self):
+        # Only differs in Python, so migrations keep a plain CharField
+        # and never import this class
+        name, path, args, kwargs = super().deconstruct()
+        return name, 'django.db.models.CharField', args, kwargs
+
+
 class UserManager(BaseUserManager):
 
     def create_user(self, email, password=None, **extra_fields):
@@ -39,38 +108,91 @@ class UserManager(BaseUserManager):
         return user
 
 
-class User(AbstractBaseUser, PermissionsMixin):
+class User(CounterFieldsMixin, AbstractBaseUser, PermissionsMixin):
     """ custom usermodel which requires an email instead of an username """
     email = models.EmailField(max_length=255, unique=True)
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Maintained by signals, see rebuild_counters
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+    tag_count = models.PositiveIntegerField(default=0, editable=False)
+    ingredient_count = models.PositiveIntegerField(default=0, editable=False)
 
+    counter_fields = ('recipe_count', 'tag_count', 'ingredient_count')
     objects = UserManager()
 
     # Overwrite the emailField with the previously created Emailfield
     USERNAME_FIELD = 'email'
 
 
-class Tag(models.Model):
+class Tag(CounterFieldsMixin, models.Model):
     """Tag to be used for a recipe"""
     name = models.CharField(max_length=255)
+    normalized_name = NormalizedNameField()
+    # Indexed as the leading column of the composite indexes
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by signals, see rebuild_counters
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+    last_used_at = models.DateTimeField(null=True, editable=False)
+
+    counter_fields = ('recipe_count', 'last_used_at')
+
+    class Meta:
+        indexes = [
+            # Serves the per user listing ordered by name, then id
+            models.Index(
+                fields=['user', 'name', 'id'],
+                name='tag_user_name_id_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'normalized_name'],
+                name='tag_user_normalized_name_uniq'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(CounterFieldsMixin, models.Model):
     """Ingredients to be used in a recipe"""
     name = models.CharField(max_length=255)
+    normalized_name = NormalizedNameField()
+    # Indexed as the leading column of the composite indexes
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by signals, see rebuild_counters
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+    last_used_at = models.DateTimeField(null=True, editable=False)
+
+    counter_fields = ('recipe_count', 'last_used_at')
+
+    class Meta:
+        indexes = [
+            # Serves the per user listing ordered by name, then id
+            models.Index(
+                fields=['user', 'name', 'id'],
+                name='ingredient_user_name_id_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'normalized_name'],
+                name='ingredient_user_normalized_name_uniq'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -78,10 +200,23 @@ class Ingredient(models.Model):
 
 class Recipe(models.Model):
     """Recipe to be used"""
+    IMAGE_PENDING = 'pending'
+    IMAGE_PROCESSING = 'processing'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = (
+        (IMAGE_PENDING, 'Pending'),
+        (IMAGE_PROCESSING, 'Processing'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Failed'),
+    )
+
     title = models.CharField(max_length=255)
+    # Indexed as the leading column of the composite indexes
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
     time_minutes = models.IntegerField()
     price = models.DecimalField(decimal_places=2, max_digits=5)
@@ -89,6 +224,297 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image_status = models.CharField(
+        max_length=16,
+        choices=IMAGE_STATUS_CHOICES,
+        blank=True
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained on PostgreSQL only, see core.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Serves the per user listing ordered by the newest recipe
+            models.Index(fields=['user', '-id'], name='recipe_user_id_idx'),
+            # Serve the range filters and orderings of the recipe list
+            models.Index(
+                fields=['user', 'price', 'id'],
+                name='recipe_user_price_idx'
+            ),
+            models.Index(
+                fields=['user', 'time_minutes', 'id'],
+                name='recipe_user_time_idx'
+            ),
+            # Serves the image processing queue
+            models.Index(
+                fields=['id'],
+                name='recipe_image_pending_idx',
+                condition=models.Q(image_status='pending')
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class RecipeImageUpload(models.Model):
+    """Resumable upload of a recipe image sent in chunks"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    recipe = models.ForeignKey(
+        'Recipe',
+        on_delete=models.CASCADE,
+        related_name='image_uploads'
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    offset = models.PositiveIntegerField(default=0)
+    # Format read from the image header once enough bytes arrived
+    image_format = models.CharField(max_length=8, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Moved back by every chunk, see IMAGE_UPLOAD_EXPIRY
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+
+class RecipeImageRendition(models.Model):
+    """Resized copy of a recipe image without metadata"""
+    recipe = models.ForeignKey(
+        'Recipe',
+        on_delete=models.CASCADE,
+        related_name='renditions'
+    )
+    name = models.CharField(max_length=32)
+    format = models.CharField(max_length=8)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    image = models.ImageField(upload_to=recipe_rendition_file_path)
+
+    def __str__(self):
+        return f'{self.recipe} ({self.name}, {self.format})'
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def invalidate_user_data(sender, instance, signal, **kwargs):
+    """Invalidate the cached responses of the owner of a changed object"""
+    if signal is post_delete and _bulk_deletion.get():
+        return
+    bump_user_version(instance.user_id)
+
+
+# Set while the deleting code keeps the books of the deleted objects
+_bulk_deletion = ContextVar('bulk_deletion', default=False)
+
+
+@contextmanager
+def bulk_deletion():
+    """Skip the bookkeeping of the delete signals in the enclosed code
+
+    For bulk deletes, which count the deleted objects, touch the recipes
+    of deleted tags and ingredients and invalidate cached responses once
+    per batch instead of once per object.
+    """
+    token = _bulk_deletion.set(True)
+    try:
+        yield
+    finally:
+        _bulk_deletion.reset(token)
+
+
+def touch_recipes(**lookups):
+    """Mark the matching recipes as modified without sending signals
+
+    Their search vectors are rebuilt as well, since the names of their
+    tags or ingredients are part of it.
+    """
+    changes = {'updated_at': timezone.now()}
+    if search_enabled():
+        changes['search_vector'] = search_vector(Recipe)
+    Recipe.objects.filter(**lookups).update(**changes)
+
+
+def _recipe_relation(instance):
+    """Return the recipe field linking to a tag or ingredient"""
+    return 'tags' if isinstance(instance, Tag) else 'ingredients'
+
+
+def _remember_linked_recipes(instance):
+    """Keep the ids of the recipes linked to a tag or ingredient
+
+    The links are gone once the tag or ingredient is deleted or its
+    relation cleared, so they are collected beforehand.
+    """
+    instance._linked_recipe_ids = list(
+        Recipe.objects.filter(
+            **{_recipe_relation(instance): instance}
+        ).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, **kwargs):
+    """Rebuild the search vector of a saved recipe"""
+    update_search_vectors(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def update_search_vectors_of_renamed_attribute(sender, instance, created,
+                                               **kwargs):
+    """Rebuild the search vectors of the recipes of a tag or ingredient"""
+    if not created:
+        update_search_vectors(Recipe.objects.filter(
+            **{_recipe_relation(instance): instance}
+        ))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_recipes_of_deleted_attribute(sender, instance, **kwargs):
+    """Collect the recipes of a tag or ingredient about to be deleted"""
+    if not _bulk_deletion.get():
+        _remember_linked_recipes(instance)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def touch_recipes_of_deleted_attribute(sender, instance, **kwargs):
+    """Mark the recipes of a deleted tag or ingredient as modified
+
+    The rows of the through table are removed by the cascade without
+    sending m2m_changed.
+    """
+    if not _bulk_deletion.get():
+        touch_recipes(pk__in=getattr(instance, '_linked_recipe_ids', []))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_user_recipe_relations(sender, instance, action, reverse,
+                                     pk_set, **kwargs):
+    """Invalidate cached responses when recipe relations change"""
+    if reverse and action == 'pre_clear':
+        _remember_linked_recipes(instance)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        touch_recipes(pk=instance.pk)
+    elif action == 'post_clear':
+        touch_recipes(pk__in=getattr(instance, '_linked_recipe_ids', []))
+    elif pk_set:
+        touch_recipes(pk__in=pk_set)
+
+    bump_user_version(instance.user_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+def count_created_object(sender, instance, created, raw=False, **kwargs):
+    """Count a new recipe, tag or ingredient of a user"""
+    if created and not raw:
+        adjust_counters(
+            User.objects.filter(pk=instance.user_id),
+            **{user_counter(sender): 1}
+        )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def count_deleted_object(sender, instance, **kwargs):
+    """Stop counting a deleted recipe, tag or ingredient of a user"""
+    if _bulk_deletion.get():
+        return
+    adjust_counters(
+        User.objects.filter(pk=instance.user_id),
+        **{user_counter(sender): -1}
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_attributes_of_deleted_recipe(sender, instance, **kwargs):
+    """Collect the tags and ingredients of a recipe about to be deleted"""
+    if _bulk_deletion.get():
+        return
+    instance._linked_attribute_ids = {
+        Tag: list(Recipe.tags.through.objects.filter(
+            recipe_id=instance.pk
+        ).values_list('tag_id', flat=True)),
+        Ingredient: list(Recipe.ingredients.through.objects.filter(
+            recipe_id=instance.pk
+        ).values_list('ingredient_id', flat=True)),
+    }
+
+
+@receiver(post_delete, sender=Recipe)
+def count_attributes_of_deleted_recipe(sender, instance, **kwargs):
+    """Stop counting a deleted recipe for its tags and ingredients
+
+    The rows of the through tables are removed by the cascade without
+    sending m2m_changed.
+    """
+    linked = getattr(instance, '_linked_attribute_ids', {})
+    for model, pks in linked.items():
+        adjust_recipe_counts(model, {pk: -1 for pk in pks})
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_recipe_relations(sender, instance, action, reverse, model, pk_set,
+                           **kwargs):
+    """Keep the recipe counts of linked tags and ingredients up to date
+
+    Removals may name objects that are not linked, so the links actually
+    removed are collected beforehand.
+    """
+    attribute_model = type(instance) if reverse else model
+    attribute_column = f'{attribute_model._meta.model_name}_id'
+    if reverse:
+        column, other_column = attribute_column, 'recipe_id'
+    else:
+        column, other_column = 'recipe_id', attribute_column
+
+    if action in ('pre_remove', 'pre_clear'):
+        links = sender.objects.filter(**{column: instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{f'{other_column}__in': pk_set})
+        instance._unlinked_ids = list(
+            links.values_list(other_column, flat=True)
+        )
+        return
+    if action == 'post_add':
+        delta, pks = 1, pk_set
+    elif action in ('post_remove', 'post_clear'):
+        delta, pks = -1, getattr(instance, '_unlinked_ids', [])
+    else:
+        return
+
+    if reverse:
+        adjust_recipe_counts(attribute_model, {instance.pk: delta * len(pks)})
+    else:
+        adjust_recipe_counts(attribute_model, {pk: delta for pk in pks})
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Stop accepting a deleted token from the authentication cache"""
+    invalidate_cached_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Refresh the cached user of a token once the user changes"""
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+            'key', flat=True):
+        invalidate_cached_token(key)
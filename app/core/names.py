@@ -0,0 +1,176 @@
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Min
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from core.cache import bump_user_version
+from core.counters import linked_recipe_count, owned_count, user_counter
+from core.search import update_search_vectors
+
+# Columns of the unique index the names of a user's objects share
+NAME_CONFLICT_FIELDS = ('user', 'normalized_name')
+
+
+def normalize_name(name):
+    """Return the form of a tag or ingredient name its duplicates share
+
+    Letter case and surrounding or repeated whitespace are ignored.
+    """
+    return ' '.join(name.split()).lower()
+
+
+def upsert_named(model, user, name):
+    """Return the named object of a user, creating it unless it exists
+
+    The object is inserted with INSERT ... ON CONFLICT DO NOTHING against
+    the unique normalized name index, so concurrent calls never fail or
+    create duplicates. A created object sends post_save like save() does.
+    Returns the object and whether it was created.
+    """
+    alias = router.db_for_write(model)
+    connection = connections[alias]
+    instance = model(user=user, name=name)
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    params = [
+        field.get_db_prep_save(field.pre_save(instance, True), connection)
+        for field in fields
+    ]
+    quote = connection.ops.quote_name
+    conflict = [model._meta.get_field(name) for name in NAME_CONFLICT_FIELDS]
+    sql = (
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        f'({", ".join(quote(field.column) for field in fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(fields))}) '
+        f'ON CONFLICT ({", ".join(quote(field.column) for field in conflict)})'
+        f' DO NOTHING RETURNING {quote(model._meta.pk.column)}'
+    )
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+        if row is None:
+            existing = model.objects.using(alias).get(
+                user=user, normalized_name=instance.normalized_name
+            )
+            return existing, False
+
+        instance.pk = row[0]
+        instance._state.adding = False
+        instance._state.db = alias
+        post_save.send(
+            sender=model,
+            instance=instance,
+            created=True,
+            update_fields=None,
+            raw=False,
+            using=alias
+        )
+    return instance, True
+
+
+def duplicate_groups(model):
+    """Return the user and normalized name of every duplicated name
+
+    Each group carries the primary key of the object it is merged into,
+    the oldest one.
+    """
+    return (
+        model.objects
+        .order_by()
+        .values('user_id', 'normalized_name')
+        .annotate(count=Count('pk'), keep=Min('pk'), used=Max('last_used_at'))
+        .filter(count__gt=1)
+    )
+
+
+def merge_duplicates(model, chunk_size=500):
+    """Merge the tags or ingredients of a user sharing a normalized name
+
+    Works on any version of the model, including those of migrations.
+    Every chunk of duplicate groups is one transaction: the recipe links
+    of the duplicates are moved to the oldest object of their group,
+    links the recipe already has are dropped, the duplicates deleted and
+    the counters of the kept objects and their users recounted. Returns
+    the number of deleted duplicates.
+    """
+    field = model._meta.get_field('recipe').field
+    through = field.remote_field.through
+    recipe_model = field.model
+    user_model = model._meta.get_field('user').related_model
+    source = f'{field.m2m_field_name()}_id'
+    target = f'{field.m2m_reverse_field_name()}_id'
+
+    merged = 0
+    while True:
+        groups = list(duplicate_groups(model)[:chunk_size])
+        if not groups:
+            return merged
+        with transaction.atomic():
+            merged += _merge_groups(
+                model, through, source, target, recipe_model, user_model,
+                groups
+            )
+
+
+def _merge_groups(model, through, source, target, recipe_model, user_model,
+                  groups):
+    """Merge one chunk of duplicate groups, return the deleted count"""
+    keep_ids = {group['keep'] for group in groups}
+    keep_by_name = {
+        (group['user_id'], group['normalized_name']): group['keep']
+        for group in groups
+    }
+    candidates = model.objects.filter(
+        user_id__in={group['user_id'] for group in groups},
+        normalized_name__in={group['normalized_name'] for group in groups}
+    ).exclude(pk__in=keep_ids).values_list('pk', 'user_id', 'normalized_name')
+    keep_of = {
+        pk: keep_by_name[(user_id, name)]
+        for pk, user_id, name in candidates
+        if (user_id, name) in keep_by_name
+    }
+
+    linked = set(
+        through.objects.filter(**{f'{target}__in': keep_ids})
+        .values_list(source, target)
+    )
+    moved = {}
+    dropped = []
+    recipe_ids = set()
+    for pk, recipe_id, duplicate_id in through.objects.filter(
+        **{f'{target}__in': keep_of}
+    ).values_list('pk', source, target).iterator():
+        link = (recipe_id, keep_of[duplicate_id])
+        recipe_ids.add(recipe_id)
+        if link in linked:
+            dropped.append(pk)
+        else:
+            linked.add(link)
+            moved.setdefault(link[1], []).append(pk)
+
+    through.objects.filter(pk__in=dropped).delete()
+    for keep, pks in moved.items():
+        through.objects.filter(pk__in=pks).update(**{target: keep})
+    model.objects.filter(pk__in=keep_of).delete()
+
+    # Recounted rather than adjusted, the deletes may have sent signals
+    model.objects.filter(pk__in=keep_ids).update(
+        recipe_count=linked_recipe_count(model)
+    )
+    for group in groups:
+        if group['used'] is not None:
+            model.objects.filter(pk=group['keep']).update(
+                last_used_at=group['used']
+            )
+    user_ids = {group['user_id'] for group in groups}
+    user_model.objects.filter(pk__in=user_ids).update(
+        **{user_counter(model): owned_count(model)}
+    )
+    recipes = recipe_model.objects.filter(pk__in=recipe_ids)
+    recipes.update(updated_at=timezone.now())
+    update_search_vectors(recipes)
+    for user_id in user_ids:
+        bump_user_version(user_id)
+    return len(keep_of)
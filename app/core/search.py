@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+
+
+def search_enabled():
+    """Return whether the database maintains full text search vectors"""
+    return connection.vendor == 'postgresql'
+
+
+def _related_names(recipe_model, relation):
+    """Return a subquery joining the names of a recipe relation"""
+    # Needs psycopg2, which is only required on PostgreSQL
+    from django.contrib.postgres.aggregates import StringAgg
+
+    related_model = recipe_model._meta.get_field(relation).related_model
+    return Subquery(
+        related_model.objects
+        .filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(names=StringAgg('name', delimiter=' '))
+        .values('names')
+    )
+
+
+def search_vector(recipe_model):
+    """Return the weighted search vector expression of recipes
+
+    Titles weigh most, followed by tag and then ingredient names.
+    """
+    config = settings.SEARCH_CONFIG
+    return (
+        SearchVector('title', weight='A', config=config) +
+        SearchVector(
+            _related_names(recipe_model, 'tags'),
+            weight='B',
+            config=config
+        ) +
+        SearchVector(
+            _related_names(recipe_model, 'ingredients'),
+            weight='C',
+            config=config
+        )
+    )
+
+
+def update_search_vectors(recipes):
+    """Recompute the search vectors of a recipe queryset in one UPDATE"""
+    if not search_enabled():
+        return
+    recipes.update(search_vector=search_vector(recipes.model))
@@ -0,0 +1,86 @@
+import json
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from core.asgi import StreamingRouter
+from core.models import Recipe, Tag
+
+EXPORT_URL = reverse('recipe:recipe-export')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class StreamingRouterTests(TransactionTestCase):
+    """Test serving requests through the ASGI application
+
+    The streamed views are served from other threads, whose connections
+    only see committed rows.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'asgi@python.bla',
+            'InSecurePassword123!'
+        )
+        self.token = Token.objects.create(user=self.user).key
+        self.application = StreamingRouter()
+
+    async def get(self, path):
+        """Return the status and body of a GET request"""
+        communicator = ApplicationCommunicator(self.application, {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'query_string': b'',
+            'root_path': '',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Token {self.token}'.encode()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        })
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(timeout=5)
+        body = b''
+        while True:
+            message = await communicator.receive_output(timeout=5)
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        await communicator.wait()
+        return start['status'], body
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_export_streamed(self):
+        """Test that exports read the database while they are streamed"""
+        for number in range(5):
+            Recipe.objects.create(
+                user=self.user, title=f'R{number}', time_minutes=5, price=1
+            )
+
+        status, body = async_to_sync(self.get)(EXPORT_URL)
+
+        self.assertEqual(status, 200)
+        lines = body.splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['title'], 'R0')
+
+    def test_other_views_served_by_asgi_handler(self):
+        """Test that other requests are served by Django's ASGI handler"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        status, body = async_to_sync(self.get)(TAGS_URL)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['results'][0]['name'], 'Vegan')
+        self.assertFalse(self.application.is_streamed(TAGS_URL))
@@ -0,0 +1,120 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import CACHED_USER_FIELDS, \
+    clear_local_token_cache, _shared_key
+from core.checks import check_shared_cache
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the cached token authentication"""
+
+    def setUp(self):
+        cache.clear()
+        clear_local_token_cache()
+        self.user = get_user_model().objects.create_user(
+            email='token@python.bla',
+            password='InSecurePassword123!',
+            name='Token User'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_cached(self):
+        """Test that repeated requests do not query the token"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['email'], self.user.email)
+
+    def test_shared_cache_used_by_other_processes(self):
+        """Test that an empty in-process tier falls back to the cache"""
+        self.client.get(ME_URL)
+        clear_local_token_cache()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_deleted_token_rejected(self):
+        """Test that a deleted token is no longer accepted"""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test that a deactivated user is no longer accepted"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_updated_user_refreshed(self):
+        """Test that updates through the me endpoint are visible"""
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'name': 'New Name'})
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.data['name'], 'New Name')
+
+    def test_password_not_cached(self):
+        """Test that the password hash is left out of the cache"""
+        self.client.get(ME_URL)
+
+        created, field_names, values = cache.get(_shared_key(self.token.key))
+
+        self.assertCountEqual(field_names, CACHED_USER_FIELDS)
+        self.assertNotIn(self.user.password, values)
+
+    def test_update_starts_from_primary(self):
+        """Test that updates do not revert changes the cache predates"""
+        self.client.get(ME_URL)
+        # Changed without signals, the cached user is stale now
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            name='Changed Elsewhere'
+        )
+
+        response = self.client.patch(ME_URL, {'email': 'new@python.bla'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Changed Elsewhere')
+        self.assertEqual(self.user.email, 'new@python.bla')
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    """Test the deployment check of the cache backend"""
+
+    def test_process_local_cache_rejected(self):
+        """Test that deployments need a cache shared by the processes"""
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}):
+            errors = check_shared_cache(None)
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache',
+        }}):
+            self.assertEqual(check_shared_cache(None), [])
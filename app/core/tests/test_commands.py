@@ -1,8 +1,19 @@
-from unittest.mock import patch
+import json
+import os
+import tempfile
+from io import StringIO
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import TestCase
+from django.utils import timezone
+
+from core.imports import import_recipes, RecipeImporter
+from core.models import Ingredient, Recipe, Tag
 
 
 class CommandTests(TestCase):
@@ -11,15 +22,228 @@ class CommandTests(TestCase):
         """Test waiting for db when db is available"""
 
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-            call_command('wait_for_db')
+            gi.return_value = MagicMock()
+            call_command('wait_for_db', stdout=StringIO())
             self.assertEqual(gi.call_count, 1)
+            # The pool would die with the command
+            gi.return_value.warm_pool.assert_not_called()
 
     @patch('time.sleep', return_value=None)
     def test_wait_for_db(self, ts):
         """Test waiting for db"""
 
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command('wait_for_db')
+            broken = MagicMock()
+            broken.ensure_connection.side_effect = OperationalError
+            gi.side_effect = [broken] * 5 + [MagicMock()]
+            call_command('wait_for_db', stdout=StringIO())
             self.assertEqual(gi.call_count, 6)
+
+    @patch('time.sleep', return_value=None)
+    def test_wait_for_db_timeout(self, ts):
+        """Test giving up waiting for db after the timeout"""
+
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.return_value.ensure_connection.side_effect = OperationalError
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=0, stdout=StringIO())
+
+    @patch('core.management.commands.process_images.process_recipe_image')
+    def test_process_images_once(self, process):
+        """Test that pending images are claimed and processed"""
+        user = get_user_model().objects.create_user(
+            'images@python.bla',
+            'InSecurePassword123!'
+        )
+        pending = Recipe.objects.create(
+            user=user,
+            title='Gumbo',
+            time_minutes=5,
+            price=5.0,
+            image_status=Recipe.IMAGE_PENDING
+        )
+        Recipe.objects.create(
+            user=user,
+            title='Grits',
+            time_minutes=5,
+            price=5.0,
+            image_status=Recipe.IMAGE_READY
+        )
+        # Queued long ago, claiming must not leave it looking abandoned
+        Recipe.objects.filter(pk=pending.pk).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+
+        call_command('process_images', once=True, stdout=StringIO())
+
+        process.assert_called_once_with(pending.id)
+        pending.refresh_from_db()
+        self.assertEqual(pending.image_status, Recipe.IMAGE_PROCESSING)
+        self.assertGreater(
+            pending.updated_at, timezone.now() - timedelta(minutes=1)
+        )
+
+    @patch('core.management.commands.process_images.process_recipe_image')
+    def test_process_images_reclaims_abandoned(self, process):
+        """Test that images processing for too long are processed again"""
+        user = get_user_model().objects.create_user(
+            'stale@python.bla',
+            'InSecurePassword123!'
+        )
+        stale = Recipe.objects.create(
+            user=user,
+            title='Gumbo',
+            time_minutes=5,
+            price=5.0,
+            image_status=Recipe.IMAGE_PROCESSING
+        )
+        Recipe.objects.filter(pk=stale.pk).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        Recipe.objects.create(
+            user=user,
+            title='Grits',
+            time_minutes=5,
+            price=5.0,
+            image_status=Recipe.IMAGE_PROCESSING
+        )
+
+        out = StringIO()
+        call_command('process_images', once=True, stdout=out)
+
+        process.assert_called_once_with(stale.id)
+        self.assertIn('Reclaimed 1 abandoned images', out.getvalue())
+
+    def test_rebuild_counters(self):
+        """Test that stale counters are reported and rebuilt"""
+        user = get_user_model().objects.create_user(
+            'counters@python.bla',
+            'InSecurePassword123!'
+        )
+        tag = Tag.objects.create(user=user, name='Cajun')
+        recipe = Recipe.objects.create(
+            user=user,
+            title='Gumbo',
+            time_minutes=5,
+            price=5.0
+        )
+        recipe.tags.add(tag)
+        Tag.objects.update(recipe_count=7)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', verify=True, stdout=StringIO())
+        call_command('rebuild_counters', batch_size=1, stdout=StringIO())
+        call_command('rebuild_counters', verify=True, stdout=StringIO())
+
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+
+    def write_import_file(self, suffix, content):
+        """Write an import file removed after the test"""
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as stream:
+            stream.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_recipes(self):
+        """Test importing recipes, reusing and counting tags and ingredients"""
+        user = get_user_model().objects.create_user(
+            'import@python.bla',
+            'InSecurePassword123!'
+        )
+        Tag.objects.create(user=user, name='Cajun')
+        rows = [
+            {'title': 'Gumbo', 'time_minutes': 60, 'price': '8.50',
+             'tags': ['Cajun', 'Stew'], 'ingredients': ['Okra']},
+            {'title': 'Jambalaya', 'time_minutes': 45, 'price': 9,
+             'tags': ['cajun '], 'ingredients': ['Rice', 'okra']},
+            {'title': '', 'time_minutes': 'soon', 'price': 1},
+        ]
+        path = self.write_import_file(
+            '.ndjson', ''.join(json.dumps(row) + '\n' for row in rows)
+        )
+        err = StringIO()
+
+        call_command(
+            'import_recipes', path, user='import@python.bla', batch_size=1,
+            stdout=StringIO(), stderr=err
+        )
+
+        self.assertIn('line 3', err.getvalue())
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            ['Gumbo', 'Jambalaya']
+        )
+        gumbo = Recipe.objects.get(title='Gumbo')
+        self.assertEqual(
+            sorted(gumbo.tags.values_list('name', flat=True)),
+            ['Cajun', 'Stew']
+        )
+        self.assertEqual(Tag.objects.get(name='Cajun').recipe_count, 2)
+        self.assertEqual(Ingredient.objects.get(name='Okra').recipe_count, 2)
+        user.refresh_from_db()
+        self.assertEqual(
+            (user.recipe_count, user.tag_count, user.ingredient_count),
+            (2, 2, 2)
+        )
+        call_command('rebuild_counters', verify=True, stdout=StringIO())
+
+    def test_import_recipes_failed_batch(self):
+        """Test that a failed batch is reported and its objects forgotten"""
+        user = get_user_model().objects.create_user(
+            'failed@python.bla',
+            'InSecurePassword123!'
+        )
+        path = self.write_import_file('.ndjson', ''.join(
+            json.dumps(row) + '\n' for row in (
+                {'title': 'Gumbo', 'time_minutes': 60, 'price': 8,
+                 'tags': ['Stew']},
+                {'title': 'Chili', 'time_minutes': 30, 'price': 6,
+                 'tags': ['stew']},
+            )
+        ))
+        link = RecipeImporter._link
+        failures = [OperationalError('disk full')]
+
+        def fail_once(importer, *args):
+            if failures:
+                raise failures.pop()
+            return link(importer, *args)
+
+        err = StringIO()
+        with patch.object(RecipeImporter, '_link', fail_once):
+            call_command(
+                'import_recipes', path, user='failed@python.bla',
+                batch_size=1, stdout=StringIO(), stderr=err
+            )
+
+        self.assertIn('lines 1-1: batch not written', err.getvalue())
+        self.assertIn('Skipped 1 rows', err.getvalue())
+        chili = Recipe.objects.get()
+        self.assertEqual(chili.title, 'Chili')
+        self.assertEqual(list(chili.tags.values_list('name', flat=True)),
+                         ['stew'])
+        user.refresh_from_db()
+        self.assertEqual((user.recipe_count, user.tag_count), (1, 1))
+
+    def test_import_recipes_csv_partitioned(self):
+        """Test importing CSV rows of several users by partition"""
+        for email in ('first@python.bla', 'second@python.bla'):
+            get_user_model().objects.create_user(
+                email, 'InSecurePassword123!'
+            )
+        path = self.write_import_file('.csv', (
+            'user,title,time_minutes,price,link,tags,ingredients\n'
+            'first@python.bla,Gumbo,60,8.50,,Cajun; Stew,Okra\n'
+            'second@python.bla,Grits,10,2.00,,,\n'
+        ))
+
+        for index in range(2):
+            with open(path, newline='') as stream:
+                import_recipes(stream, 'csv', partition=(index, 2))
+
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertEqual(
+            Recipe.objects.get(title='Gumbo').tags.count(), 2
+        )
@@ -0,0 +1,140 @@
+import threading
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from core.db.pool import ConnectionPool, PoolExhausted
+
+
+class FakeConnection:
+    """Raw connection standing in for a database connection"""
+
+    def __init__(self):
+        self.closed = False
+        self.usable = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.opened = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def test_returned_connection_reused(self):
+        """Test that a returned connection is handed out again"""
+        pool = ConnectionPool(self.connect, max_size=2)
+
+        connection = pool.checkout()
+        pool.checkin(connection)
+
+        self.assertIs(pool.checkout(), connection)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(pool.size, 1)
+
+    def test_exhausted_pool_times_out(self):
+        """Test that checkouts beyond the maximum size wait and fail"""
+        pool = ConnectionPool(self.connect, max_size=1, timeout=0.01)
+        pool.checkout()
+
+        with self.assertRaises(PoolExhausted):
+            pool.checkout()
+
+    def test_waiting_checkout_gets_returned_connection(self):
+        """Test that a waiting checkout is woken up by a checkin"""
+        pool = ConnectionPool(self.connect, max_size=1, timeout=5)
+        connection = pool.checkout()
+        timer = threading.Timer(0.01, pool.checkin, [connection])
+        timer.start()
+
+        self.assertIs(pool.checkout(), connection)
+        timer.join()
+
+    def test_broken_idle_connection_replaced(self):
+        """Test that an idle connection failing its health check is closed"""
+        pool = ConnectionPool(
+            self.connect,
+            max_size=1,
+            check_idle=0,
+            is_usable=lambda connection: connection.usable
+        )
+        broken = pool.checkout()
+        pool.checkin(broken)
+        broken.usable = False
+
+        connection = pool.checkout()
+
+        self.assertIsNot(connection, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.size, 1)
+
+    def test_recently_returned_connection_not_checked(self):
+        """Test that connections idle for a short time skip the check"""
+        pool = ConnectionPool(
+            self.connect,
+            max_size=1,
+            check_idle=60,
+            is_usable=lambda connection: self.fail('Checked')
+        )
+        connection = pool.checkout()
+        pool.checkin(connection)
+
+        self.assertIs(pool.checkout(), connection)
+
+    def test_discarded_connection_frees_room(self):
+        """Test that discarded and unresettable connections are closed"""
+        pool = ConnectionPool(
+            self.connect,
+            max_size=2,
+            reset=lambda connection: False
+        )
+        first = pool.checkout()
+        second = pool.checkout()
+
+        pool.checkin(first, discard=True)
+        pool.checkin(second)
+
+        self.assertTrue(first.closed and second.closed)
+        self.assertEqual(pool.size, 0)
+
+    def test_failed_connect_frees_room(self):
+        """Test that a connection failing to open does not take room"""
+        pool = ConnectionPool(self.connect, max_size=1)
+
+        with patch.object(self, 'connect', side_effect=OSError):
+            pool.connect = self.connect
+            with self.assertRaises(OSError):
+                pool.checkout()
+
+        self.assertEqual(pool.size, 0)
+
+    def test_warm_opens_minimum(self):
+        """Test warming the pool up to its minimum size"""
+        pool = ConnectionPool(self.connect, max_size=4, min_size=2)
+
+        self.assertEqual(pool.warm(), 2)
+        self.assertEqual(pool.warm(), 0)
+        self.assertEqual(pool.idle, 2)
+
+        pool.close()
+        self.assertEqual(pool.size, 0)
+        self.assertTrue(all(c.closed for c in self.opened))
+
+    def test_failed_warm_keeps_opened(self):
+        """Test that a connection failing to open while warming leaks none"""
+        pool = ConnectionPool(self.connect, max_size=4, min_size=3)
+        opened = FakeConnection()
+
+        with patch.object(self, 'connect', side_effect=[opened, OSError]):
+            pool.connect = self.connect
+            with self.assertRaises(OSError):
+                pool.warm()
+
+        self.assertEqual((pool.size, pool.idle), (1, 1))
+        self.assertIs(pool.checkout(), opened)
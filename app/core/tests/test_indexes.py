@@ -0,0 +1,129 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import filters
+
+# Plan lines of full table scans and of sorts no index provides
+FULL_SCANS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)'),
+}
+SORTS = {
+    'postgresql': re.compile(r'^\s*(->\s*)?(Incremental )?Sort\b', re.M),
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+}
+
+
+class IndexUsageTests(TestCase):
+    """Test that the per user queries are served by index range scans"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            get_user_model().objects.create_user(
+                f'indexes{number}@python.bla',
+                'InSecurePassword123!'
+            )
+            for number in range(3)
+        ]
+        for user in users:
+            tags = [
+                Tag.objects.create(user=user, name=f'tag {number}')
+                for number in range(5)
+            ]
+            ingredients = [
+                Ingredient.objects.create(user=user, name=f'ingredient {n}')
+                for n in range(5)
+            ]
+            for number in range(10):
+                recipe = Recipe.objects.create(
+                    user=user,
+                    title=f'Recipe {number}',
+                    time_minutes=number,
+                    price=number
+                )
+                recipe.tags.add(tags[number % 5])
+                recipe.ingredients.add(*ingredients[:number % 5])
+        cls.user = users[0]
+        cls.tag_ids = [tags[0].pk, tags[1].pk]
+
+    def plan(self, queryset):
+        """Return the plan of a query, avoiding scans and sorts if possible"""
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Small tables are cheaper to scan, only fall back to it
+                # when no index applies
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+        return queryset.explain()
+
+    def assertIndexed(self, queryset, ordered=False):
+        """Assert a query scans no table and, if ordered, sorts nothing"""
+        if connection.vendor not in FULL_SCANS:
+            self.skipTest(f'No plan checks for {connection.vendor}')
+        plan = self.plan(queryset)
+        self.assertIsNone(FULL_SCANS[connection.vendor].search(plan), plan)
+        if ordered:
+            self.assertIsNone(SORTS[connection.vendor].search(plan), plan)
+
+    def test_recipe_list_indexed(self):
+        """Test listing the newest recipes of a user"""
+        self.assertIndexed(
+            Recipe.objects.filter(user=self.user).order_by('-id')[:10],
+            ordered=True
+        )
+
+    def test_attribute_lists_indexed(self):
+        """Test listing tags and ingredients of a user by name"""
+        for model in (Tag, Ingredient):
+            self.assertIndexed(
+                model.objects.filter(user=self.user).order_by('-name', '-id')
+                [:10],
+                ordered=True
+            )
+
+    def test_assigned_attributes_indexed(self):
+        """Test listing the tags of a user assigned to recipes"""
+        self.assertIndexed(
+            filters.filter_assigned(Tag.objects.filter(user=self.user))
+        )
+
+    def test_recipes_by_tags_indexed(self):
+        """Test filtering recipes by any and all of some tags"""
+        for match in filters.MATCH_CHOICES:
+            self.assertIndexed(
+                filters.filter_by_related_ids(
+                    Recipe.objects.filter(user=self.user),
+                    'tags',
+                    self.tag_ids,
+                    match
+                ).order_by('-id')[:10],
+                ordered=True
+            )
+
+    def test_recipe_ranges_indexed(self):
+        """Test filtering and ordering recipes by price and time"""
+        for field in ('price', 'time_minutes'):
+            self.assertIndexed(
+                Recipe.objects.filter(
+                    user=self.user, **{f'{field}__range': (2, 6)}
+                ).order_by(field, 'id')[:10],
+                ordered=True
+            )
+            self.assertIndexed(
+                Recipe.objects.filter(
+                    user=self.user, **{f'{field}__lte': 6}
+                ).order_by(f'-{field}', '-id')[:10],
+                ordered=True
+            )
+
+    def test_name_lookup_indexed(self):
+        """Test looking up a tag by its normalized name"""
+        self.assertIndexed(
+            Tag.objects.filter(user=self.user, normalized_name='tag 1')
+        )
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import AsyncClient, SimpleTestCase, TestCase, \
+    override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.middleware import PerformanceMiddleware, \
+    RateLimitHeadersMiddleware
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+METRICS_URL = reverse('metrics')
+
+
+class PerformanceMiddlewareTests(TestCase):
+    """Test the request metrics"""
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.user = get_user_model().objects.create_user(
+            'metrics@python.bla',
+            'InSecurePassword123!'
+        )
+        Recipe.objects.create(
+            user=self.user,
+            title='Jambalaya',
+            time_minutes=45,
+            price=12.0
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_sampled_request_profiled(self):
+        """Test that sampled requests report queries and serializer time"""
+        response = self.client.get(RECIPES_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="3 queries"', response['Server-Timing'])
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+
+        summary = metrics.registry.queries['RecipeViewSet.list']
+        self.assertEqual((summary.count, summary.sum), (1, 3))
+        self.assertEqual(
+            metrics.registry.serializer_times['RecipeViewSet.list'].count,
+            1
+        )
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_request_timed(self):
+        """Test that requests which are not sampled are only timed"""
+        response = self.client.get(RECIPES_URL)
+
+        self.assertTrue(response['Server-Timing'].startswith('app;dur='))
+        self.assertNotIn('db;dur=', response['Server-Timing'])
+        self.assertNotIn('RecipeViewSet.list', metrics.registry.queries)
+        histogram = metrics.registry.durations[
+            ('RecipeViewSet.list', 'GET', '200')
+        ]
+        self.assertEqual(histogram.count, 1)
+        self.assertEqual(
+            metrics.registry.sizes['RecipeViewSet.list'].sum,
+            len(response.content)
+        )
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    async def test_asgi_request_profiled(self):
+        """Test that requests served under ASGI are profiled as well"""
+        token = await sync_to_async(self.create_token)()
+        # Extra arguments are sent as headers by the async client
+        response = await AsyncClient().get(
+            RECIPES_URL, AUTHORIZATION=f'Token {token}'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The token lookup comes on top of the queries of the view
+        self.assertIn('desc="4 queries"', response['Server-Timing'])
+        self.assertIn('X-RateLimit-Remaining', response)
+        self.assertEqual(
+            metrics.registry.queries['RecipeViewSet.list'].count, 1
+        )
+
+    def create_token(self):
+        """Return the token key of the user"""
+        return Token.objects.create(user=self.user).key
+
+    @override_settings(METRICS_TOKEN='scraper-token')
+    def test_metrics_endpoint(self):
+        """Test that the metrics are exported by view and action"""
+        self.client.get(reverse('recipe:tag-list'))
+
+        response = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer scraper-token'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(
+            'http_request_duration_seconds_count'
+            '{view="TagViewSet.list",method="GET",status="200"} 1',
+            response.content.decode()
+        )
+
+    @override_settings(METRICS_TOKEN='scraper-token')
+    def test_metrics_of_all_processes(self):
+        """Test that the snapshots of other workers are exported as well"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other = metrics.Registry()
+        other.observe('TagViewSet.list', 'GET', 200, 0.01, 10)
+        exited = metrics.Registry()
+        exited.observe('TagViewSet.list', 'GET', 200, 0.01, 10)
+        for pid, registry in ((1, other), (2, exited)):
+            with open(metrics.process_path(directory, pid), 'w') as output:
+                json.dump(registry.snapshot(), output)
+        metrics.archive_process(directory, 2)
+
+        with override_settings(METRICS_DIR=directory):
+            self.client.get(reverse('recipe:tag-list'))
+            response = self.client.get(
+                METRICS_URL, HTTP_AUTHORIZATION='Bearer scraper-token'
+            )
+
+        self.assertIn(
+            'http_request_duration_seconds_count'
+            '{view="TagViewSet.list",method="GET",status="200"} 3',
+            response.content.decode()
+        )
+        self.assertEqual(
+            sorted(os.listdir(directory)),
+            sorted(['1.json', metrics.ARCHIVE, f'{os.getpid()}.json'])
+        )
+
+    @override_settings(METRICS_TOKEN='scraper-token')
+    def test_metrics_token_required(self):
+        """Test that the metrics are only exported to the scraper"""
+        for authorization in ('', 'Bearer wrong-token', 'Token scraper-token'):
+            with self.subTest(authorization=authorization):
+                response = self.client.get(
+                    METRICS_URL, HTTP_AUTHORIZATION=authorization
+                )
+
+                self.assertEqual(
+                    response.status_code, status.HTTP_401_UNAUTHORIZED
+                )
+                self.assertNotIn(b'http_request', response.content)
+
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(
+                self.client.get(METRICS_URL).status_code,
+                status.HTTP_404_NOT_FOUND
+            )
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_metrics_disabled(self):
+        """Test that disabled metrics are neither recorded nor exported"""
+        response = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(
+            self.client.get(METRICS_URL).status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+
+
+class HybridMiddlewareTests(SimpleTestCase):
+    """Test that the middlewares run natively in both handlers"""
+
+    def test_async_get_response(self):
+        """Test that async handlers are awaited without a thread"""
+        async def get_response(request):
+            return HttpResponse()
+
+        for middleware in (PerformanceMiddleware, RateLimitHeadersMiddleware):
+            with self.subTest(middleware=middleware.__name__):
+                instance = middleware(get_response)
+                self.assertTrue(asyncio.iscoroutinefunction(instance))
+
+    def test_sync_get_response(self):
+        """Test that sync handlers are called directly"""
+        def get_response(request):
+            return HttpResponse()
+
+        for middleware in (PerformanceMiddleware, RateLimitHeadersMiddleware):
+            with self.subTest(middleware=middleware.__name__):
+                instance = middleware(get_response)
+                self.assertFalse(asyncio.iscoroutinefunction(instance))
+
+    def test_no_view_hooks(self):
+        """Test that no sync hook is adapted into the shared sync thread"""
+        for middleware in (PerformanceMiddleware, RateLimitHeadersMiddleware):
+            with self.subTest(middleware=middleware.__name__):
+                self.assertFalse(hasattr(middleware, 'process_view'))
@@ -4,6 +4,7 @@ from unittest.mock import patch
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
+from core.cache import get_user_version
 from core.models import Tag, Ingredient, Recipe
 from core import models
 
@@ -93,3 +94,117 @@ class ModeTests(TestCase):
         # Literal String Interpolation
         expected_path = f'uploads/recipe/{uuid}.jpg'
         self.assertEqual(file_path, expected_path)
+
+    def test_recipe_changes_bump_user_version(self):
+        """Test that changing user owned objects bumps the data version"""
+        user = sample_user()
+        version = get_user_version(user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                user=user,
+                title="Gumbo",
+                time_minutes=5,
+                price=5.54,
+            )
+        self.assertGreater(get_user_version(user.id), version)
+
+        version = get_user_version(user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.add(Tag.objects.create(user=user, name="Cajun"))
+        self.assertGreater(get_user_version(user.id), version)
+
+        version = get_user_version(user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertGreater(get_user_version(user.id), version)
+
+    def test_user_version_bumped_on_commit(self):
+        """Test that the version only changes once the change commits"""
+        user = sample_user()
+        version = get_user_version(user.id)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Recipe.objects.create(
+                user=user,
+                title="Gumbo",
+                time_minutes=5,
+                price=5.54,
+            )
+            self.assertEqual(get_user_version(user.id), version)
+        for callback in callbacks:
+            callback()
+
+        self.assertGreater(get_user_version(user.id), version)
+
+    def test_counters_follow_recipe_relations(self):
+        """Test that recipe counts follow links, unlinks and deletes"""
+        user = sample_user()
+        tag1 = Tag.objects.create(user=user, name='Cajun')
+        tag2 = Tag.objects.create(user=user, name='Creole')
+        recipe = Recipe.objects.create(
+            user=user,
+            title='Gumbo',
+            time_minutes=5,
+            price=5.54,
+        )
+
+        recipe.tags.add(tag1, tag2)
+        recipe.tags.remove(tag2, tag2.id + 100)
+        other = Recipe.objects.create(
+            user=user,
+            title='Jambalaya',
+            time_minutes=5,
+            price=5.54,
+        )
+        tag1.recipe_set.add(other)
+
+        tag1.refresh_from_db()
+        tag2.refresh_from_db()
+        self.assertEqual((tag1.recipe_count, tag2.recipe_count), (2, 0))
+        self.assertIsNotNone(tag1.last_used_at)
+
+        recipe.delete()
+        tag1.recipe_set.clear()
+
+        tag1.refresh_from_db()
+        user.refresh_from_db()
+        self.assertEqual(tag1.recipe_count, 0)
+        self.assertEqual((user.recipe_count, user.tag_count), (1, 2))
+
+    def test_counters_do_not_go_negative(self):
+        """Test that deleting with drifted counters floors them at zero"""
+        user = sample_user()
+        tag = Tag.objects.create(user=user, name='Cajun')
+        recipe = Recipe.objects.create(
+            user=user,
+            title='Gumbo',
+            time_minutes=5,
+            price=5.54,
+        )
+        recipe.tags.add(tag)
+        Tag.objects.filter(pk=tag.pk).update(recipe_count=0)
+        get_user_model().objects.filter(pk=user.pk).update(recipe_count=0)
+
+        recipe.delete()
+
+        tag.refresh_from_db()
+        user.refresh_from_db()
+        self.assertEqual((tag.recipe_count, user.recipe_count), (0, 0))
+
+    def test_save_keeps_counters(self):
+        """Test that saving a stale instance does not reset its counters"""
+        user = sample_user()
+        stale = get_user_model().objects.get(pk=user.pk)
+        Recipe.objects.create(
+            user=user,
+            title='Gumbo',
+            time_minutes=5,
+            price=5.54,
+        )
+
+        stale.name = 'Karl'
+        stale.save()
+
+        user.refresh_from_db()
+        self.assertEqual((user.name, user.recipe_count), ('Karl', 1))
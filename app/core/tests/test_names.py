@@ -0,0 +1,120 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, IntegrityError, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from core.models import Tag, Ingredient, Recipe
+from core.names import normalize_name, upsert_named
+
+
+class NormalizeNameTests(SimpleTestCase):
+    """Test the normalized form of tag and ingredient names"""
+
+    def test_normalize_name(self):
+        """Test that case and surplus whitespace are ignored"""
+        self.assertEqual(normalize_name('  Sea   Salt '), 'sea salt')
+        self.assertEqual(normalize_name('SEA\tSALT'), 'sea salt')
+
+
+class UpsertNamedTests(TestCase):
+    """Test inserting tags and ingredients unless they exist"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'names@python.bla',
+            'InSecurePassword123!'
+        )
+
+    def test_normalized_name_unique(self):
+        """Test that a user cannot have two tags of the same name"""
+        Tag.objects.create(user=self.user, name='Salt')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Tag.objects.create(user=self.user, name='salt ')
+
+    def test_upsert_named(self):
+        """Test that upserting creates an object once and counts it"""
+        tag, created = upsert_named(Tag, self.user, 'Sea Salt')
+        self.assertTrue(created)
+        self.assertEqual(tag.normalized_name, 'sea salt')
+
+        existing, created = upsert_named(Tag, self.user, ' sea  SALT')
+        self.assertFalse(created)
+        self.assertEqual(existing.pk, tag.pk)
+        self.assertEqual(existing.name, 'Sea Salt')
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.tag_count, 1)
+
+
+class MergeDuplicateNamesTests(TransactionTestCase):
+    """Test merging the duplicate names left by older versions"""
+
+    def setUp(self):
+        # Duplicates only exist before the unique index is added
+        self.migrate([('core', '0013_normalized_name')])
+        self.addCleanup(self.migrate)
+
+    def migrate(self, targets=None):
+        """Migrate the database to the targets, by default the latest"""
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets or executor.loader.graph.leaf_nodes())
+
+    def test_merge_duplicate_names(self):
+        """Test that duplicates are merged into the oldest object"""
+        user = get_user_model().objects.create_user(
+            'merge@python.bla',
+            'InSecurePassword123!'
+        )
+        salt = Ingredient.objects.create(user=user, name='Salt')
+        duplicates = [
+            Ingredient.objects.create(user=user, name=name)
+            for name in ('salt', ' SALT')
+        ]
+        pepper = Ingredient.objects.create(user=user, name='Pepper')
+        soup = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=2
+        )
+        soup.ingredients.add(salt, *duplicates)
+        stew = Recipe.objects.create(
+            user=user, title='Stew', time_minutes=5, price=2
+        )
+        stew.ingredients.add(duplicates[1], pepper)
+
+        with self.assertRaises(CommandError):
+            call_command(
+                'merge_duplicate_names', verify=True, stdout=StringIO()
+            )
+        call_command('merge_duplicate_names', chunk_size=1, stdout=StringIO())
+        call_command('merge_duplicate_names', verify=True, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('pk', flat=True)),
+            [salt.pk, pepper.pk]
+        )
+        self.assertEqual(list(soup.ingredients.all()), [salt])
+        self.assertCountEqual(stew.ingredients.all(), [salt, pepper])
+        salt.refresh_from_db()
+        self.assertEqual(salt.recipe_count, 2)
+        user.refresh_from_db()
+        self.assertEqual(user.ingredient_count, 2)
+        call_command('rebuild_counters', verify=True, stdout=StringIO())
+
+    def test_migration_merges_duplicate_names(self):
+        """Test that the unique index migration merges what is left"""
+        user = get_user_model().objects.create_user(
+            'migrate@python.bla',
+            'InSecurePassword123!'
+        )
+        vegan = Tag.objects.create(user=user, name='Vegan')
+        Tag.objects.create(user=user, name='VEGAN')
+
+        self.migrate()
+
+        self.assertEqual(list(Tag.objects.all()), [vegan])
+        user.refresh_from_db()
+        self.assertEqual(user.tag_count, 1)
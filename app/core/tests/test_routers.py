@@ -0,0 +1,135 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.db.routers import ReplicaRouter, replica_reads
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+# Alias of a replica mirroring the test database
+MIRROR = 'test_replica'
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Test routing queries between the primary and the replicas"""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_use_primary_by_default(self):
+        """Test that reads outside replica_reads go to the primary"""
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_replica_reads(self):
+        """Test that reads inside replica_reads go to a replica"""
+        with replica_reads():
+            self.assertIn(
+                self.router.db_for_read(Recipe),
+                ['replica_1', 'replica_2']
+            )
+            self.assertEqual(self.router.db_for_write(Recipe), 'default')
+
+    def test_replicas_not_migrated(self):
+        """Test that only the primary is migrated"""
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'core'))
+
+
+# The mirror has connections of its own, which only see committed rows.
+# It is added once the test runner set up and checked the databases, so
+# it needs no entry in DATABASES and is not guarded by `databases`.
+@override_settings(DATABASE_REPLICAS=[MIRROR])
+@patch('core.db.routers.random.choice', side_effect=lambda dbs: dbs[0])
+class ReplicaReadMixinTests(TransactionTestCase):
+    """Test which requests read from the replicas"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Set up already, so this names the test database
+        connections.settings[MIRROR] = {
+            **connections['default'].settings_dict
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[MIRROR].close()
+        del connections[MIRROR]
+        del connections.settings[MIRROR]
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'replica@python.bla',
+            'InSecurePassword123!'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def request(self, method, url, data=None):
+        """Return the response and the queries run on the replica"""
+        with CaptureQueriesContext(connections[MIRROR]) as queries:
+            response = getattr(self.client, method)(url, data)
+        return response, queries
+
+    def test_safe_request_reads_replica(self, choice):
+        """Test that listing recipes reads from a replica"""
+        response, queries = self.request('get', RECIPES_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(choice.called)
+        self.assertTrue(queries)
+
+    def test_write_pins_user_to_primary(self, choice):
+        """Test that reads right after a write use the primary"""
+        response, queries = self.request('post', TAGS_URL, {'name': 'Cajun'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(choice.called)
+        self.assertFalse(queries)
+
+        response, queries = self.request('get', TAGS_URL)
+
+        self.assertEqual(response.data['results'][0]['name'], 'Cajun')
+        self.assertFalse(choice.called)
+        self.assertFalse(queries)
+
+    def test_pin_expires(self, choice):
+        """Test that reads return to the replicas after the sticky window"""
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            self.client.post(TAGS_URL, {'name': 'Cajun'})
+
+        response, queries = self.request('get', TAGS_URL)
+
+        self.assertTrue(choice.called)
+        self.assertEqual(response.data['results'][0]['name'], 'Cajun')
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'pins': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'pins',
+        },
+    }, REPLICA_PIN_CACHE='pins')
+    def test_pin_kept_in_pin_cache(self, choice):
+        """Test that pins are kept in the REPLICA_PIN_CACHE"""
+        self.client.post(TAGS_URL, {'name': 'Cajun'})
+        cache.clear()
+
+        response, queries = self.request('get', TAGS_URL)
+
+        self.assertFalse(choice.called)
+        self.assertFalse(queries)
@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import get_store, take_token
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+
+def throttle_rates(**rates):
+    """Return the REST_FRAMEWORK settings with the given rates only"""
+    return {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}
+
+
+class TokenBucketTests(SimpleTestCase):
+    """Test the token bucket arithmetic"""
+
+    def test_bucket_starts_full(self):
+        """Test that a new bucket allows a burst of the full rate"""
+        bucket, allowed, remaining, wait = take_token(None, 10, 60, 0)
+
+        self.assertTrue(allowed)
+        self.assertEqual(remaining, 9)
+        self.assertEqual(bucket, (9, 0))
+
+    def test_empty_bucket_refills(self):
+        """Test that an empty bucket refills at the rate"""
+        bucket, allowed, remaining, wait = take_token((0, 0), 10, 60, 3)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 3)
+
+        bucket, allowed, remaining, wait = take_token(bucket, 10, 60, 6)
+        self.assertTrue(allowed)
+        self.assertEqual(remaining, 0)
+
+
+class ThrottlingApiTests(TestCase):
+    """Test throttling the API requests"""
+
+    def setUp(self):
+        get_store().clear()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'throttle@python.bla',
+            'InSecurePassword123!'
+        )
+        self.client = APIClient()
+
+    def tearDown(self):
+        get_store().clear()
+
+    def test_user_throttled(self):
+        """Test that users exceeding their rate are throttled"""
+        self.client.force_authenticate(self.user)
+        with override_settings(REST_FRAMEWORK=throttle_rates(user='2/min')):
+            first = self.client.get(RECIPES_URL)
+            self.client.get(RECIPES_URL)
+            response = self.client.get(RECIPES_URL)
+
+        self.assertEqual(first['X-RateLimit-Limit'], '2')
+        self.assertEqual(first['X-RateLimit-Remaining'], '1')
+        self.assertEqual(
+            response.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+
+    def test_login_scope_stricter(self):
+        """Test that logins are limited by their own rate"""
+        payload = {
+            'email': 'throttle@python.bla',
+            'password': 'InSecurePassword123!'
+        }
+        rates = throttle_rates(user='100/min', login='1/min')
+        with override_settings(REST_FRAMEWORK=rates):
+            first = self.client.post(TOKEN_URL, payload)
+            second = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            second.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
+    @override_settings(THROTTLE_STORE='core.throttling.CacheBucketStore')
+    def test_shared_store_throttles_by_address(self):
+        """Test the per address rate with buckets in the shared cache"""
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user(
+            'other@python.bla',
+            'InSecurePassword123!'
+        ))
+        self.client.force_authenticate(self.user)
+        with override_settings(REST_FRAMEWORK=throttle_rates(ip='1/min')):
+            first = self.client.get(RECIPES_URL)
+            response = other.get(RECIPES_URL)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
+    @override_settings(THROTTLE_STORE='core.throttling.CacheBucketStore')
+    def test_shared_store_clear_keeps_cache(self):
+        """Test that clearing the shared buckets leaves the cache alone"""
+        store = get_store()
+        cache.set('unrelated', 'kept')
+        store.take('client', 1, 60)
+
+        store.clear()
+
+        self.assertEqual(cache.get('unrelated'), 'kept')
+        allowed, remaining, wait = store.take('client', 1, 60)
+        self.assertTrue(allowed)
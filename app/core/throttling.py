@@ -0,0 +1,219 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+BUCKET_CACHE_KEY = 'throttle:{generation}:{key}'
+GENERATION_CACHE_KEY = 'throttle-generation'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Return the requests and seconds of a rate like 100/min"""
+    requests, period = rate.split('/')
+    return int(requests), PERIODS[period[0]]
+
+
+def refill(bucket, capacity, period, now):
+    """Return the tokens of a bucket, topped up for the time passed"""
+    if bucket is None:
+        return capacity
+    tokens, updated_at = bucket
+    return min(capacity, tokens + (now - updated_at) * capacity / period)
+
+
+def take_token(bucket, capacity, period, now):
+    """Take a token out of a bucket
+
+    Returns the new bucket, whether a token was taken, the tokens left and
+    the seconds until the next token.
+    """
+    tokens = refill(bucket, capacity, period, now)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    wait = 0 if allowed else (1 - tokens) * period / capacity
+    return (tokens, now), allowed, int(tokens), wait
+
+
+class LocalBucketStore:
+    """Token buckets of this process only, the cheapest store
+
+    At most THROTTLE_LOCAL_SIZE buckets are kept, dropping the least
+    recently used, which lets that client start over with a full bucket.
+    """
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, period):
+        now = time.monotonic()
+        with self._lock:
+            bucket, allowed, remaining, wait = take_token(
+                self._buckets.get(key), capacity, period, now
+            )
+            self._buckets[key] = bucket
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > settings.THROTTLE_LOCAL_SIZE:
+                self._buckets.popitem(last=False)
+        return allowed, remaining, wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """Token buckets in the THROTTLE_CACHE, shared by all processes using it
+
+    Updates of a bucket are serialized by a lock entry, since cache.add is
+    atomic on every cache backend. A lock that cannot be acquired within
+    a second is ignored rather than stalling the request. The buckets are
+    keyed by a generation, so they can be cleared without clearing the
+    rest of a cache that may well be shared.
+    """
+
+    lock_timeout = 1
+
+    def take(self, key, capacity, period):
+        cache = caches[settings.THROTTLE_CACHE]
+        cache_key = BUCKET_CACHE_KEY.format(
+            generation=self._generation(cache), key=key
+        )
+        lock_key = f'{cache_key}:lock'
+        locked = self._acquire(cache, lock_key)
+        try:
+            now = time.time()
+            bucket, allowed, remaining, wait = take_token(
+                cache.get(cache_key), capacity, period, now
+            )
+            # The bucket is full again once the cache entry expired
+            cache.set(
+                cache_key,
+                bucket,
+                int((capacity - bucket[0]) * period / capacity) + 1
+            )
+        finally:
+            if locked:
+                cache.delete(lock_key)
+        return allowed, remaining, wait
+
+    def _acquire(self, cache, lock_key):
+        """Add the lock entry of a bucket, return whether it was added"""
+        deadline = time.monotonic() + self.lock_timeout
+        while not cache.add(lock_key, True, self.lock_timeout):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def _generation(self, cache):
+        """Return the generation of the buckets
+
+        A missing generation is seeded from the clock instead of starting
+        at 1, so an evicted one never points back at cleared buckets.
+        """
+        generation = cache.get(GENERATION_CACHE_KEY)
+        if generation is None:
+            cache.add(GENERATION_CACHE_KEY, int(time.time() * 1000), None)
+            generation = cache.get(GENERATION_CACHE_KEY)
+        return generation
+
+    def clear(self):
+        """Start all buckets over, the old ones expire on their own"""
+        cache = caches[settings.THROTTLE_CACHE]
+        try:
+            cache.incr(GENERATION_CACHE_KEY)
+        except ValueError:
+            # No buckets were taken since the generation was evicted
+            self._generation(cache)
+
+
+_stores = {}
+
+
+def get_store():
+    """Return the THROTTLE_STORE of this process"""
+    path = settings.THROTTLE_STORE
+    if path not in _stores:
+        _stores[path] = import_string(path)()
+    return _stores[path]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle requests by token buckets of DEFAULT_THROTTLE_RATES
+
+    A bucket holds as many tokens as the rate allows requests per period
+    and refills evenly, so bursts up to the full rate pass. Views narrow
+    the rate with a `throttle_scope`, or per action with a
+    `throttle_scopes` dict, when a rate of that scope is configured.
+    """
+
+    rate_name = None
+
+    def get_ident_key(self, request):
+        """Return the identity the bucket of a request belongs to"""
+        raise NotImplementedError('.get_ident_key() must be overridden')
+
+    def get_scope(self, view):
+        """Return the scope of the view action, if it has a rate"""
+        scope = getattr(view, 'throttle_scopes', {}).get(
+            getattr(view, 'action', None),
+            getattr(view, 'throttle_scope', None)
+        )
+        if scope in api_settings.DEFAULT_THROTTLE_RATES:
+            return scope
+        return None
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view) or self.rate_name
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        capacity, period = parse_rate(rate)
+        allowed, remaining, self._wait = get_store().take(
+            f'{scope}:{self.get_ident_key(request)}', capacity, period
+        )
+        record_quota(request, capacity, remaining)
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Throttle by user, or by client address for anonymous requests"""
+
+    rate_name = 'user'
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user-{request.user.pk}'
+        return f'ip-{self.get_ident(request)}'
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Throttle every request by client address, whatever its user"""
+
+    rate_name = 'ip'
+
+    def get_scope(self, view):
+        return None
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+def record_quota(request, limit, remaining):
+    """Remember the tightest quota of a request for its response headers"""
+    http_request = request._request
+    quota = getattr(http_request, 'rate_limit', None)
+    if quota is None or remaining < quota[1]:
+        http_request.rate_limit = (limit, remaining)
@@ -1,3 +1,28 @@
-# from django.shortcuts import render
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
 
-# Create your views here.
+from core import metrics
+
+
+def metrics_view(request):
+    """Export the request metrics for Prometheus
+
+    These are the metrics of all processes sharing the METRICS_DIR, or of
+    this process without one. Scrapers send the METRICS_TOKEN as a bearer
+    token. Nothing is exported without a token configured.
+    """
+    if not settings.METRICS_ENABLED or not settings.METRICS_TOKEN:
+        raise Http404
+    scheme, _, token = request.META.get(
+        'HTTP_AUTHORIZATION', ''
+    ).partition(' ')
+    if scheme.lower() != 'bearer' or not constant_time_compare(
+            token, settings.METRICS_TOKEN):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(
+        metrics.collect().render(),
+        content_type=metrics.CONTENT_TYPE
+    )
@@ -0,0 +1,62 @@
+"""Gunicorn configuration of the ASGI serving mode
+
+Start with `gunicorn app.asgi:application -c gunicorn.conf.py`. Every
+worker is a separate uvicorn process with its own event loop.
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get(
+    'WEB_CONCURRENCY',
+    multiprocessing.cpu_count() * 2 + 1
+))
+worker_class = 'uvicorn.workers.UvicornWorker'
+# Restart workers now and then to bound the growth of long lived processes
+max_requests = int(os.environ.get('MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('WORKER_TIMEOUT', 30))
+graceful_timeout = timeout
+keepalive = 5
+accesslog = '-'
+
+# The workers share their request metrics through snapshot files here, so
+# a scrape answered by any worker reports all of them
+if not os.environ.get('METRICS_DIR'):
+    os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='metrics-')
+
+
+def on_starting(server):
+    """Start counting the request metrics from zero"""
+    directory = os.environ['METRICS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json*')):
+        os.remove(path)
+
+
+def post_worker_init(worker):
+    """Open the database connections of a worker before it takes requests"""
+    from core.db.readiness import wait_for_database, warm_database
+
+    wait_for_database(timeout=timeout, log=worker.log.warning)
+    warmed = warm_database()
+    if warmed:
+        worker.log.info('Opened %d pooled connections', warmed)
+
+
+def worker_exit(server, worker):
+    """Write the last request metrics of an exiting worker"""
+    from django.conf import settings
+    from core import metrics
+
+    if settings.METRICS_DIR:
+        metrics.registry.flush()
+
+
+def child_exit(server, worker):
+    """Fold the request metrics of an exited worker into the archive"""
+    from core import metrics
+
+    metrics.archive_process(os.environ['METRICS_DIR'], worker.pid)
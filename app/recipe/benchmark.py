@@ -0,0 +1,693 @@
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection, connections, DEFAULT_DB_ALIAS, \
+    transaction
+from django.db.backends.signals import connection_created
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.async_views import concurrent_requests, serve_in_thread
+from core.authentication import clear_local_token_cache
+from core.cache import increment_user_version
+
+from recipe import urls as recipe_urls
+from recipe.samples import create_sample_recipe, create_sample_tag, \
+    create_sample_ingredient
+
+from user.views import CreateTokenView
+
+# Metrics compared against a baseline and their column headings
+METRICS = OrderedDict([
+    ('p50_ms', 'p50 [ms]'),
+    ('p99_ms', 'p99 [ms]'),
+    ('queries', 'queries'),
+    ('alloc_kib', 'alloc [KiB]'),
+])
+
+
+class Dataset:
+    """Synthetic users with their tokens, recipes, tags and ingredients"""
+
+    def __init__(self, users=2, recipes=50, tags=10, ingredients=20,
+                 tags_per_recipe=3, ingredients_per_recipe=5, seed=0):
+        self.random = random.Random(seed)
+        self.users = []
+        self.tokens = {}
+        self.recipes = {}
+        self.tags = {}
+        self.ingredients = {}
+
+        for index in range(users):
+            user = get_user_model().objects.create_user(
+                f'bench{index}@python.bla',
+                None,
+                name=f'Bench User {index}'
+            )
+            self.users.append(user)
+            self.tokens[user.id] = Token.objects.create(user=user).key
+            self.tags[user.id] = [
+                create_sample_tag(user, name=f'tag {number}')
+                for number in range(tags)
+            ]
+            self.ingredients[user.id] = [
+                create_sample_ingredient(user, name=f'ingredient {number}')
+                for number in range(ingredients)
+            ]
+            self.recipes[user.id] = [
+                self._create_recipe(
+                    user, number, tags_per_recipe, ingredients_per_recipe
+                )
+                for number in range(recipes)
+            ]
+
+    def _create_recipe(self, user, number, tags, ingredients):
+        """Create a recipe linked to random tags and ingredients"""
+        recipe = create_sample_recipe(
+            user,
+            title=f'Recipe {number}',
+            time_minutes=self.random.randint(5, 120),
+            price=self.random.randint(100, 5000) / 100
+        )
+        user_tags = self.tags[user.id]
+        user_ingredients = self.ingredients[user.id]
+        recipe.tags.add(
+            *self.random.sample(user_tags, min(tags, len(user_tags)))
+        )
+        recipe.ingredients.add(*self.random.sample(
+            user_ingredients, min(ingredients, len(user_ingredients))
+        ))
+        return recipe
+
+    def client(self, user):
+        """Return an API client authenticated by the token of a user"""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.tokens[user.id]}')
+        return client
+
+
+def sample_image():
+    """Return a small JPEG file to upload"""
+    image = io.BytesIO()
+    Image.effect_noise((400, 300), 64).convert('RGB').save(image, 'JPEG')
+    image.seek(0)
+    image.name = 'benchmark.jpg'
+    return image
+
+
+class Scenario:
+    """A request issued repeatedly against the dataset
+
+    `request` is called with the dataset, a client, the user and the
+    iteration and issues one request. `prepare` runs untimed before every
+    request, e.g. to invalidate cached responses.
+    """
+
+    def __init__(self, name, request, prepare=None,
+                 status_code=200, description=''):
+        self.name = name
+        self.request = request
+        self.prepare = prepare
+        self.status_code = status_code
+        self.description = description
+
+
+def _invalidate_lists(dataset, user, iteration):
+    """Make the next list request miss the response cache"""
+    # The benchmark runs in a transaction that never commits
+    increment_user_version(user.id)
+
+
+def _forget_tokens(dataset, user, iteration):
+    """Make the next request resolve its token from the shared cache"""
+    clear_local_token_cache()
+
+
+def _recipe_detail(dataset, client, user, iteration):
+    recipes = dataset.recipes[user.id]
+    recipe = recipes[iteration % len(recipes)]
+    return client.get(reverse('recipe:recipe-detail', args=[recipe.id]))
+
+
+def _recipe_filter(dataset, client, user, iteration):
+    tags = dataset.tags[user.id]
+    ingredients = dataset.ingredients[user.id]
+    return client.get(reverse('recipe:recipe-list'), {
+        'tags': tags[iteration % len(tags)].id,
+        'ingredients': ingredients[iteration % len(ingredients)].id,
+    })
+
+
+def _recipe_search(dataset, client, user, iteration):
+    tags = dataset.tags[user.id]
+    return client.get(
+        reverse('recipe:recipe-list'),
+        {'q': tags[iteration % len(tags)].name}
+    )
+
+
+def _image_upload(dataset, client, user, iteration):
+    recipes = dataset.recipes[user.id]
+    recipe = recipes[iteration % len(recipes)]
+    return client.post(
+        reverse('recipe:recipe-upload-image', args=[recipe.id]),
+        {'image': sample_image()},
+        format='multipart'
+    )
+
+
+SCENARIOS = OrderedDict((scenario.name, scenario) for scenario in [
+    Scenario(
+        'recipe-list',
+        lambda dataset, client, user, iteration: client.get(
+            reverse('recipe:recipe-list')
+        ),
+        prepare=_invalidate_lists,
+        description='first page of recipes, response cache missed'
+    ),
+    Scenario(
+        'recipe-list-cached',
+        lambda dataset, client, user, iteration: client.get(
+            reverse('recipe:recipe-list')
+        ),
+        description='first page of recipes served from the cache'
+    ),
+    Scenario(
+        'recipe-list-titles',
+        lambda dataset, client, user, iteration: client.get(
+            reverse('recipe:recipe-list'), {'fields': 'id,title'}
+        ),
+        prepare=_invalidate_lists,
+        description='first page of recipe titles only, cache missed'
+    ),
+    Scenario(
+        'recipe-list-expanded',
+        lambda dataset, client, user, iteration: client.get(
+            reverse('recipe:recipe-list'), {'expand': 'tags,ingredients'}
+        ),
+        prepare=_invalidate_lists,
+        description='first page of recipes with nested relations'
+    ),
+    Scenario(
+        'recipe-list-filtered',
+        lambda dataset, client, user, iteration: client.get(
+            reverse('recipe:recipe-list'),
+            {'time_minutes__lte': 30, 'ordering': 'price'}
+        ),
+        prepare=_invalidate_lists,
+        description='first page of quick recipes, cheapest first'
+    ),
+    Scenario(
+        'recipe-detail',
+        _recipe_detail,
+        description='single recipe with its tags and ingredients'
+    ),
+    Scenario(
+        'recipe-filter',
+        _recipe_filter,
+        prepare=_invalidate_lists,
+        description='recipes filtered by a tag and an ingredient'
+    ),
+    Scenario(
+        'recipe-search',
+        _recipe_search,
+        prepare=_invalidate_lists,
+        description='full text search by a tag name'
+    ),
+    Scenario(
+        'tag-list-assigned',
+        lambda dataset, client, user, iteration: client.get(
+            reverse('recipe:tag-list'), {'assigned_only': 1}
+        ),
+        prepare=_invalidate_lists,
+        description='tags assigned to at least one recipe'
+    ),
+    Scenario(
+        'ingredient-list-assigned',
+        lambda dataset, client, user, iteration: client.get(
+            reverse('recipe:ingredient-list'), {'assigned_only': 1}
+        ),
+        prepare=_invalidate_lists,
+        description='ingredients assigned to at least one recipe'
+    ),
+    Scenario(
+        'token-auth',
+        lambda dataset, client, user, iteration: client.get(
+            reverse('user:me')
+        ),
+        prepare=_forget_tokens,
+        description='authenticated profile, in-process token cache missed'
+    ),
+    Scenario(
+        'image-upload',
+        _image_upload,
+        status_code=202,
+        description='multipart image upload, processing left queued'
+    ),
+])
+
+
+def unthrottled():
+    """Return the REST_FRAMEWORK settings without throttle rates"""
+    return {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def measure(scenario, dataset, iterations=50, warmup=5):
+    """Run a scenario and return its latency, query and allocation stats
+
+    Latencies are taken over `iterations` requests after `warmup`
+    untimed ones. Queries and allocations are recorded by one further
+    request, so tracing does not distort the timings.
+    """
+    def issue(iteration):
+        user = dataset.users[iteration % len(dataset.users)]
+        client = clients[user.id]
+        if scenario.prepare is not None:
+            scenario.prepare(dataset, user, iteration)
+        start = time.perf_counter()
+        response = scenario.request(dataset, client, user, iteration)
+        elapsed = time.perf_counter() - start
+        if response.status_code != scenario.status_code:
+            raise AssertionError(
+                f'{scenario.name} returned {response.status_code}, '
+                f'expected {scenario.status_code}'
+            )
+        return elapsed
+
+    clients = {user.id: dataset.client(user) for user in dataset.users}
+    for iteration in range(warmup):
+        issue(iteration)
+    timings = [
+        issue(warmup + iteration) for iteration in range(iterations)
+    ]
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            issue(warmup + iterations)
+        allocated = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'queries': len(queries),
+        'alloc_kib': round(allocated / 1024, 1),
+    }
+
+
+@contextmanager
+def scratch_database():
+    """Point the default database at a new, migrated one in the block
+
+    For the benchmarks whose pooled threads only see committed rows, so
+    their data never reaches the real database. The database is created
+    and dropped like the test runner does, replicas are left alone and
+    connections are closed after every request, as an open one would
+    keep the database from being dropped.
+    """
+    settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+    saved = {key: settings_dict[key] for key in ('NAME', 'CONN_MAX_AGE')}
+    saved_test = settings_dict['TEST']
+    if connection.vendor == 'sqlite':
+        handle, name = tempfile.mkstemp(prefix='benchmark-', suffix='.db')
+        os.close(handle)
+    else:
+        name = f'{saved["NAME"]}_benchmark'
+    settings_dict['TEST'] = {**saved_test, 'NAME': name}
+    settings_dict['CONN_MAX_AGE'] = 0
+    # A connection of its own, an in-memory database ignores being closed
+    previous = connections[DEFAULT_DB_ALIAS]
+    scratch = connections[DEFAULT_DB_ALIAS] = connections.create_connection(
+        DEFAULT_DB_ALIAS
+    )
+    try:
+        scratch.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            with override_settings(DATABASE_REPLICAS=[]):
+                yield
+        finally:
+            scratch.close()
+            pool = getattr(scratch, 'pool', None)
+            if pool is not None:
+                pool.close()
+            scratch.creation.destroy_test_db(saved['NAME'], verbosity=0)
+    finally:
+        settings_dict.update(saved, TEST=saved_test)
+        connections[DEFAULT_DB_ALIAS] = previous
+        clear_local_token_cache()
+
+
+def run(scenarios=None, iterations=50, warmup=5, **dataset_options):
+    """Generate a dataset, run the scenarios and return their results
+
+    Everything happens in a transaction that is rolled back, uploads are
+    written to a temporary MEDIA_ROOT and images are only queued, so the
+    database and the media files are left as they were.
+    """
+    names = scenarios or list(SCENARIOS)
+    media_root = tempfile.mkdtemp(prefix='benchmark-')
+    results = OrderedDict()
+    try:
+        with override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            MEDIA_ROOT=media_root,
+            IMAGE_PROCESSING_MODE='queue',
+            REST_FRAMEWORK=unthrottled()
+        ), transaction.atomic():
+            dataset = Dataset(**dataset_options)
+            for name in names:
+                results[name] = measure(
+                    SCENARIOS[name], dataset, iterations, warmup
+                )
+            transaction.set_rollback(True)
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+        clear_local_token_cache()
+    return results
+
+
+# Scenarios compared between the sync and the async serving mode: the
+# hot read endpoints, and recipe details read while recipes are renamed
+CONCURRENCY_SCENARIOS = (
+    'recipe-list',
+    'recipe-detail',
+    'tag-list',
+    'ingredient-list',
+    'mixed',
+)
+
+# Every n-th request of the mixed scenario is a write
+MIXED_WRITE_EVERY = 4
+
+
+class SimulatedLatency:
+    """Delay every database query, like a database across the network
+
+    The delay is added to the connections of all threads, including the
+    ones opened later.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.active = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.active:
+            time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        """Add the delay to a database connection"""
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        for alias in connections:
+            self.install(connections[alias])
+        connection_created.connect(self.install)
+        self.active = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.active = False
+        connection_created.disconnect(self.install)
+
+
+@contextmanager
+def serving_mode(mode):
+    """Serve the recipe routes in the sync or async mode in the block
+
+    Like ASYNC_VIEWS does, but without reloading the URLconf.
+    """
+    patterns = [
+        pattern for pattern in recipe_urls.router.urls
+        if f'recipe:{pattern.name}' not in settings.WSGI_STREAMED_VIEWS
+    ]
+    callbacks = [pattern.callback for pattern in patterns]
+    try:
+        for pattern, callback in zip(patterns, callbacks):
+            if asyncio.iscoroutinefunction(callback):
+                # Wrapped by concurrent_requests already
+                callback = callback.__wrapped__
+            if mode == 'async':
+                callback = concurrent_requests(callback)
+            pattern.callback = callback
+        yield
+    finally:
+        for pattern, callback in zip(patterns, callbacks):
+            pattern.callback = callback
+
+
+async def _asgi_request(application, method, path, token, data=None):
+    """Issue an authenticated request, return the response status"""
+    body = b'' if data is None else json.dumps(data).encode()
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [
+            (b'host', b'testserver'),
+            (b'authorization', f'Token {token}'.encode()),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+
+async def _issue_concurrently(application, requests, concurrency):
+    """Issue (method, path, token, data) requests, `concurrency` at once"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def issue(method, path, token, data):
+        async with semaphore:
+            status = await _asgi_request(application, method, path, token,
+                                         data)
+            if status != 200:
+                raise AssertionError(f'{method} {path} returned {status}')
+
+    await asyncio.gather(*(issue(*request) for request in requests))
+
+
+def _concurrency_requests(scenario, dataset, requests):
+    """Return the (method, path, token, data) requests of a scenario"""
+    batch = []
+    for iteration in range(requests):
+        user = dataset.users[iteration % len(dataset.users)]
+        recipes = dataset.recipes[user.id]
+        recipe = recipes[iteration % len(recipes)]
+        method, data = 'GET', None
+        if scenario == 'mixed':
+            route = 'recipe-detail'
+            if iteration % MIXED_WRITE_EVERY == 0:
+                method = 'PATCH'
+                data = {'title': f'{recipe.title} {iteration}'}
+        else:
+            route = scenario
+        kwargs = {'pk': recipe.pk} if route.endswith('-detail') else {}
+        batch.append((
+            method,
+            reverse(f'recipe:{route}', kwargs=kwargs),
+            dataset.tokens[user.id],
+            data
+        ))
+    return batch
+
+
+def measure_concurrency(scenario, dataset, requests=50, concurrency=8):
+    """Compare the throughput of a scenario in both serving modes
+
+    Requests go through Django's ASGI handler with all middleware, like
+    under an ASGI server. The sync mode serves the views in the one
+    thread Django shares between all sync code, the async mode through
+    concurrent_requests.
+    """
+    batch = _concurrency_requests(scenario, dataset, requests)
+
+    results = OrderedDict()
+    for mode in ('sync', 'async'):
+        with serving_mode(mode):
+            application = ASGIHandler()
+            start = time.perf_counter()
+            asyncio.run(_issue_concurrently(application, batch, concurrency))
+            results[f'{mode}_rps'] = round(
+                requests / (time.perf_counter() - start), 1
+            )
+    results['speedup'] = round(results['async_rps'] / results['sync_rps'], 2)
+    return results
+
+
+def run_concurrency(scenarios=None, requests=50, concurrency=8,
+                    db_latency=0.005, **dataset_options):
+    """Compare the sync and async serving mode of the recipe endpoints
+
+    The pooled threads use connections of their own, which only see
+    committed rows, so the dataset is committed to a scratch database
+    instead of being rolled back.
+    """
+    names = scenarios or list(CONCURRENCY_SCENARIOS)
+    results = OrderedDict()
+    # Cached list responses would not wait for the database at all
+    with scratch_database(), override_settings(
+        ALLOWED_HOSTS=['testserver'],
+        API_CACHE_TIMEOUT=0,
+        REST_FRAMEWORK=unthrottled()
+    ):
+        dataset = Dataset(**dataset_options)
+        with SimulatedLatency(db_latency):
+            for name in names:
+                results[name] = measure_concurrency(
+                    name, dataset, requests, concurrency
+                )
+    return results
+
+
+# Password hashers compared by the login benchmark
+LOGIN_HASHERS = OrderedDict([
+    ('argon2', 'core.hashers.Argon2PasswordHasher'),
+    ('pbkdf2', 'core.hashers.PBKDF2PasswordHasher'),
+])
+
+
+def measure_logins(hasher, logins=50, workers=4):
+    """Return the login throughput of a password hasher
+
+    Logins are issued through the token view from `workers` threads at
+    once, like the login pool of the async serving mode. Hashing releases
+    the GIL, so the throughput per core divides by the cores those
+    threads can occupy.
+    """
+    password = 'InSecurePassword123!'
+    view = CreateTokenView.as_view()
+    factory = APIRequestFactory()
+
+    def login(iteration):
+        request = factory.post(
+            reverse('user:token'),
+            {'email': user.email, 'password': password},
+            format='json'
+        )
+        response = serve_in_thread(view, request)
+        if response.status_code != 200:
+            raise AssertionError(f'Login returned {response.status_code}')
+
+    with override_settings(PASSWORD_HASHERS=[LOGIN_HASHERS[hasher]]):
+        user = get_user_model().objects.create_user(
+            f'login-{hasher}@benchmark.bla',
+            password
+        )
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(login, range(logins)))
+            elapsed = time.perf_counter() - start
+        finally:
+            user.delete()
+
+    logins_per_second = logins / elapsed
+    cores = min(workers, os.cpu_count() or 1)
+    return OrderedDict([
+        ('logins_per_s', round(logins_per_second, 1)),
+        ('per_core', round(logins_per_second / cores, 1)),
+    ])
+
+
+def run_logins(hashers=None, logins=50, workers=4):
+    """Compare the login throughput of the password hashers
+
+    The pooled threads use connections of their own, so the users logging
+    in are committed to a scratch database.
+    """
+    results = OrderedDict()
+    with scratch_database(), override_settings(
+        ALLOWED_HOSTS=['testserver'],
+        REST_FRAMEWORK=unthrottled()
+    ):
+        for name in hashers or LOGIN_HASHERS:
+            results[name] = measure_logins(name, logins, workers)
+    return results
+
+
+def load_baseline(path):
+    """Return the results stored in a baseline file"""
+    with open(path) as baseline:
+        return json.load(baseline)
+
+
+def save_baseline(path, results):
+    """Store results as a baseline file"""
+    with open(path, 'w') as baseline:
+        json.dump(results, baseline, indent=2, sort_keys=True)
+        baseline.write('\n')
+
+
+def find_regressions(results, baseline, tolerance=0.25):
+    """Return descriptions of the metrics that got worse than a baseline
+
+    Query counts are deterministic and may not grow at all, timings and
+    allocations may exceed the baseline by the `tolerance` fraction.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for metric in METRICS:
+            expected = baseline[name].get(metric)
+            if expected is None:
+                continue
+            allowed = expected
+            if metric != 'queries':
+                allowed = expected * (1 + tolerance)
+            if metrics[metric] > allowed:
+                regressions.append(
+                    f'{name} {metric}: {metrics[metric]} '
+                    f'(baseline {expected})'
+                )
+    return regressions
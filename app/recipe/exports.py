@@ -0,0 +1,107 @@
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from rest_framework.renderers import BaseRenderer
+
+from core.models import Recipe
+
+# Recipe columns of an export, followed by the names of its relations
+EXPORT_FIELDS = ('id', 'title', 'time_minutes', 'price', 'link')
+EXPORT_RELATIONS = ('tags', 'ingredients')
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Renderer negotiating newline delimited JSON exports
+
+    Exports are streamed by the view, this only renders error responses.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode() + b'\n'
+
+
+class CSVRenderer(NDJSONRenderer):
+    """Renderer negotiating CSV exports"""
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+def related_names(relation, recipe_ids, using):
+    """Return the sorted names of a relation by recipe, in one query"""
+    field = Recipe._meta.get_field(relation)
+    source = f'{field.m2m_field_name()}_id'
+    target = field.m2m_reverse_field_name()
+    links = field.remote_field.through.objects.using(using).filter(
+        **{f'{source}__in': recipe_ids}
+    ).values_list(source, f'{target}__name')
+
+    names = defaultdict(list)
+    for recipe_id, name in links:
+        names[recipe_id].append(name)
+    for recipe_names in names.values():
+        recipe_names.sort()
+    return names
+
+
+def export_chunks(queryset, chunk_size):
+    """Yield the recipes of a queryset in lists of dicts with relation names
+
+    Recipes are read through a server-side cursor where supported and the
+    names are looked up once per chunk, so memory stays bounded by
+    `chunk_size` however many recipes are exported.
+    """
+    using = queryset.db
+    recipes = queryset.values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(recipes, chunk_size))
+        if not chunk:
+            return
+        ids = [recipe['id'] for recipe in chunk]
+        names = {
+            relation: related_names(relation, ids, using)
+            for relation in EXPORT_RELATIONS
+        }
+        for recipe in chunk:
+            for relation in EXPORT_RELATIONS:
+                recipe[relation] = names[relation].get(recipe['id'], [])
+        yield chunk
+
+
+def ndjson_content(chunks):
+    """Yield every chunk as lines of JSON"""
+    encoder = DjangoJSONEncoder()
+    for chunk in chunks:
+        yield ''.join(encoder.encode(row) + '\n' for row in chunk)
+
+
+class _Line:
+    """File-like object returning what the csv writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def csv_content(chunks):
+    """Yield a header, then every chunk as CSV with names joined by ;"""
+    writer = csv.writer(_Line())
+    yield writer.writerow(EXPORT_FIELDS + EXPORT_RELATIONS)
+    for chunk in chunks:
+        yield ''.join(
+            writer.writerow(
+                [row[field] for field in EXPORT_FIELDS]
+                + ['; '.join(row[relation]) for relation in EXPORT_RELATIONS]
+            )
+            for row in chunk
+        )
+
+
+EXPORT_FORMATS = {
+    NDJSONRenderer.format: ndjson_content,
+    CSVRenderer.format: csv_content,
+}
@@ -0,0 +1,193 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.exceptions import ValidationError as FieldValidationError
+from django.db.models import Exists, OuterRef, F, Q
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.exceptions import ValidationError
+
+from core.search import search_enabled
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+MATCH_CHOICES = (MATCH_ANY, MATCH_ALL)
+# Query parameters filtering by a range of a field, in the lookup syntax
+RANGE_FILTERS = (
+    'time_minutes__lte',
+    'time_minutes__gte',
+    'time_minutes__range',
+    'price__lte',
+    'price__gte',
+    'price__range',
+)
+# Accepted spellings of boolean query parameters
+FLAG_VALUES = {
+    '1': True, 'true': True, 'yes': True,
+    '0': False, 'false': False, 'no': False,
+}
+
+
+def parse_id_list(param, value):
+    """Convert a comma separated query parameter to a list of integers"""
+    try:
+        return [int(str_id) for str_id in value.split(',') if str_id]
+    except ValueError:
+        raise ValidationError(
+            {param: _('Expected a comma separated list of IDs')}
+        )
+
+
+def parse_flag(param, value):
+    """Convert a boolean query parameter, False if it is missing"""
+    if value is None:
+        return False
+    try:
+        return FLAG_VALUES[value.strip().lower()]
+    except KeyError:
+        raise ValidationError(
+            {param: _('Expected one of: %s') % ', '.join(FLAG_VALUES)}
+        )
+
+
+def parse_name_list(param, value, choices):
+    """Convert a comma separated query parameter to a list of names"""
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in choices]
+    if unknown:
+        raise ValidationError(
+            {param: _('Unknown: %(unknown)s, expected some of: %(choices)s')
+             % {'unknown': ', '.join(unknown), 'choices': ', '.join(choices)}}
+        )
+    return names
+
+
+def parse_range_filters(params, model):
+    """Convert the range query parameters to lookups of a model's fields
+
+    Bounds are converted by the model field, a range takes two comma
+    separated bounds.
+    """
+    lookups = {}
+    for param in RANGE_FILTERS:
+        if param not in params:
+            continue
+        name, lookup = param.split('__')
+        field = model._meta.get_field(name)
+        values = params[param].split(',') if lookup == 'range' \
+            else [params[param]]
+        try:
+            values = [field.to_python(value.strip()) for value in values]
+        except FieldValidationError:
+            values = None
+        if not values or any(
+            value is None
+            or isinstance(value, Decimal) and not value.is_finite()
+            for value in values
+        ):
+            raise ValidationError({param: _('Expected a number')})
+        if lookup == 'range':
+            if len(values) != 2:
+                raise ValidationError(
+                    {param: _('Expected two comma separated numbers')}
+                )
+            lookups[param] = values
+        else:
+            lookups[param] = values[0]
+    return lookups
+
+
+def parse_ordering(value, choices):
+    """Validate an ordering query parameter, a field with an optional -"""
+    if value is None:
+        return None
+    value = value.strip()
+    if value.lstrip('-') not in choices or value.startswith('--'):
+        raise ValidationError(
+            {'ordering': _('Expected one of: %s') % ', '.join(
+                f'{choice}, -{choice}' for choice in choices
+            )}
+        )
+    return value
+
+
+def parse_match(value):
+    """Validate the match mode of the relation filters"""
+    match = value or MATCH_ANY
+    if match not in MATCH_CHOICES:
+        raise ValidationError(
+            {'match': _('Expected one of: %s') % ', '.join(MATCH_CHOICES)}
+        )
+    return match
+
+
+def filter_by_related_ids(queryset, relation, ids, match=MATCH_ANY):
+    """Filter a queryset by the IDs of a many to many relation
+
+    Uses EXISTS subqueries against the through table instead of joining
+    it, so matches never duplicate rows and no DISTINCT is required.
+    """
+    field = queryset.model._meta.get_field(relation)
+    source = f'{field.m2m_field_name()}_id'
+    target = f'{field.m2m_reverse_field_name()}_id'
+    links = field.remote_field.through.objects.filter(
+        **{source: OuterRef('pk')}
+    )
+
+    if match == MATCH_ALL:
+        for related_id in set(ids):
+            queryset = queryset.filter(
+                Exists(links.filter(**{target: related_id}))
+            )
+        return queryset
+
+    return queryset.filter(Exists(links.filter(**{f'{target}__in': ids})))
+
+
+def filter_assigned(queryset, relation='recipe'):
+    """Filter objects linked to at least one object of a reverse relation
+
+    An EXISTS semi join stops at the first link, so neither joining all
+    links nor removing the duplicates with DISTINCT is required.
+    """
+    field = queryset.model._meta.get_field(relation).field
+    target = f'{field.m2m_reverse_field_name()}_id'
+    links = field.remote_field.through.objects.filter(
+        **{target: OuterRef('pk')}
+    )
+    return queryset.filter(Exists(links))
+
+
+def search_recipes(queryset, terms):
+    """Filter recipes by words of their title, tag or ingredient names
+
+    On PostgreSQL the precomputed search vectors are matched against the
+    terms in web search syntax, e.g. `"seafood gumbo" -okra`, and every
+    recipe is annotated with its `rank`. Other databases fall back to
+    substring matches without ranking.
+    """
+    if search_enabled():
+        # Never fails on user input, unlike the raw tsquery syntax
+        query = SearchQuery(
+            terms, config=settings.SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        )
+
+    related_matches = {}
+    for relation in ('tags', 'ingredients'):
+        related_model = queryset.model._meta.get_field(relation).related_model
+        related_matches[f'{relation}_match'] = Exists(
+            related_model.objects.filter(
+                recipe=OuterRef('pk'),
+                name__icontains=terms
+            )
+        )
+
+    return queryset.annotate(**related_matches).filter(
+        Q(title__icontains=terms) |
+        Q(tags_match=True) |
+        Q(ingredients_match=True)
+    )
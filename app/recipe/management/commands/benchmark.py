@@ -0,0 +1,203 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe import benchmark
+
+
+class Command(BaseCommand):
+    """Django command benchmarking the hot paths of the recipe API
+
+    Requests are issued in-process against a synthetic dataset which is
+    rolled back afterwards.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios',
+            nargs='*',
+            metavar='scenario',
+            help='Scenarios to run, all by default: '
+                 + ', '.join(benchmark.SCENARIOS)
+        )
+        parser.add_argument('--users', type=int, default=2)
+        parser.add_argument(
+            '--recipes', type=int, default=50, help='Recipes per user'
+        )
+        parser.add_argument(
+            '--tags', type=int, default=10, help='Tags per user'
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=20, help='Ingredients per user'
+        )
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Compare the throughput of the sync and async serving mode '
+                 'with this many requests in flight, scenarios: '
+                 + ', '.join(benchmark.CONCURRENCY_SCENARIOS)
+        )
+        parser.add_argument(
+            '--db-latency',
+            type=float,
+            default=5,
+            help='Milliseconds added to every query in the concurrency '
+                 'comparison'
+        )
+        parser.add_argument(
+            '--logins',
+            type=int,
+            help='Compare the login throughput of the password hashers '
+                 'over this many logins each'
+        )
+        parser.add_argument(
+            '--login-workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Threads logging in at once in the login comparison'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Fail if the results regressed against this baseline file'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help='Fraction timings and allocations may exceed the baseline'
+        )
+        parser.add_argument(
+            '--save-baseline',
+            metavar='PATH',
+            help='Store the results as a baseline file'
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] is not None:
+            return self.compare_concurrency(options)
+        if options['logins'] is not None:
+            return self.compare_logins(options)
+
+        unknown = set(options['scenarios']) - set(benchmark.SCENARIOS)
+        if unknown:
+            raise CommandError(
+                'Unknown scenarios: ' + ', '.join(sorted(unknown))
+            )
+        if options['users'] < 1 or options['recipes'] < 1 \
+                or options['iterations'] < 1:
+            raise CommandError(
+                'At least one user, recipe and iteration is required'
+            )
+
+        results = benchmark.run(
+            scenarios=options['scenarios'],
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            users=options['users'],
+            recipes=options['recipes'],
+            tags=options['tags'],
+            ingredients=options['ingredients'],
+            tags_per_recipe=options['tags_per_recipe'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            seed=options['seed']
+        )
+        self.write_results(results)
+
+        if options['save_baseline']:
+            benchmark.save_baseline(options['save_baseline'], results)
+            self.stdout.write(f'Saved baseline {options["save_baseline"]}')
+
+        if options['baseline']:
+            regressions = benchmark.find_regressions(
+                results,
+                benchmark.load_baseline(options['baseline']),
+                options['tolerance']
+            )
+            if regressions:
+                raise CommandError(
+                    'Regressions against the baseline:\n'
+                    + '\n'.join(regressions)
+                )
+            self.stdout.write(
+                self.style.SUCCESS('No regressions against the baseline')
+            )
+
+    def compare_concurrency(self, options):
+        """Run and report the serving mode comparison"""
+        unknown = set(options['scenarios']) - set(
+            benchmark.CONCURRENCY_SCENARIOS
+        )
+        if unknown:
+            raise CommandError(
+                'Unknown concurrency scenarios: '
+                + ', '.join(sorted(unknown))
+            )
+        if options['concurrency'] < 1 or options['iterations'] < 1:
+            raise CommandError(
+                'At least one concurrent request and iteration is required'
+            )
+
+        results = benchmark.run_concurrency(
+            scenarios=options['scenarios'],
+            requests=options['iterations'],
+            concurrency=options['concurrency'],
+            db_latency=options['db_latency'] / 1000,
+            users=options['users'],
+            recipes=options['recipes'],
+            tags=options['tags'],
+            ingredients=options['ingredients'],
+            tags_per_recipe=options['tags_per_recipe'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            seed=options['seed']
+        )
+        width = max(len(name) for name in results)
+        self.stdout.write(
+            f'{"scenario":<{width}}{"sync [req/s]":>14}'
+            f'{"async [req/s]":>15}{"speedup":>10}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<{width}}{result["sync_rps"]:>14}'
+                f'{result["async_rps"]:>15}{result["speedup"]:>10}'
+            )
+
+    def compare_logins(self, options):
+        """Run and report the password hasher comparison"""
+        unknown = set(options['scenarios']) - set(benchmark.LOGIN_HASHERS)
+        if unknown:
+            raise CommandError(
+                'Unknown password hashers: ' + ', '.join(sorted(unknown))
+            )
+        if options['logins'] < 1 or options['login_workers'] < 1:
+            raise CommandError('At least one login and worker is required')
+
+        results = benchmark.run_logins(
+            hashers=options['scenarios'],
+            logins=options['logins'],
+            workers=options['login_workers']
+        )
+        self.stdout.write(
+            f'{"hasher":<8}{"logins/s":>12}{"per core":>12}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<8}{result["logins_per_s"]:>12}'
+                f'{result["per_core"]:>12}'
+            )
+
+    def write_results(self, results):
+        """Write the results as a table"""
+        width = max(len(name) for name in results)
+        header = ''.join(
+            f'{heading:>14}' for heading in benchmark.METRICS.values()
+        )
+        self.stdout.write(f'{"scenario":<{width}}{header}')
+        for name, metrics in results.items():
+            self.stdout.write(f'{name:<{width}}' + ''.join(
+                f'{metrics[metric]:>14}' for metric in benchmark.METRICS
+            ))
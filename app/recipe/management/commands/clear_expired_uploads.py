@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipe.uploads import clear_expired_uploads
+
+
+class Command(BaseCommand):
+    """Django command removing expired resumable image uploads
+
+    Meant to run periodically, e.g. from cron, like clearsessions.
+    """
+
+    def handle(self, *args, **options):
+        deleted, removed = clear_expired_uploads()
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired uploads, '
+            f'removed {removed} partial files'
+        ))
@@ -0,0 +1,486 @@
+import hashlib
+from calendar import timegm
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date, urlencode
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from core.cache import get_user_version, get_user_modified, \
+    bump_user_version
+from core.counters import adjust_counters, adjust_recipe_counts, \
+    user_counter
+from core.metrics import current_profile, serializer_timer
+from core.models import NormalizedNameField, Recipe, bulk_deletion, \
+    touch_recipes
+from core.search import update_search_vectors
+
+
+def bulk_id(value):
+    """Return an item id of a bulk request, None unless it is an integer"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def make_etag(*parts):
+    """Return a strong, quoted ETag derived from the given parts"""
+    digest = hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def normalized_query(request):
+    """Return the query string of a request with sorted parameters"""
+    return urlencode(sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+    ))
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """Add the ETag and Last-Modified headers to a response"""
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified_response(request, etag=None, last_modified=None):
+    """Return a 304 response if the validators of the client still match"""
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+_timed_serializer_classes = {}
+
+
+def timed_serializer_class(serializer_class):
+    """Return a subclass of a serializer timing its validation and data"""
+    timed_class = _timed_serializer_classes.get(serializer_class)
+    if timed_class is None:
+        class TimedSerializer(serializer_class):
+
+            def is_valid(self, *args, **kwargs):
+                with serializer_timer():
+                    return super().is_valid(*args, **kwargs)
+
+            @property
+            def data(self):
+                with serializer_timer():
+                    return super().data
+
+        TimedSerializer.__name__ = serializer_class.__name__
+        TimedSerializer.__qualname__ = serializer_class.__qualname__
+        timed_class = _timed_serializer_classes[serializer_class] = \
+            TimedSerializer
+    return timed_class
+
+
+class SerializerTimingMixin:
+    """Add the serializer time of profiled requests to their metrics"""
+
+    def get_serializer(self, *args, **kwargs):
+        """Return a serializer which is timed if the request is profiled"""
+        serializer = super().get_serializer(*args, **kwargs)
+        if current_profile() is not None:
+            serializer.__class__ = timed_serializer_class(
+                serializer.__class__
+            )
+        return serializer
+
+
+class CachedListMixin:
+    """Cache the list response per user and normalized query parameters
+
+    Entries are keyed by the version of the user's data, which is bumped
+    whenever one of their recipes, tags or ingredients changes, so stale
+    entries are never read and simply expire.
+    """
+
+    def get_list_cache_key(self, request):
+        """Return the cache key of the list response for a request"""
+        query = normalized_query(request)
+        digest = hashlib.md5(
+            f'{request.get_host()}{request.path}?{query}'.encode()
+        ).hexdigest()
+        version = get_user_version(request.user.pk)
+
+        return f'api-list:{request.user.pk}:{version}:{digest}'
+
+    def list(self, request, *args, **kwargs):
+        """Serve the list from the cache, filling it on a miss
+
+        The cache key doubles as ETag, so a client holding the current
+        representation is answered with 304 before the cache is read.
+        """
+        key = self.get_list_cache_key(request)
+        etag = make_etag(key, request.accepted_renderer.format)
+        last_modified = get_user_modified(request.user.pk)
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        data = cache.get(key)
+        if data is not None:
+            return set_validators(Response(data), etag, last_modified)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+            set_validators(response, etag, last_modified)
+
+        return response
+
+
+class ConditionalRetrieveMixin:
+    """Answer conditional GET requests of a recipe detail with 304
+
+    The validators are derived from the most recent updated_at of the
+    recipe and of its tags and ingredients, read with a single aggregate
+    query before anything is serialized.
+    """
+
+    def get_retrieve_validators(self, request, pk):
+        """Return the ETag and Last-Modified timestamp of a recipe"""
+        try:
+            queryset = self.get_queryset().filter(pk=pk)
+        except (TypeError, ValueError):
+            # Leave the 404 to the regular retrieve
+            return None, None
+
+        modified = queryset.aggregate(
+            recipe=Max('updated_at'),
+            tags=Max('tags__updated_at'),
+            ingredients=Max('ingredients__updated_at'),
+        )
+        if modified['recipe'] is None:
+            return None, None
+
+        last_modified = max(value for value in modified.values() if value)
+        etag = make_etag(
+            pk,
+            last_modified.isoformat(),
+            request.accepted_renderer.format,
+            normalized_query(request)
+        )
+
+        return etag, timegm(last_modified.utctimetuple())
+
+    def retrieve(self, request, *args, **kwargs):
+        """Serialize the recipe only if the client copy is outdated"""
+        etag, last_modified = self.get_retrieve_validators(
+            request,
+            kwargs[self.lookup_url_kwarg or self.lookup_field]
+        )
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        response = super().retrieve(request, *args, **kwargs)
+
+        return set_validators(response, etag, last_modified)
+
+
+class BulkModelMixin:
+    """Create, update and delete batches of user owned objects
+
+    POST creates, PATCH partially updates (each item carries its id) and
+    DELETE removes (the body is a list of ids) the objects at the bulk
+    endpoint. All items are validated in one pass, referenced objects of
+    bulk_related_fields are resolved with one query per relation, and
+    the batch is written in one transaction, either completely or not at
+    all. Invalid batches are answered with one error dict per item.
+    """
+    # Many to many fields of the model mapped to their related model
+    bulk_related_fields = {}
+    # Lookup from recipes to the objects of the model, whose names or
+    # titles make up the recipe search vectors
+    bulk_search_lookup = None
+
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False,
+            url_path='bulk')
+    def bulk(self, request):
+        """Process a batch of objects"""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'detail': _('Expected a non empty list of items')},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > settings.API_MAX_BULK_SIZE:
+            return Response(
+                {'detail': _('A batch is limited to %d items')
+                    % settings.API_MAX_BULK_SIZE},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if request.method == 'DELETE':
+            return self.bulk_destroy(request, items)
+        if request.method == 'PATCH':
+            return self.bulk_update(request, items)
+        return self.bulk_create(request, items)
+
+    def bulk_create(self, request, items):
+        """Validate and insert a batch of new objects"""
+        serializers = [self.get_serializer(data=item) for item in items]
+        errors = self._validate_bulk(serializers)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.get_queryset().model
+        instances = []
+        relations = []
+        for serializer in serializers:
+            data = dict(serializer.validated_data)
+            relations.append(self._pop_relations(data))
+            instances.append(model(user=request.user, **data))
+
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                model.objects.bulk_create(instances)
+                # bulk_create does not send the signals counting them
+                adjust_counters(
+                    get_user_model().objects.filter(pk=request.user.pk),
+                    **{user_counter(model): len(instances)}
+                )
+            else:
+                # The primary keys are needed to link the relations
+                for instance in instances:
+                    instance.save()
+            self._set_relations(instances, relations)
+            self._update_search_vectors(instances)
+
+        return self._bulk_response(instances, status.HTTP_201_CREATED)
+
+    def bulk_update(self, request, items):
+        """Validate and partially update a batch of existing objects"""
+        ids = [
+            bulk_id(item.get('id')) if isinstance(item, dict) else None
+            for item in items
+        ]
+        existing = self.get_queryset().in_bulk(
+            [pk for pk in ids if pk is not None]
+        )
+
+        serializers = [
+            self.get_serializer(existing.get(pk), data=item, partial=True)
+            for pk, item in zip(ids, items)
+        ]
+        errors = self._validate_bulk(serializers)
+        seen = set()
+        for pk, item_errors in zip(ids, errors):
+            if pk not in existing:
+                item_errors['id'] = [_('Not found.')]
+            elif pk in seen:
+                # Both items would be written through one instance
+                item_errors['id'] = [_('Repeated in this batch.')]
+            seen.add(pk)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.get_queryset().model
+        derived = [
+            field for field in model._meta.concrete_fields
+            if isinstance(field, NormalizedNameField)
+        ]
+        instances = []
+        relations = []
+        fields = {'updated_at', *(field.name for field in derived)}
+        now = timezone.now()
+        for serializer in serializers:
+            data = dict(serializer.validated_data)
+            relations.append(self._pop_relations(data))
+            instance = serializer.instance
+            for field, value in data.items():
+                setattr(instance, field, value)
+            # bulk_update does not apply auto_now or derive the fields
+            # computed while saving
+            instance.updated_at = now
+            for field in derived:
+                field.pre_save(instance, False)
+            fields.update(data)
+            instances.append(instance)
+
+        with transaction.atomic():
+            model.objects.bulk_update(instances, fields)
+            self._set_relations(instances, relations)
+            self._update_search_vectors(instances)
+
+        return self._bulk_response(instances, status.HTTP_200_OK)
+
+    def bulk_destroy(self, request, ids):
+        """Delete a batch of objects given by their ids
+
+        The delete signals would count and invalidate per object, so the
+        counters, the search vectors of recipes losing a tag or
+        ingredient and the cached responses are updated per batch.
+        """
+        queryset = self.get_queryset()
+        ids = [bulk_id(pk) for pk in ids]
+        existing = set(queryset.filter(
+            pk__in=[pk for pk in ids if pk is not None]
+        ).values_list('pk', flat=True))
+
+        errors = [
+            {} if pk in existing else {'id': [_('Not found.')]}
+            for pk in ids
+        ]
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        model = queryset.model
+        with transaction.atomic(), bulk_deletion():
+            touched = []
+            if model is not Recipe and self.bulk_search_lookup is not None:
+                touched = list(Recipe.objects.filter(**{
+                    f'{self.bulk_search_lookup}__in': existing
+                }).values_list('pk', flat=True))
+            unlinked = self._linked_counts(existing)
+            model.objects.filter(pk__in=existing).delete()
+
+            for related_model, counts in unlinked.items():
+                adjust_recipe_counts(related_model, {
+                    pk: -count for pk, count in counts.items()
+                })
+            adjust_counters(
+                get_user_model().objects.filter(pk=request.user.pk),
+                **{user_counter(model): -len(existing)}
+            )
+            touch_recipes(pk__in=touched)
+            bump_user_version(request.user.pk)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def _linked_counts(self, pks):
+        """Count the links of objects per related object and model"""
+        model = self.get_queryset().model
+        counts = {}
+        for field, related_model in self.bulk_related_fields.items():
+            m2m = model._meta.get_field(field)
+            counts[related_model] = Counter(
+                m2m.remote_field.through.objects.filter(**{
+                    f'{m2m.m2m_field_name()}_id__in': pks
+                }).values_list(f'{m2m.m2m_reverse_field_name()}_id', flat=True)
+            )
+        return counts
+
+    def get_bulk_response_queryset(self):
+        """Return the queryset the written objects are serialized from"""
+        return self.get_queryset()
+
+    def _validate_bulk(self, serializers):
+        """Validate every item and all referenced related objects"""
+        errors = []
+        for serializer in serializers:
+            serializer.is_valid()
+            errors.append(dict(serializer.errors))
+
+        for field, related_model in self.bulk_related_fields.items():
+            requested = {
+                pk
+                for serializer in serializers
+                for pk in serializer.validated_data.get(field, ())
+            }
+            found = set(related_model.objects.filter(
+                user=self.request.user,
+                pk__in=requested
+            ).values_list('pk', flat=True)) if requested else set()
+
+            for serializer, item_errors in zip(serializers, errors):
+                missing = [
+                    pk for pk in serializer.validated_data.get(field, ())
+                    if pk not in found
+                ]
+                if missing:
+                    item_errors[field] = [
+                        _('Invalid pk "%s" - object does not exist.') % pk
+                        for pk in missing
+                    ]
+
+        return errors
+
+    def _pop_relations(self, data):
+        """Remove the many to many values from validated data"""
+        return {
+            field: data.pop(field)
+            for field in self.bulk_related_fields
+            if field in data
+        }
+
+    def _set_relations(self, instances, relations):
+        """Replace the given relations with bulk through table writes"""
+        model = self.get_queryset().model
+        for field in self.bulk_related_fields:
+            m2m = model._meta.get_field(field)
+            through = m2m.remote_field.through
+            source = f'{m2m.m2m_field_name()}_id'
+            target = f'{m2m.m2m_reverse_field_name()}_id'
+            changed = [
+                (instance, values[field])
+                for instance, values in zip(instances, relations)
+                if field in values
+            ]
+            if not changed:
+                continue
+
+            links = through.objects.filter(
+                **{f'{source}__in': [instance.pk for instance, pks in changed]}
+            )
+            deltas = Counter(
+                pk for instance, pks in changed for pk in set(pks)
+            )
+            deltas.subtract(links.values_list(target, flat=True))
+            links.delete()
+            through.objects.bulk_create([
+                through(**{source: instance.pk, target: pk})
+                for instance, pks in changed
+                for pk in set(pks)
+            ])
+            adjust_recipe_counts(self.bulk_related_fields[field], deltas)
+
+        # Bulk writes bypass the signals invalidating cached responses
+        # and maintaining the recipe counts
+        bump_user_version(self.request.user.pk)
+
+    def _update_search_vectors(self, instances):
+        """Rebuild the search vectors the written objects are part of
+
+        Bulk writes bypass the signals doing it for single objects.
+        """
+        if self.bulk_search_lookup is None:
+            return
+        update_search_vectors(Recipe.objects.filter(**{
+            f'{self.bulk_search_lookup}__in': [
+                instance.pk for instance in instances
+            ]
+        }))
+
+    def _bulk_response(self, instances, status_code):
+        """Serialize the written objects in the order of the request"""
+        pks = [instance.pk for instance in instances]
+        written = self.get_bulk_response_queryset().in_bulk(pks)
+        serializer = self.serializer_class(
+            [written[pk] for pk in pks],
+            many=True,
+            context=self.get_serializer_context()
+        )
+
+        return Response(serializer.data, status=status_code)
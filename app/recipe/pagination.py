@@ -0,0 +1,136 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+
+
+class BaseCursorPagination(pagination.CursorPagination):
+    """Keyset pagination with a client selectable, capped page size
+
+    Views can order a request differently through get_cursor_ordering,
+    which has to end with a unique field. Unlike DRF's cursor, which
+    only keys on the first field and counts the ties past it, the cursor
+    holds the values of every ordering field, so any number of ties is
+    paged through.
+    """
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        """Return the ordering of the view or the default one"""
+        if hasattr(view, 'get_cursor_ordering'):
+            ordering = view.get_cursor_ordering()
+            if ordering:
+                return tuple(ordering)
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = None
+        if self.cursor is not None:
+            position = self._parse_position(queryset, self.cursor.position)
+
+        # Pages before the cursor are read in the opposite order
+        ordering = [
+            _flip(name) if reverse else name for name in self.ordering
+        ]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(_after(ordering, position))
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        if (self.has_previous or self.has_next) and \
+                self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
+
+    def _link(self, instance, reverse):
+        """Return the link of the page next to an instance"""
+        position = json.dumps(
+            [getattr(instance, name.lstrip('-')) for name in self.ordering],
+            default=str
+        )
+        return self.encode_cursor(
+            pagination.Cursor(offset=0, reverse=reverse, position=position)
+        )
+
+    def _parse_position(self, queryset, position):
+        """Return the ordering values a cursor position holds"""
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or \
+                    len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                _output_field(queryset, name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+def _flip(name):
+    """Return an ordering field name in the opposite direction"""
+    return name[1:] if name.startswith('-') else f'-{name}'
+
+
+def _output_field(queryset, name):
+    """Return the model field or annotation an ordering name refers to"""
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _after(ordering, values):
+    """Return the condition of the rows following values in an ordering
+
+    Rows sharing the leading values follow if the next field does.
+    """
+    condition = Q()
+    equal = {}
+    for name, value in zip(ordering, values):
+        field = name.lstrip('-')
+        lookup = 'lt' if name.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{field}__{lookup}': value})
+        equal[field] = value
+    return condition
+
+
+class RecipeCursorPagination(BaseCursorPagination):
+    """Paginate recipes by their newest id first"""
+    ordering = '-id'
+
+
+class RecipeAttributeCursorPagination(BaseCursorPagination):
+    """Paginate tags and ingredients by name, using the id as tie breaker"""
+    ordering = ('-name', '-id')
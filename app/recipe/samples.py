@@ -0,0 +1,22 @@
+from core.models import Recipe, Tag, Ingredient
+
+
+def create_sample_recipe(user, **params):
+    """create and return a sample recipe"""
+    defaults = {
+        "title": 'Sample recipe',
+        "time_minutes": 10,
+        "price": 5.00
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def create_sample_ingredient(user, name="Cajun Rub"):
+    """create and return a sample ingredient"""
+    return Ingredient.objects.create(user=user, name=name)
+
+
+def create_sample_tag(user, name="creolic"):
+    """create and return a sample tag"""
+    return Tag.objects.create(user=user, name=name)
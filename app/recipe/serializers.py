@@ -1,9 +1,44 @@
+import copy
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+
 from rest_framework import serializers
 
-from core.models import Tag, Ingredient, Recipe
+from core.models import Tag, Ingredient, Recipe, RecipeImageRendition, \
+    RecipeImageUpload
+from core.names import normalize_name
+
+
+class UniqueNameMixin:
+    """Reject a name the user already has, once normalized
+
+    The `taken_names` context maps taken normalized names to the ids of
+    their objects, bulk requests look up those of the whole batch at once.
+    Without it the name is looked up on its own.
+    """
 
+    def validate_name(self, value):
+        request = self.context.get('request')
+        if request is None:
+            return value
+        normalized = normalize_name(value)
+        taken = self.context.get('taken_names')
+        if taken is None:
+            taken = dict(self.Meta.model.objects.filter(
+                user=request.user,
+                normalized_name=normalized
+            ).values_list('normalized_name', 'pk'))
 
-class TagSerializer(serializers.ModelSerializer):
+        pk = taken.get(normalized)
+        if pk is not None and getattr(self.instance, 'pk', None) != pk:
+            raise serializers.ValidationError(
+                _('You already have one named "%s".') % value
+            )
+        return value
+
+
+class TagSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Serializer for tag objects"""
 
     class Meta:
@@ -12,7 +47,15 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class TagCountSerializer(TagSerializer):
+    """Serializer for tag objects with their usage counters"""
+
+    class Meta(TagSerializer.Meta):
+        fields = ('id', 'name', 'recipe_count', 'last_used_at')
+        read_only_fields = ('id', 'recipe_count', 'last_used_at')
+
+
+class IngredientSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Serializer for ingredient objects"""
 
     class Meta:
@@ -21,7 +64,45 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class IngredientCountSerializer(IngredientSerializer):
+    """Serializer for ingredient objects with their usage counters"""
+
+    class Meta(IngredientSerializer.Meta):
+        fields = ('id', 'name', 'recipe_count', 'last_used_at')
+        read_only_fields = ('id', 'recipe_count', 'last_used_at')
+
+
+class SparseFieldsetMixin:
+    """Serialize only the requested fields and expand relations inline
+
+    `fields` lists the fields to render, all by default. `expand` lists
+    relations rendered by the nested fields of `get_expanded_fields`
+    instead of their primary keys.
+    """
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        self.sparse_fields = fields
+        self.expand = expand
+        super().__init__(*args, **kwargs)
+
+    def get_expanded_fields(self):
+        """Return the nested fields of the expandable relations"""
+        return {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.sparse_fields is not None:
+            for name in list(fields):
+                if name not in self.sparse_fields:
+                    del fields[name]
+        expanded_fields = self.get_expanded_fields()
+        for name in self.expand:
+            if name in fields:
+                fields[name] = copy.deepcopy(expanded_fields[name])
+        return fields
+
+
+class RecipeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for recipe objects"""
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -39,6 +120,27 @@ class RecipeSerializer(serializers.ModelSerializer):
             'price', 'link'
         )
         read_only_fields = ('id',)
+        expandable_fields = ('ingredients', 'tags')
+
+    def get_expanded_fields(self):
+        """Expand relations like the detail representation"""
+        return RecipeDetailSerializer._declared_fields
+
+
+class RecipeBulkSerializer(RecipeSerializer):
+    """Serializer validating the recipes of a bulk request
+
+    Tags and ingredients are plain ID lists, their existence is checked
+    for the whole batch at once instead of one query per ID.
+    """
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
 
 
 class RecipeDetailSerializer(RecipeSerializer):
@@ -47,10 +149,38 @@ class RecipeDetailSerializer(RecipeSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
+class RecipeImageRenditionSerializer(serializers.ModelSerializer):
+    """Serializer for the resized copies of a recipe image"""
+
+    class Meta:
+        model = RecipeImageRendition
+        fields = ('name', 'format', 'width', 'height', 'image')
+        read_only_fields = fields
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
     """Serializer for uploading images"""
+    renditions = RecipeImageRenditionSerializer(many=True, read_only=True)
 
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
-        read_only_fields = ('id',)
+        fields = ('id', 'image', 'image_status', 'renditions')
+        read_only_fields = ('id', 'image_status')
+
+
+class RecipeImageUploadSerializer(serializers.ModelSerializer):
+    """Serializer for resumable, chunked image uploads"""
+
+    class Meta:
+        model = RecipeImageUpload
+        fields = ('id', 'filename', 'size', 'offset', 'expires_at')
+        read_only_fields = ('id', 'offset', 'expires_at')
+
+    def validate_size(self, value):
+        """Reject uploads announcing more bytes than allowed"""
+        if not 0 < value <= settings.IMAGE_UPLOAD_MAX_BYTES:
+            raise serializers.ValidationError(
+                _('Ensure the image has at most %d bytes.')
+                % settings.IMAGE_UPLOAD_MAX_BYTES
+            )
+        return value
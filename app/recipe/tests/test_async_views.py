@@ -0,0 +1,141 @@
+import json
+from io import StringIO
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.async_views import concurrent_requests, run_in_pool
+from core.models import Recipe, Tag
+
+from recipe.views import RecipeViewSet, TagViewSet
+
+from user.async_views import offloaded_hashing
+from user.views import CreateTokenView
+
+
+class ConcurrentRequestsTests(TransactionTestCase):
+    """Test serving requests from async views
+
+    The requests are served by pooled threads with connections of their
+    own, which only see committed rows.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'async@python.bla',
+            'InSecurePassword123!'
+        )
+        self.factory = APIRequestFactory()
+
+    def call(self, view, request, **kwargs):
+        """Authenticate and serve a request by an async view"""
+        force_authenticate(request, self.user)
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_read_served_by_async_view(self):
+        """Test that reads return the same response as the sync view"""
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Gumbo',
+            time_minutes=60,
+            price=8.5
+        )
+        view = concurrent_requests(RecipeViewSet.as_view({'get': 'retrieve'}))
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+
+        response = self.call(view, self.factory.get(url), pk=recipe.id)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['title'], 'Gumbo')
+
+    def test_write_served_by_async_view(self):
+        """Test that writes are served from the write pool"""
+        view = concurrent_requests(
+            TagViewSet.as_view({'get': 'list', 'post': 'create'})
+        )
+        request = self.factory.post(
+            reverse('recipe:tag-list'),
+            {'name': 'Cajun'},
+            format='json'
+        )
+
+        with patch('core.async_views.run_in_pool',
+                   wraps=run_in_pool) as pooled:
+            response = self.call(view, request)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Tag.objects.filter(name='Cajun').exists())
+        executor = pooled.call_args[0][0]
+        self.assertTrue(executor._thread_name_prefix.startswith('write'))
+
+    def test_login_served_by_async_view(self):
+        """Test that logins are served from the login pool"""
+        view = offloaded_hashing(CreateTokenView.as_view())
+        request = self.factory.post(
+            reverse('user:token'),
+            {'email': 'async@python.bla', 'password': 'InSecurePassword123!'},
+            format='json'
+        )
+
+        response = async_to_sync(view)(request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('token', json.loads(response.content))
+
+    def test_benchmark_logins(self):
+        """Test comparing the password hashers, leaving no data behind"""
+        out = StringIO()
+        call_command(
+            'benchmark',
+            'argon2',
+            logins=2,
+            login_workers=2,
+            stdout=out
+        )
+
+        self.assertIn('argon2', out.getvalue())
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+    def test_benchmark_concurrency(self):
+        """Test comparing the serving modes, leaving no data behind"""
+        out = StringIO()
+        call_command(
+            'benchmark',
+            'tag-list',
+            concurrency=2,
+            iterations=4,
+            db_latency=0,
+            users=1,
+            recipes=2,
+            stdout=out
+        )
+
+        self.assertIn('tag-list', out.getvalue())
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+    def test_benchmark_mixed_concurrency(self):
+        """Test comparing the serving modes on reads mixed with writes"""
+        out = StringIO()
+        call_command(
+            'benchmark',
+            'mixed',
+            concurrency=2,
+            iterations=8,
+            db_latency=0,
+            users=1,
+            recipes=2,
+            stdout=out
+        )
+
+        self.assertIn('mixed', out.getvalue())
+        self.assertEqual(Recipe.objects.count(), 0)
@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+
+from core.models import Recipe
+
+from recipe.benchmark import find_regressions, percentile, scratch_database
+
+
+class BenchmarkTests(TestCase):
+    """Test the benchmark harness"""
+
+    def run_benchmark(self, *args, **options):
+        """Run a small benchmark and return its output"""
+        out = StringIO()
+        call_command(
+            'benchmark',
+            *args,
+            users=1,
+            recipes=3,
+            tags=2,
+            ingredients=2,
+            iterations=2,
+            warmup=0,
+            stdout=out,
+            **options
+        )
+        return out.getvalue()
+
+    def test_benchmark_reports_scenarios(self):
+        """Test that the scenarios are reported and the data rolled back"""
+        output = self.run_benchmark('recipe-list', 'token-auth')
+
+        self.assertIn('recipe-list', output)
+        self.assertIn('token-auth', output)
+        self.assertNotIn('recipe-detail', output)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_benchmark_baseline(self):
+        """Test saving and comparing against a baseline file"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            self.run_benchmark('recipe-detail', save_baseline=path)
+            with open(path) as baseline:
+                results = json.load(baseline)
+            results['recipe-detail']['queries'] = 0
+            with open(path, 'w') as baseline:
+                json.dump(results, baseline)
+
+            with self.assertRaisesRegex(
+                CommandError, 'recipe-detail queries'
+            ):
+                self.run_benchmark('recipe-detail', baseline=path)
+
+    def test_unknown_scenario(self):
+        """Test that unknown scenarios are refused"""
+        with self.assertRaises(CommandError):
+            self.run_benchmark('recipe-dance')
+
+    def test_find_regressions_tolerance(self):
+        """Test that timings may exceed the baseline by the tolerance"""
+        baseline = {'list': {'p50_ms': 10, 'queries': 3}}
+
+        self.assertEqual(
+            find_regressions({'list': {'p50_ms': 12, 'queries': 3}}, baseline),
+            []
+        )
+        self.assertEqual(
+            len(find_regressions(
+                {'list': {'p50_ms': 13, 'queries': 4}}, baseline
+            )),
+            2
+        )
+
+    def test_percentile(self):
+        """Test the nearest-rank percentile"""
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.99), 7)
+
+
+class ScratchDatabaseTests(TransactionTestCase):
+    """Test the database of the benchmarks committing their data"""
+
+    def test_scratch_database(self):
+        """Test that committed rows are seen by threads, then dropped"""
+        def count_users():
+            try:
+                return get_user_model().objects.count()
+            finally:
+                connections.close_all()
+
+        with scratch_database():
+            get_user_model().objects.create_user('scratch@python.bla')
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                seen = executor.submit(count_users).result()
+
+        self.assertEqual(seen, 1)
+        self.assertFalse(get_user_model().objects.exists())
@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.core.cache import cache
 from django.test import TestCase
 
 from rest_framework import status
@@ -36,6 +37,7 @@ class PrivateIngredientsApiTests(TestCase):
             password="Password123!"
         )
         self.client.force_authenticate(self.user)
+        cache.clear()
 
     def test_retrieve_ingredients(self):
         """Test retrieve a list of Ingredients"""
@@ -47,7 +49,7 @@ class PrivateIngredientsApiTests(TestCase):
         ingredients = Ingredient.objects.all().order_by('-name')
         serializer = IngredientSerializer(ingredients, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """Test that ingredients for authenticated user are returned"""
@@ -64,8 +66,8 @@ class PrivateIngredientsApiTests(TestCase):
         response = self.client.get(INGREDIENTS_URL)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], ingredient.name)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], ingredient.name)
 
     def test_create_ingredients_successful(self):
         """Test that ingredients can be created"""
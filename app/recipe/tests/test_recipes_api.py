@@ -1,48 +1,62 @@
+import csv
+import io
+import json
 import tempfile
 import os
+import uuid
+from unittest.mock import patch
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 
-from core.models import Recipe, Tag, Ingredient
+from core.images import discard_renditions
+from core.models import Recipe
 
+from recipe.pagination import RecipeCursorPagination
+from recipe.samples import create_sample_recipe, create_sample_ingredient, \
+    create_sample_tag
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.uploads import partial_upload_path, upload_temp_dir
+from recipe.views import RecipeViewSet
 
 RECIPIES_URL = reverse('recipe:recipe-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+BULK_RECIPES_URL = reverse('recipe:recipe-bulk')
 
 def image_upload_url(recipe_id):
     """Return the URL for recipe image upload"""
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
-def detail_url(recipe_id):
-    """Return recipe detail URL"""
-    return reverse('recipe:recipe-detail', args=[recipe_id])
-
+def image_uploads_url(recipe_id, upload_id=None):
+    """Return the URL for resumable recipe image uploads"""
+    if upload_id is None:
+        return reverse('recipe:recipe-create-image-upload', args=[recipe_id])
+    return reverse('recipe:recipe-image-upload', args=[recipe_id, upload_id])
 
-def create_sample_recipe(user, **params):
-    """create and return a sample recipe"""
-    defaults = {
-        "title": 'Sample recipe',
-        "time_minutes": 10,
-        "price": 5.00
-    }
-    defaults.update(params)
-    return Recipe.objects.create(user=user, **defaults)
 
+def sample_image_bytes(image_format='JPEG', size=(100, 100)):
+    """Return an encoded sample image"""
+    buffer = io.BytesIO()
+    Image.effect_noise(size, 64).convert('RGB').save(buffer, image_format)
+    return buffer.getvalue()
 
-def create_sample_ingredient(user, name="Cajun Rub"):
-    """create and return a sample ingredient"""
-    return Ingredient.objects.create(user=user, name=name)
 
-def create_sample_tag(user, name="creolic"):
-    """create and return a sample tag"""
-    return Tag.objects.create(user=user, name=name)
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
 
 
 class PublicRecipeApiTests(TestCase):
@@ -66,6 +80,7 @@ class PrivateRecipeApiTests(TestCase):
             password="Password123!"
         )
         self.client.force_authenticate(self.user)
+        cache.clear()
 
     def test_list_recipes_successfull(self):
         """Test if Recipe List is available for authenticated Users"""
@@ -87,7 +102,7 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         """Test that created recipes are only visible for the user which created"""
@@ -114,8 +129,8 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeSerializer(all_recipes_from_database, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_view_recipe_detail(self):
         """Test viewing Recipe Detail"""
@@ -129,6 +144,607 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeDetailSerializer(recipe)
         self.assertEqual(response.data, serializer.data)
 
+    def test_list_recipes_constant_query_count(self):
+        """Test that listing recipes does not query per recipe"""
+        tag = create_sample_tag(user=self.user)
+        ingredient = create_sample_ingredient(user=self.user)
+        for amount in (1, 10):
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(amount):
+                    recipe = create_sample_recipe(user=self.user)
+                    recipe.tags.add(tag)
+                    recipe.ingredients.add(ingredient)
+
+            # One query for the recipes, one per prefetched relation
+            with self.assertNumQueries(3):
+                response = self.client.get(RECIPIES_URL)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_view_recipe_detail_query_count(self):
+        """Test that the recipe detail prefetches nested objects"""
+        recipe = create_sample_recipe(user=self.user)
+        for name in ('Vegan', 'Dessert', 'Brunch'):
+            recipe.tags.add(create_sample_tag(user=self.user, name=name))
+            recipe.ingredients.add(
+                create_sample_ingredient(user=self.user, name=name)
+            )
+
+        # The validator lookup, the recipe and one per prefetched relation
+        with self.assertNumQueries(4):
+            response = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['tags']), 3)
+        self.assertEqual(len(response.data['ingredients']), 3)
+
+    def test_list_recipes_sparse_fieldset(self):
+        """Test that only the requested fields are loaded and rendered"""
+        recipe = create_sample_recipe(user=self.user, title='Gumbo')
+        recipe.tags.add(create_sample_tag(user=self.user))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(RECIPIES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data['results'], [{'id': recipe.id, 'title': 'Gumbo'}]
+        )
+        # No prefetches, and no columns beyond the requested ones
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"price"', queries[0]['sql'])
+
+    def test_list_recipes_expanded(self):
+        """Test that expanded relations are nested without extra queries"""
+        tag = create_sample_tag(user=self.user, name='Vegan')
+        ingredient = create_sample_ingredient(user=self.user)
+        for _ in range(3):
+            recipe = create_sample_recipe(user=self.user)
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                RECIPIES_URL, {'fields': 'title,tags,ingredients',
+                               'expand': 'tags'}
+            )
+
+        result = response.data['results'][0]
+        self.assertEqual(result['tags'], [{'id': tag.id, 'name': 'Vegan'}])
+        self.assertEqual(result['ingredients'], [ingredient.id])
+
+    def test_view_recipe_detail_sparse_fieldset(self):
+        """Test trimming the detail, which is revalidated per fieldset"""
+        recipe = create_sample_recipe(user=self.user, title='Gumbo')
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(
+            url, {'fields': 'title,tags'}, HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'title': 'Gumbo', 'tags': []})
+
+    def test_sparse_fieldset_invalid_names(self):
+        """Test that unknown fields and relations are rejected"""
+        response = self.client.get(RECIPIES_URL, {'fields': 'title,secret'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(RECIPIES_URL, {'expand': 'price'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_recipes_paginated_by_cursor(self):
+        """Test that recipes are paginated newest first with a cursor"""
+        recipes = [
+            create_sample_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(3)
+        ]
+
+        response = self.client.get(RECIPIES_URL, {'page_size': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipes[2].id, recipes[1].id]
+        )
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipes[0].id]
+        )
+        self.assertIsNone(response.data['next'])
+
+    def test_list_recipes_page_size_capped(self):
+        """Test that the requested page size can not exceed the cap"""
+        for i in range(3):
+            create_sample_recipe(user=self.user, title=f'Recipe {i}')
+
+        with patch.object(RecipeCursorPagination, 'max_page_size', 2):
+            response = self.client.get(RECIPIES_URL, {'page_size': 100})
+
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_filter_recipes_by_tags_unique(self):
+        """Test that recipes matching several tags are returned once"""
+        recipe = create_sample_recipe(user=self.user)
+        tag1 = create_sample_tag(user=self.user, name='Vegan')
+        tag2 = create_sample_tag(user=self.user, name='Dessert')
+        recipe.tags.add(tag1, tag2)
+
+        response = self.client.get(
+            RECIPIES_URL,
+            {'tags': f'{tag1.id},{tag2.id}'}
+        )
+
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_filter_recipes_match_all(self):
+        """Test returning only recipes carrying every requested tag"""
+        recipe1 = create_sample_recipe(user=self.user, title='Gumbo')
+        recipe2 = create_sample_recipe(user=self.user, title='Jambalaya')
+        tag1 = create_sample_tag(user=self.user, name='Cajun')
+        tag2 = create_sample_tag(user=self.user, name='Spicy')
+        ingredient = create_sample_ingredient(user=self.user, name='Okra')
+        recipe1.tags.add(tag1, tag2)
+        recipe1.ingredients.add(ingredient)
+        recipe2.tags.add(tag1)
+
+        response = self.client.get(
+            RECIPIES_URL,
+            {
+                'tags': f'{tag1.id},{tag2.id}',
+                'ingredients': f'{ingredient.id}',
+                'match': 'all',
+            }
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipe1.id]
+        )
+
+    def test_filter_recipes_invalid_params(self):
+        """Test that malformed filter parameters are rejected"""
+        response = self.client.get(RECIPIES_URL, {'tags': '1,abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(RECIPIES_URL, {'match': 'some'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_recipes_by_ranges(self):
+        """Test filtering recipes by time, price and title prefix"""
+        quick = create_sample_recipe(
+            user=self.user, title='Grits', time_minutes=10, price=2
+        )
+        create_sample_recipe(
+            user=self.user, title='Gumbo', time_minutes=90, price=8
+        )
+        create_sample_recipe(
+            user=self.user, title='Granola', time_minutes=5, price=12
+        )
+
+        response = self.client.get(RECIPIES_URL, {
+            'time_minutes__lte': '30',
+            'price__range': '1.50, 10',
+            'title__startswith': 'gr',
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [quick.id]
+        )
+
+    def test_order_recipes_by_price(self):
+        """Test ordering recipes by price across cursor pages"""
+        prices = (8, 2, 5, 2)
+        recipes = [
+            create_sample_recipe(user=self.user, price=price)
+            for price in prices
+        ]
+        expected = [
+            recipe.id
+            for recipe in sorted(recipes, key=lambda r: (-r.price, -r.id))
+        ]
+
+        ids = []
+        url, params = RECIPIES_URL, {'ordering': '-price', 'page_size': 3}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url, params = response.data['next'], None
+
+        self.assertEqual(ids, expected)
+
+    def test_order_recipes_with_many_ties(self):
+        """Test paging through more ties than a cursor offset allows"""
+        Recipe.objects.bulk_create(
+            Recipe(user=self.user, title=f'Stew {i}', time_minutes=30,
+                   price=5)
+            for i in range(1010)
+        )
+        quick = create_sample_recipe(user=self.user, time_minutes=5)
+        expected = [quick.id] + list(
+            Recipe.objects.filter(time_minutes=30)
+            .order_by('id').values_list('id', flat=True)
+        )
+
+        pages = []
+        url = RECIPIES_URL
+        params = {'ordering': 'time_minutes', 'page_size': 100}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([recipe['id'] for recipe in response.data['results']])
+            url, params = response.data['next'], None
+
+        self.assertEqual(sum(pages, []), expected)
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual(
+            [recipe['id'] for recipe in previous.data['results']],
+            pages[-2]
+        )
+
+    def test_invalid_cursor(self):
+        """Test that a tampered cursor is rejected"""
+        response = self.client.get(RECIPIES_URL, {'cursor': 'cD1bIngiXQ=='})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_filter_and_order_invalid_params(self):
+        """Test that unknown orderings and malformed bounds are rejected"""
+        for params in (
+            {'ordering': 'title'},
+            {'ordering': '--price'},
+            {'time_minutes__gte': 'soon'},
+            {'price__lte': 'NaN'},
+            {'price__range': '1'},
+        ):
+            response = self.client.get(RECIPIES_URL, params)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST, params
+            )
+
+    def test_list_recipes_served_from_cache(self):
+        """Test that a repeated list request does not hit the database"""
+        create_sample_recipe(user=self.user)
+        response = self.client.get(RECIPIES_URL, {'page_size': 10})
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(RECIPIES_URL, {'page_size': 10})
+
+        self.assertEqual(cached.data, response.data)
+
+    def test_list_recipes_cache_invalidated_on_change(self):
+        """Test that changing a recipe invalidates the cached list"""
+        recipe = create_sample_recipe(user=self.user)
+        self.client.get(RECIPIES_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = create_sample_tag(user=self.user)
+            recipe.tags.add(tag)
+        response = self.client.get(RECIPIES_URL)
+
+        self.assertEqual(response.data['results'][0]['tags'], [tag.id])
+
+    def test_view_recipe_detail_not_modified(self):
+        """Test that an unchanged recipe is answered with 304"""
+        recipe = create_sample_recipe(user=self.user)
+        tag = create_sample_tag(user=self.user)
+        recipe.tags.add(tag)
+        url = detail_url(recipe.id)
+
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        tag.name = 'Renamed'
+        tag.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_recipes_not_modified(self):
+        """Test that an unchanged recipe list is answered with 304"""
+        create_sample_recipe(user=self.user)
+
+        response = self.client.get(RECIPIES_URL)
+        etag = response['ETag']
+
+        response = self.client.get(RECIPIES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_sample_recipe(user=self.user)
+        response = self.client.get(RECIPIES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_search_recipes(self):
+        """Test searching recipes by title, tag and ingredient names"""
+        gumbo = create_sample_recipe(user=self.user, title='Seafood Gumbo')
+        grits = create_sample_recipe(user=self.user, title='Grits')
+        grits.tags.add(create_sample_tag(user=self.user, name='Seafood'))
+        okra = create_sample_recipe(user=self.user, title='Fried Okra')
+        okra.ingredients.add(
+            create_sample_ingredient(user=self.user, name='Seafood Salt')
+        )
+        create_sample_recipe(user=self.user, title='Jambalaya')
+
+        response = self.client.get(RECIPIES_URL, {'q': 'seafood'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {recipe['id'] for recipe in response.data['results']},
+            {gumbo.id, grits.id, okra.id}
+        )
+
+    @patch('recipe.views.search_enabled', return_value=True)
+    @patch('recipe.filters.search_enabled', return_value=True)
+    def test_search_recipes_ranked(self, *enabled):
+        """Test that PostgreSQL matches web search syntax, best first"""
+        terms = '"seafood gumbo" -okra'
+        request = Request(
+            APIRequestFactory().get(RECIPIES_URL, {'q': terms})
+        )
+        request.user = self.user
+        view = RecipeViewSet(action='list', request=request, kwargs={})
+        # Compiled only, there is no PostgreSQL server to run it on
+        postgresql = load_backend('django.db.backends.postgresql') \
+            .DatabaseWrapper(connection.settings_dict, 'postgresql')
+
+        sql, params = view.get_queryset().query.get_compiler(
+            connection=postgresql
+        ).as_sql()
+
+        self.assertIn(
+            '"core_recipe"."search_vector" @@ websearch_to_tsquery(', sql
+        )
+        self.assertIn('ts_rank("core_recipe"."search_vector"', sql)
+        self.assertIn('ORDER BY "rank" DESC', sql)
+        self.assertIn(terms, params)
+
+    def test_bulk_create_recipes(self):
+        """Test creating several recipes with one request"""
+        tag = create_sample_tag(user=self.user)
+        ingredient = create_sample_ingredient(user=self.user)
+        payload = [
+            {
+                'title': 'Gumbo',
+                'time_minutes': 60,
+                'price': '8.50',
+                'tags': [tag.id],
+                'ingredients': [ingredient.id],
+            },
+            {'title': 'Grits', 'time_minutes': 20, 'price': '2.00'},
+        ]
+
+        response = self.client.post(BULK_RECIPES_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [recipe['title'] for recipe in response.data],
+            ['Gumbo', 'Grits']
+        )
+        gumbo = Recipe.objects.get(id=response.data[0]['id'])
+        self.assertEqual(gumbo.user, self.user)
+        self.assertEqual(list(gumbo.tags.all()), [tag])
+        self.assertEqual(list(gumbo.ingredients.all()), [ingredient])
+        self.assertEqual(response.data[1]['tags'], [])
+        tag.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+        self.assertEqual(self.user.recipe_count, 2)
+
+    def test_bulk_create_recipes_invalid_is_atomic(self):
+        """Test that one invalid item rejects the whole batch"""
+        user2 = get_user_model().objects.create_user(
+            email="other@testuser.bla",
+            password="Password123!",
+        )
+        foreign_tag = create_sample_tag(user=user2)
+        payload = [
+            {'title': 'Grits', 'time_minutes': 20, 'price': '2.00'},
+            {
+                'title': 'Gumbo',
+                'time_minutes': 60,
+                'price': '8.50',
+                'tags': [foreign_tag.id],
+            },
+            {'title': 'No time', 'price': '1.00'},
+        ]
+
+        response = self.client.post(BULK_RECIPES_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('tags', response.data[1])
+        self.assertIn('time_minutes', response.data[2])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update_recipes(self):
+        """Test partially updating several recipes with one request"""
+        recipe1 = create_sample_recipe(user=self.user, title='Gumbo')
+        recipe2 = create_sample_recipe(user=self.user, title='Grits')
+        recipe2.tags.add(create_sample_tag(user=self.user))
+        tag = create_sample_tag(user=self.user, name='Cajun')
+        payload = [
+            {'id': recipe1.id, 'price': '9.99'},
+            {'id': recipe2.id, 'title': 'Cheese Grits', 'tags': [tag.id]},
+        ]
+
+        response = self.client.patch(
+            BULK_RECIPES_URL,
+            payload,
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(str(recipe1.price), '9.99')
+        self.assertEqual(recipe1.title, 'Gumbo')
+        self.assertEqual(recipe2.title, 'Cheese Grits')
+        self.assertEqual(list(recipe2.tags.all()), [tag])
+
+    def test_bulk_writes_update_search_vectors(self):
+        """Test that bulk writes rebuild the written recipes' vectors"""
+        payload = [
+            {'title': 'Gumbo', 'time_minutes': 60, 'price': '8.50'},
+            {'title': 'Grits', 'time_minutes': 20, 'price': '2.00'},
+        ]
+        with patch('recipe.mixins.update_search_vectors') as update:
+            response = self.client.post(
+                BULK_RECIPES_URL, payload, format='json'
+            )
+        ids = [recipe['id'] for recipe in response.data]
+        self.assertCountEqual(update.call_args[0][0], Recipe.objects.filter(
+            id__in=ids
+        ))
+
+        tag = create_sample_tag(user=self.user)
+        payload = [{'id': ids[0], 'tags': [tag.id]}]
+        with patch('recipe.mixins.update_search_vectors') as update:
+            self.client.patch(BULK_RECIPES_URL, payload, format='json')
+        self.assertEqual(
+            list(update.call_args[0][0]), [Recipe.objects.get(id=ids[0])]
+        )
+
+    def test_bulk_delete_recipes(self):
+        """Test deleting several recipes, limited to the own ones"""
+        user2 = get_user_model().objects.create_user(
+            email="other@testuser.bla",
+            password="Password123!",
+        )
+        recipe1 = create_sample_recipe(user=self.user)
+        recipe2 = create_sample_recipe(user=self.user)
+        foreign = create_sample_recipe(user=user2)
+
+        response = self.client.delete(
+            BULK_RECIPES_URL,
+            [recipe1.id, foreign.id],
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Recipe.objects.count(), 3)
+
+        response = self.client.delete(
+            BULK_RECIPES_URL,
+            [recipe1.id, recipe2.id],
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Recipe.objects.all()), [foreign])
+
+    def test_bulk_update_repeated_or_boolean_ids(self):
+        """Test that repeated and boolean ids are rejected per item"""
+        recipe = create_sample_recipe(user=self.user)
+        tag = create_sample_tag(user=self.user)
+        payload = [
+            {'id': recipe.id, 'tags': [tag.id]},
+            {'id': recipe.id, 'tags': [tag.id]},
+            {'id': True, 'title': 'Hijacked'},
+        ]
+
+        response = self.client.patch(
+            BULK_RECIPES_URL,
+            payload,
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('id', response.data[1])
+        self.assertIn('id', response.data[2])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Sample recipe')
+        self.assertFalse(recipe.tags.exists())
+
+    def test_bulk_delete_recipes_batched(self):
+        """Test that bulk deletes keep the books once per batch"""
+        tag = create_sample_tag(user=self.user)
+        ingredient = create_sample_ingredient(user=self.user)
+        kept = create_sample_recipe(user=self.user)
+        kept.tags.add(tag)
+
+        def delete(count):
+            ids = []
+            for number in range(count):
+                recipe = create_sample_recipe(user=self.user)
+                recipe.tags.add(tag)
+                recipe.ingredients.add(ingredient)
+                ids.append(recipe.id)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.delete(
+                    BULK_RECIPES_URL, ids, format='json'
+                )
+            self.assertEqual(
+                response.status_code, status.HTTP_204_NO_CONTENT
+            )
+            return len(queries)
+
+        self.assertEqual(delete(2), delete(20))
+        tag.refresh_from_db()
+        ingredient.refresh_from_db()
+        self.assertEqual((tag.recipe_count, ingredient.recipe_count), (1, 0))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipe_count, 1)
+        call_command('rebuild_counters', verify=True, stdout=io.StringIO())
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_export_recipes_ndjson(self):
+        """Test streaming the recipes with names, querying per chunk"""
+        tag = create_sample_tag(user=self.user, name='Vegan')
+        for number in range(5):
+            recipe = create_sample_recipe(user=self.user, title=f'R{number}')
+            recipe.tags.add(tag)
+        create_sample_recipe(user=get_user_model().objects.create_user(
+            'other@python.bla',
+            'InSecurePassword123!'
+        ))
+
+        # The recipes, then the tags and ingredients of each of 3 chunks
+        with self.assertNumQueries(7):
+            response = self.client.get(EXPORT_URL)
+            lines = b''.join(response.streaming_content).splitlines()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(lines), 5)
+        first = json.loads(lines[0])
+        self.assertEqual(first['title'], 'R0')
+        self.assertEqual(first['tags'], ['Vegan'])
+        self.assertEqual(first['ingredients'], [])
+
+    def test_export_recipes_csv(self):
+        """Test exporting the recipes as CSV"""
+        recipe = create_sample_recipe(user=self.user, title='Gumbo')
+        recipe.ingredients.add(
+            create_sample_ingredient(user=self.user, name='Okra'),
+            create_sample_ingredient(user=self.user, name='Celery')
+        )
+
+        response = self.client.get(EXPORT_URL, {'format': 'csv'})
+        rows = list(csv.reader(
+            b''.join(response.streaming_content).decode().splitlines()
+        ))
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(rows[0], [
+            'id', 'title', 'time_minutes', 'price', 'link', 'tags',
+            'ingredients'
+        ])
+        self.assertEqual(rows[1][1], 'Gumbo')
+        self.assertEqual(rows[1][6], 'Celery; Okra')
+
     def test_create_basic_recipe(self):
         """Test creating a basic Recipe"""
         payload = {
@@ -221,6 +837,7 @@ class PrivateRecipeApiTests(TestCase):
         self.assertEqual(len(recipe.tags.all()), 0)
 
 
+@override_settings(IMAGE_PROCESSING_MODE='sync')
 class RecipeImageUploadTests(TestCase):
 
     def setUp(self):
@@ -230,9 +847,11 @@ class RecipeImageUploadTests(TestCase):
             'Pasword123!'
         )
         self.client.force_authenticate(self.user)
+        cache.clear()
         self.recipe = create_sample_recipe(self.user)
 
     def tearDown(self):
+        discard_renditions(self.recipe)
         self.recipe.image.delete()
 
     def test_upload_image_to_recipe(self):
@@ -243,11 +862,156 @@ class RecipeImageUploadTests(TestCase):
             img.save(ntf, format='JPEG')
             ntf.seek(0)
             response = self.client.post(url, {'image': ntf}, format='multipart')
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         self.recipe.refresh_from_db()
         self.assertIn('image', response.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def test_upload_image_generates_renditions(self):
+        """Test that resized copies without metadata are generated"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.new('RGB', (1000, 500))
+            exif = Image.Exif()
+            exif[0x010f] = 'Camera Maker'
+            img.save(ntf, format='JPEG', exif=exif)
+            ntf.seek(0)
+            self.client.post(url, {'image': ntf}, format='multipart')
+
+        response = self.client.get(url)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['image_status'], Recipe.IMAGE_READY)
+        renditions = self.recipe.renditions.all()
+        self.assertEqual(
+            len(response.data['renditions']),
+            len(renditions)
+        )
+        small = renditions.get(name='small', format='JPEG')
+        self.assertEqual((small.width, small.height), (320, 160))
+        with Image.open(small.image.path) as rendition:
+            self.assertFalse(rendition.getexif())
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1024)
+    def test_upload_image_too_large(self):
+        """Test that images above the byte limit are rejected"""
+        url = image_upload_url(self.recipe.id)
+        image = io.BytesIO(sample_image_bytes())
+        image.name = 'large.jpg'
+
+        response = self.client.post(url, {'image': image}, format='multipart')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_image_unsupported_format(self):
+        """Test that image formats outside the whitelist are rejected"""
+        url = image_upload_url(self.recipe.id)
+        image = io.BytesIO(sample_image_bytes('GIF'))
+        image.name = 'animated.gif'
+
+        response = self.client.post(url, {'image': image}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', response.data)
+
+    def test_chunked_image_upload(self):
+        """Test uploading an image in resumable chunks"""
+        content = sample_image_bytes()
+        response = self.client.post(
+            image_uploads_url(self.recipe.id),
+            {'filename': 'chunked.jpg', 'size': len(content)}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        url = image_uploads_url(self.recipe.id, response.data['id'])
+        middle = len(content) // 2
+
+        response = self.client.patch(
+            url,
+            content[:middle],
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET='0'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['offset'], middle)
+
+        response = self.client.patch(
+            url,
+            content[middle:],
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET='0'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.get(url).data['offset'], middle)
+
+        response = self.client.patch(
+            url,
+            content[middle:],
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(middle)
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.recipe.refresh_from_db()
+        with self.recipe.image.open('rb') as image:
+            self.assertEqual(image.read(), content)
+        self.assertEqual(self.recipe.image_status, Recipe.IMAGE_READY)
+        self.assertFalse(self.recipe.image_uploads.exists())
+
+    def test_chunked_image_upload_rejects_invalid_header(self):
+        """Test that chunked uploads stop once the header is invalid"""
+        response = self.client.post(
+            image_uploads_url(self.recipe.id),
+            {'filename': 'notes.txt', 'size': 500 * 1024}
+        )
+        url = image_uploads_url(self.recipe.id, response.data['id'])
+
+        response = self.client.patch(
+            url,
+            b'no image' * 40 * 1024,
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET='0'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.recipe.image_uploads.exists())
+
+    def test_expired_image_upload_cleared(self):
+        """Test that expired uploads are refused and cleared with files"""
+        response = self.client.post(
+            image_uploads_url(self.recipe.id),
+            {'filename': 'stalled.jpg', 'size': 500 * 1024}
+        )
+        self.assertIn('expires_at', response.data)
+        url = image_uploads_url(self.recipe.id, response.data['id'])
+        self.client.patch(
+            url,
+            sample_image_bytes()[:1024],
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET='0'
+        )
+        upload = self.recipe.image_uploads.get()
+        path = partial_upload_path(upload)
+        self.assertTrue(os.path.exists(path))
+        # Left behind by an upload whose recipe was deleted
+        orphan = os.path.join(upload_temp_dir(), f'{uuid.uuid4()}.part')
+        open(orphan, 'wb').close()
+        os.utime(orphan, (0, 0))
+
+        self.recipe.image_uploads.update(expires_at=timezone.now())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        call_command('clear_expired_uploads', stdout=io.StringIO())
+
+        self.assertFalse(self.recipe.image_uploads.exists())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(orphan))
+
     def test_upload_an_invalid_image(self):
         """Test Upload an Invalid Image"""
         url = image_upload_url(self.recipe.id)
@@ -275,9 +1039,9 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, response.data)
-        self.assertIn(serializer2.data, response.data)
-        self.assertNotIn(serializer3.data, response.data)
+        self.assertIn(serializer1.data, response.data['results'])
+        self.assertIn(serializer2.data, response.data['results'])
+        self.assertNotIn(serializer3.data, response.data['results'])
 
     def test_filter_recipes_by_ingredients(self):
         """Test returning recipes with specific ingredients"""
@@ -297,6 +1061,6 @@ class RecipeImageUploadTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, response.data)
-        self.assertIn(serializer2.data, response.data)
-        self.assertNotIn(serializer3.data, response.data)
+        self.assertIn(serializer1.data, response.data['results'])
+        self.assertIn(serializer2.data, response.data['results'])
+        self.assertNotIn(serializer3.data, response.data['results'])
@@ -1,5 +1,8 @@
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.core.cache import cache
 from django.test import TestCase
 
 from rest_framework import status
@@ -10,6 +13,8 @@ from core.models import Tag, Recipe
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
+BULK_TAGS_URL = reverse('recipe:tag-bulk')
+UPSERT_TAGS_URL = reverse('recipe:tag-upsert')
 
 
 class PublicTagsApiTests(TestCase):
@@ -35,6 +40,7 @@ class PrivateTagsApiTests(TestCase):
         )
         self.client = APIClient()
         self.client.force_authenticate(self.user)
+        cache.clear()
 
     def test_retrieve_tags(self):
         """Test retrieving Tags"""
@@ -47,7 +53,7 @@ class PrivateTagsApiTests(TestCase):
         serializer = TagSerializer(tags, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Test that tags returned are for the authenticated users"""
@@ -60,8 +66,28 @@ class PrivateTagsApiTests(TestCase):
 
         response = self.client.get(TAGS_URL)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], tag.name)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], tag.name)
+
+    def test_retrieve_tags_paginated_by_name(self):
+        """Test that tags are paginated by name with a cursor"""
+        for name in ('Brunch', 'Dessert', 'Vegan'):
+            Tag.objects.create(user=self.user, name=name)
+
+        response = self.client.get(TAGS_URL, {'page_size': 2})
+
+        self.assertEqual(
+            [tag['name'] for tag in response.data['results']],
+            ['Vegan', 'Dessert']
+        )
+
+        response = self.client.get(response.data['next'])
+
+        self.assertEqual(
+            [tag['name'] for tag in response.data['results']],
+            ['Brunch']
+        )
+        self.assertIsNone(response.data['next'])
 
     def test_create_tags_successful(self):
         """Test creating a new Tag"""
@@ -76,6 +102,124 @@ class PrivateTagsApiTests(TestCase):
         ).exists()
         self.assertTrue(exists)
 
+    def test_bulk_create_and_update_tags(self):
+        """Test creating and renaming several tags with one request"""
+        response = self.client.post(
+            BULK_TAGS_URL,
+            [{'name': 'Vegan'}, {'name': 'Dessert'}],
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            Tag.objects.filter(user=self.user).count(),
+            2
+        )
+
+        payload = [{'id': response.data[0]['id'], 'name': 'Vegetarian'}]
+        response = self.client.patch(BULK_TAGS_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            Tag.objects.get(id=payload[0]['id']).name,
+            'Vegetarian'
+        )
+        self.assertEqual(
+            Tag.objects.get(id=payload[0]['id']).normalized_name,
+            'vegetarian'
+        )
+
+    def test_bulk_rename_updates_search_vectors(self):
+        """Test that renaming tags in bulk rebuilds their recipes' vectors"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5, price=2
+        )
+        recipe.tags.add(tag)
+        Recipe.objects.create(
+            user=self.user, title='Steak', time_minutes=5, price=2
+        )
+
+        with patch('recipe.mixins.update_search_vectors') as update:
+            response = self.client.patch(
+                BULK_TAGS_URL,
+                [{'id': tag.id, 'name': 'Vegetarian'}],
+                format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(update.call_args[0][0]), [recipe])
+
+    def test_bulk_delete_tags_touches_recipes(self):
+        """Test that deleting tags in bulk updates their recipes once"""
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Vegan', 'Quick')
+        ]
+        recipe = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5, price=2
+        )
+        recipe.tags.add(*tags)
+        modified = Recipe.objects.get().updated_at
+
+        with patch('core.models.touch_recipes') as touch:
+            response = self.client.delete(
+                BULK_TAGS_URL, [tag.id for tag in tags], format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        touch.assert_not_called()
+        self.assertFalse(Tag.objects.exists())
+        self.assertGreater(Recipe.objects.get().updated_at, modified)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.tag_count, 0)
+
+    @patch.object(TagSerializer, 'validate_name', lambda self, value: value)
+    def test_concurrent_duplicate_tag_rejected(self):
+        """Test that a name taken after validation is answered with 400"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        response = self.client.post(TAGS_URL, {'name': 'VEGAN'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', response.data)
+
+        response = self.client.post(
+            BULK_TAGS_URL,
+            [{'name': 'Dessert'}, {'name': 'vegan'}],
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_create_duplicate_tag_rejected(self):
+        """Test that a name the user has in another case is rejected"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        response = self.client.post(TAGS_URL, {'name': ' vegan'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            BULK_TAGS_URL,
+            [{'name': 'Dessert'}, {'name': 'VEGAN'}, {'name': 'dessert'}],
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [bool(errors) for errors in response.data],
+            [False, True, True]
+        )
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_upsert_tag(self):
+        """Test that upserting a tag creates it once"""
+        response = self.client.post(UPSERT_TAGS_URL, {'name': 'Vegan'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        retried = self.client.post(UPSERT_TAGS_URL, {'name': 'vegan '})
+        self.assertEqual(retried.status_code, status.HTTP_200_OK)
+        self.assertEqual(retried.data, response.data)
+        self.assertEqual(retried.data['name'], 'Vegan')
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
     def test_create_tag_invalid(self):
         """Test create a Tag without a Name"""
         payload = {
@@ -100,8 +244,8 @@ class PrivateTagsApiTests(TestCase):
 
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
-        self.assertIn(serializer1.data, response.data)
-        self.assertNotIn(serializer2.data, response.data)
+        self.assertIn(serializer1.data, response.data['results'])
+        self.assertNotIn(serializer2.data, response.data['results'])
 
     def test_retrieve_tags_unique(self):
         """Test that filtering tags by assigned returns unique items"""
@@ -123,4 +267,62 @@ class PrivateTagsApiTests(TestCase):
         recipe2.tags.add(tag)
 
         response = self.client.get(TAGS_URL, {'assigned_only': 1})
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_retrieve_tags_with_counts(self):
+        """Test that tags can be listed with the number of their recipes"""
+        tag1 = Tag.objects.create(user=self.user, name='Breakfast')
+        tag2 = Tag.objects.create(user=self.user, name='Lunch')
+        for title in ('Pancakes', 'Porridge'):
+            recipe = Recipe.objects.create(
+                title=title,
+                time_minutes=5,
+                price=4.0,
+                user=self.user
+            )
+            recipe.tags.add(tag1)
+
+        response = self.client.get(TAGS_URL, {'with_counts': 1})
+
+        counts = {
+            tag['id']: tag['recipe_count'] for tag in response.data['results']
+        }
+        self.assertEqual(counts, {tag1.id: 2, tag2.id: 0})
+
+    def test_retrieve_tags_boolean_params(self):
+        """Test that flags accept words and reject anything else"""
+        Tag.objects.create(user=self.user, name='Breakfast')
+
+        response = self.client.get(
+            TAGS_URL, {'with_counts': 'yes', 'assigned_only': 'false'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['recipe_count'], 0)
+
+        for param in ('with_counts', 'assigned_only'):
+            response = self.client.get(TAGS_URL, {param: 'maybe'})
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+            self.assertIn(param, response.data)
+
+    def test_retrieve_tags_assigned_single_query(self):
+        """Test that assigned tags and their counts are one query"""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        recipe = Recipe.objects.create(
+            title='Pancakes',
+            time_minutes=5,
+            price=4.0,
+            user=self.user
+        )
+        recipe.tags.add(tag)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                TAGS_URL,
+                {'assigned_only': 1, 'with_counts': 1}
+            )
+
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['recipe_count'], 1)
+        self.assertIsNotNone(response.data['results'][0]['last_used_at'])
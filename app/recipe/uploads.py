@@ -0,0 +1,278 @@
+import io
+import os
+import tempfile
+import time
+from contextlib import suppress
+from datetime import timedelta
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.uploadedfile import UploadedFile, \
+    TemporaryUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler, \
+    StopUpload
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import status
+
+from core.models import RecipeImageUpload
+
+# Bytes buffered at most until the image header has to be parsed
+HEADER_LIMIT = 256 * 1024
+# Bytes read from the body of a chunked upload request at once
+CHUNK_SIZE = 64 * 1024
+# Allowance for the multipart boundaries and headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+INVALID_IMAGE = _(
+    'Upload a valid image. The file you uploaded was either not an image '
+    'or a corrupted image.'
+)
+
+
+def upload_temp_dir():
+    """Return the directory incoming images are streamed to
+
+    It lives below MEDIA_ROOT, so storing a finished upload at its final
+    path is a rename instead of a copy.
+    """
+    path = os.path.join(settings.MEDIA_ROOT, 'uploads', 'incoming')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class UploadRejected(Exception):
+    """Raised as soon as an upload is known to be unacceptable"""
+
+    def __init__(self, message,
+                 status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class ImageHeaderValidator:
+    """Validate an image incrementally while its bytes arrive
+
+    Every chunk counts against IMAGE_UPLOAD_MAX_BYTES. The first chunks
+    are buffered until Pillow can read the header, which is then checked
+    against IMAGE_UPLOAD_FORMATS and IMAGE_UPLOAD_MAX_DIMENSION, so
+    anything that is not an acceptable image is rejected after at most
+    HEADER_LIMIT bytes.
+    """
+
+    def __init__(self, received=0, head=b'', image_format=None):
+        self.received = received
+        self.head = bytearray(head)
+        self.image_format = image_format
+
+    def feed(self, chunk):
+        """Account for and inspect the next chunk of the upload"""
+        self.received += len(chunk)
+        if self.received > settings.IMAGE_UPLOAD_MAX_BYTES:
+            raise UploadRejected(
+                _('Ensure the image has at most %d bytes.')
+                % settings.IMAGE_UPLOAD_MAX_BYTES,
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        if self.image_format is None:
+            self.head += chunk
+            self._inspect(final=len(self.head) >= HEADER_LIMIT)
+
+    def finish(self):
+        """Ensure the header was found once all bytes were received"""
+        if self.image_format is None:
+            self._inspect(final=True)
+
+    def _inspect(self, final):
+        """Parse the buffered header, tolerating truncation unless final"""
+        try:
+            with Image.open(io.BytesIO(self.head)) as image:
+                image_format, (width, height) = image.format, image.size
+        except Image.DecompressionBombError:
+            raise UploadRejected(_('The image dimensions are too large.'))
+        except Exception:
+            if final:
+                raise UploadRejected(INVALID_IMAGE)
+            return
+
+        if image_format not in settings.IMAGE_UPLOAD_FORMATS:
+            raise UploadRejected(
+                _('Unsupported image format %s.') % image_format
+            )
+        if max(width, height) > settings.IMAGE_UPLOAD_MAX_DIMENSION:
+            raise UploadRejected(_('The image dimensions are too large.'))
+
+        self.image_format = image_format
+        self.head = bytearray()
+
+
+class IncomingImageFile(TemporaryUploadedFile):
+    """Temporary upload file placed in upload_temp_dir"""
+
+    def __init__(self, name, content_type, size, charset,
+                 content_type_extra=None):
+        file = tempfile.NamedTemporaryFile(
+            suffix='.upload' + os.path.splitext(name)[1],
+            dir=upload_temp_dir()
+        )
+        UploadedFile.__init__(
+            self, file, name, content_type, size, charset,
+            content_type_extra
+        )
+
+
+class StoredPartialFile(File):
+    """Finished chunked upload which storages move instead of copy"""
+
+    def temporary_file_path(self):
+        """Return the path of the partial file"""
+        return self.file.name
+
+
+class RecipeImageUploadHandler(TemporaryFileUploadHandler):
+    """Stream a multipart image upload to disk, rejecting it early
+
+    Requests whose Content-Length already exceeds the limit are not read
+    at all, files stop streaming as soon as a chunk breaks a limit. The
+    reason is kept in `rejection` for the view to report.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.rejection = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        """Refuse the body without reading it if it is too large"""
+        limit = settings.IMAGE_UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD
+        if content_length > limit:
+            self.rejection = UploadRejected(
+                _('Ensure the image has at most %d bytes.')
+                % settings.IMAGE_UPLOAD_MAX_BYTES,
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+            return QueryDict(encoding=encoding), MultiValueDict()
+
+    def new_file(self, *args, **kwargs):
+        """Start streaming a file next to the final storage location"""
+        super(TemporaryFileUploadHandler, self).new_file(*args, **kwargs)
+        self.validator = ImageHeaderValidator()
+        self.file = IncomingImageFile(
+            self.file_name,
+            self.content_type,
+            0,
+            self.charset,
+            self.content_type_extra
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        """Validate and write the next chunk"""
+        try:
+            self.validator.feed(raw_data)
+        except UploadRejected as rejection:
+            self.rejection = rejection
+            raise StopUpload(connection_reset=True)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        """Return the file once its header has been validated"""
+        try:
+            self.validator.finish()
+        except UploadRejected as rejection:
+            self.rejection = rejection
+            raise StopUpload(connection_reset=True)
+        return super().file_complete(file_size)
+
+
+def partial_upload_path(upload):
+    """Return the path the chunks of a resumable upload are written to"""
+    return os.path.join(upload_temp_dir(), f'{upload.id}.part')
+
+
+def upload_expiry():
+    """Return when a resumable upload receiving a chunk now expires"""
+    return timezone.now() + timedelta(seconds=settings.IMAGE_UPLOAD_EXPIRY)
+
+
+def clear_expired_uploads():
+    """Delete expired resumable uploads with their partial files
+
+    Partial files left without an upload, like those of deleted recipes,
+    are removed as well once nothing was written to them for the expiry
+    period. Returns the number of deleted uploads and removed files.
+    """
+    removed = 0
+    expired = RecipeImageUpload.objects.filter(expires_at__lte=timezone.now())
+    for upload in expired.iterator():
+        with suppress(FileNotFoundError):
+            os.remove(partial_upload_path(upload))
+            removed += 1
+    deleted, _ = expired.delete()
+
+    written_before = time.time() - settings.IMAGE_UPLOAD_EXPIRY
+    for entry in os.scandir(upload_temp_dir()):
+        upload_id, extension = os.path.splitext(entry.name)
+        if extension != '.part' or entry.stat().st_mtime >= written_before:
+            continue
+        if RecipeImageUpload.objects.filter(pk=upload_id).exists():
+            continue
+        with suppress(FileNotFoundError):
+            os.remove(entry.path)
+        removed += 1
+    return deleted, removed
+
+
+def append_chunks(upload, stream):
+    """Append the request body to a resumable upload
+
+    The partial file is truncated to the recorded offset first, so bytes
+    written by an interrupted request are sent again. The offset is
+    stored after every call, also when the client disconnects, and the
+    partial file is removed once the upload is rejected.
+    """
+    path = partial_upload_path(upload)
+    validator = ImageHeaderValidator(
+        received=upload.offset,
+        image_format=upload.image_format or None
+    )
+    mode = 'r+b' if os.path.exists(path) else 'w+b'
+    with open(path, mode) as part:
+        if validator.image_format is None:
+            validator.head += part.read(min(upload.offset, HEADER_LIMIT))
+        part.truncate(upload.offset)
+        part.seek(upload.offset)
+        try:
+            while stream is not None:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if upload.offset + len(chunk) > upload.size:
+                    raise UploadRejected(
+                        _('The upload exceeds its announced size.')
+                    )
+                validator.feed(chunk)
+                part.write(chunk)
+                upload.offset += len(chunk)
+            if upload.offset == upload.size:
+                validator.finish()
+        except UploadRejected:
+            part.close()
+            os.remove(path)
+            upload.delete()
+            raise
+        finally:
+            if upload.pk:
+                upload.image_format = validator.image_format or ''
+                upload.expires_at = upload_expiry()
+                upload.save(
+                    update_fields=['offset', 'image_format', 'expires_at']
+                )
+
+    if upload.offset == upload.size:
+        return StoredPartialFile(open(path, 'rb'), name=upload.filename)
+    return None
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from core.async_views import concurrent_requests
 from recipe import views
 
 router = DefaultRouter()
@@ -8,6 +10,12 @@ router.register('tags', views.TagViewSet)
 router.register('ingredients', views.IngredientViewSet)
 router.register('recipes', views.RecipeViewSet)
 
+if settings.ASYNC_VIEWS:
+    for pattern in router.urls:
+        # Streamed views are served by the WSGI handler in a thread already
+        if f'recipe:{pattern.name}' not in settings.WSGI_STREAMED_VIEWS:
+            pattern.callback = concurrent_requests(pattern.callback)
+
 app_name = 'recipe'
 
 urlpatterns = [
@@ -1,75 +1,305 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from core.models import Tag, Ingredient, Recipe
+from core import images
+from core.authentication import CachedTokenAuthentication
+from core.db.routers import ReplicaReadMixin
+from core.models import Tag, Ingredient, Recipe, RecipeImageUpload
+from core.names import normalize_name, upsert_named
+from core.search import search_enabled
 
-from recipe import serializers
+from recipe import serializers, filters, uploads
+from recipe.exports import EXPORT_FORMATS, NDJSONRenderer, CSVRenderer, \
+    export_chunks
+from recipe.mixins import SerializerTimingMixin, CachedListMixin, \
+    ConditionalRetrieveMixin, BulkModelMixin
+from recipe.pagination import RecipeCursorPagination, \
+    RecipeAttributeCursorPagination
+from recipe.uploads import RecipeImageUploadHandler
 
 
-class BaseRecipeAttibuteViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttibuteViewSet(ReplicaReadMixin,
+                                SerializerTimingMixin,
+                                CachedListMixin,
+                                BulkModelMixin,
+                                viewsets.GenericViewSet,
                                 mixins.ListModelMixin,
                                 mixins.CreateModelMixin):
     """Base viewset for user owned recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeAttributeCursorPagination
 
     def get_queryset(self):
         """Returns objects for the current authenticated user only"""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
+        assigned_only = filters.parse_flag(
+            'assigned_only', self.request.query_params.get('assigned_only')
         )
-        queryset = self.queryset
+        queryset = self.queryset.filter(user=self.request.user)
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            queryset = filters.filter_assigned(queryset)
 
-        return queryset.filter(user=self.request.user).order_by('-name').distinct()
+        return queryset.order_by('-name')
+
+    def get_serializer_class(self):
+        """Include the usage counters if they were requested"""
+        with_counts = filters.parse_flag(
+            'with_counts', self.request.query_params.get('with_counts')
+        )
+        if self.action == 'list' and with_counts:
+            return self.count_serializer_class
+        return self.serializer_class
 
     def perform_create(self, serializer):
         """Creates objects"""
-        serializer.save(user=self.request.user)
+        with self.name_conflicts_rejected():
+            serializer.save(user=self.request.user)
+
+    def bulk_create(self, request, items):
+        """Insert a batch, unless a name got taken meanwhile"""
+        with self.name_conflicts_rejected():
+            return super().bulk_create(request, items)
+
+    def bulk_update(self, request, items):
+        """Update a batch, unless a name got taken meanwhile"""
+        with self.name_conflicts_rejected():
+            return super().bulk_update(request, items)
+
+    @contextmanager
+    def name_conflicts_rejected(self):
+        """Answer a name taken by a concurrent request like a taken one
+
+        The names are validated before they are written, so two requests
+        can pass validation with the same name. The unique index rejects
+        the second write.
+        """
+        try:
+            with transaction.atomic():
+                yield
+        except IntegrityError:
+            raise ValidationError(
+                {'name': [_('You already have one with this name.')]}
+            )
+
+    @action(methods=['POST'], detail=False)
+    def upsert(self, request):
+        """Return the object of a name, creating it unless the user has it
+
+        Answers 201 if the object was created and 200 if it existed, so
+        retried requests never create duplicates.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        instance, created = upsert_named(
+            self.get_queryset().model,
+            request.user,
+            serializer.validated_data['name']
+        )
+        return Response(
+            self.get_serializer(instance).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    def get_serializer_context(self):
+        """Look up the names a request may not take"""
+        context = super().get_serializer_context()
+        if self.action == 'upsert':
+            # Upserting a taken name returns its object
+            context['taken_names'] = {}
+        elif self.action == 'bulk' and self.request.method != 'DELETE':
+            context['taken_names'] = self.get_taken_names()
+        return context
+
+    def get_taken_names(self):
+        """Return the ids of the normalized names of a batch the user has"""
+        if not hasattr(self, '_taken_names'):
+            items = self.request.data
+            names = {
+                normalize_name(item['name'])
+                for item in (items if isinstance(items, list) else ())
+                if isinstance(item, dict) and isinstance(item.get('name'), str)
+            }
+            self._taken_names = dict(
+                self.get_queryset().model.objects.filter(
+                    user=self.request.user,
+                    normalized_name__in=names
+                ).values_list('normalized_name', 'pk')
+            ) if names else {}
+        return self._taken_names
+
+    def _validate_bulk(self, serializers):
+        """Also reject names repeated within the batch"""
+        errors = super()._validate_bulk(serializers)
+        seen = set()
+        for serializer, item_errors in zip(serializers, errors):
+            if 'name' not in serializer.validated_data:
+                continue
+            normalized = normalize_name(serializer.validated_data['name'])
+            if normalized in seen:
+                item_errors['name'] = [_('Repeated within the batch.')]
+            seen.add(normalized)
+        return errors
 
 
 class TagViewSet(BaseRecipeAttibuteViewSet):
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    count_serializer_class = serializers.TagCountSerializer
+    bulk_search_lookup = 'tags'
 
 
 class IngredientViewSet(BaseRecipeAttibuteViewSet):
     """Manage Ingredients in the Database"""
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    count_serializer_class = serializers.IngredientCountSerializer
+    bulk_search_lookup = 'ingredients'
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, SerializerTimingMixin,
+                    CachedListMixin, ConditionalRetrieveMixin, BulkModelMixin,
+                    viewsets.ModelViewSet):
     """Manage Recipes in the Database"""
     queryset = Recipe.objects.all()
     serializer_class = serializers.RecipeSerializer
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (TokenAuthentication, )
-
+    authentication_classes = (CachedTokenAuthentication, )
+    pagination_class = RecipeCursorPagination
+    throttle_scopes = {
+        'upload_image': 'upload',
+        'create_image_upload': 'upload',
+        'export': 'export',
+    }
+    bulk_related_fields = {'tags': Tag, 'ingredients': Ingredient}
+    bulk_search_lookup = 'pk'
+    # Fields the list can be ordered by, each backed by a user index
+    ordering_fields = ('price', 'time_minutes')
 
-    def _convert_commaseparated_params_to_integers(selfs, querystring):
-        """Convert a list of string IDs to a list of integers"""
-        return [int(str_id) for str_id in querystring.split(',')]
 
     def get_queryset(self):
         """Retrieve the recipes for the authenticatd user"""
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
+        params = self.request.query_params
+        # The search vector is only ever read by the database
+        queryset = self.queryset.filter(user=self.request.user).defer(
+            'search_vector'
+        )
+        match = filters.parse_match(params.get('match'))
+
+        for relation in ('tags', 'ingredients'):
+            if params.get(relation):
+                ids = filters.parse_id_list(relation, params[relation])
+                queryset = filters.filter_by_related_ids(
+                    queryset, relation, ids, match
+                )
 
-        if tags:
-            tag_ids = self._convert_commaseparated_params_to_integers(tags)
-            # Foreign Key Lookup
-            queryset = queryset.filter(tags__id__in=tag_ids)
+        queryset = queryset.filter(
+            **filters.parse_range_filters(params, Recipe)
+        )
+        if params.get('title__startswith'):
+            # Served by a (user, UPPER(title)) index on PostgreSQL
+            queryset = queryset.filter(
+                title__istartswith=params['title__startswith']
+            )
 
-        if ingredients:
-            ingredient_ids = self._convert_commaseparated_params_to_integers(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+        if self._search_terms():
+            queryset = filters.search_recipes(queryset, self._search_terms())
 
-        return queryset.filter(user=self.request.user).order_by("-id")
+        if self.action in ('list', 'retrieve'):
+            queryset = self._trim_to_fieldset(queryset)
+
+        return queryset.order_by(*self.get_cursor_ordering())
+
+    def get_fieldset(self):
+        """Return the requested fields, None for all, and expanded relations"""
+        params = self.request.query_params
+        meta = serializers.RecipeSerializer.Meta
+        fields = None
+        if 'fields' in params:
+            fields = filters.parse_name_list(
+                'fields', params['fields'], meta.fields
+            )
+        expand = ()
+        if 'expand' in params and self.action == 'list':
+            expand = filters.parse_name_list(
+                'expand', params['expand'], meta.expandable_fields
+            )
+        return fields, expand
+
+    def _trim_to_fieldset(self, queryset):
+        """Load only the columns and relations the response renders"""
+        fields, expand = self.get_fieldset()
+        relations = list(self.bulk_related_fields)
+        if fields is not None:
+            relations = [name for name in relations if name in fields]
+            columns = [name for name in fields if name not in relations]
+            # The primary key is always loaded, like the fields the page
+            # cursor is made of
+            columns += [
+                name.lstrip('-') for name in self.get_cursor_ordering()
+                if name.lstrip('-') in self.ordering_fields
+            ]
+            queryset = queryset.only(*(columns or ['id']))
+
+        for relation in relations:
+            if self.action == 'retrieve' or relation in expand:
+                # Rendered by the nested serializers
+                columns = ('id', 'name')
+            else:
+                # Rendered as primary keys
+                columns = ('id',)
+            queryset = self._prefetch_recipe_attributes(
+                queryset, columns, (relation,)
+            )
+        return queryset
+
+    def _search_terms(self):
+        """Return the full text search terms of the request"""
+        return self.request.query_params.get('q', '').strip()
+
+    def get_cursor_ordering(self):
+        """Return the requested order, by default by rank or newest first
+
+        Search results are ranked unless ordered otherwise. Ties are broken
+        by the id in the same direction, so the (user, field, id) indexes
+        serve the order.
+        """
+        ordering = filters.parse_ordering(
+            self.request.query_params.get('ordering'), self.ordering_fields
+        )
+        if ordering:
+            return (ordering, '-id' if ordering.startswith('-') else 'id')
+        if self._search_terms() and search_enabled():
+            return ('-rank', '-id')
+        return ('-id',)
+
+    def get_bulk_response_queryset(self):
+        """Return the written recipes with their prefetched relations"""
+        return self._prefetch_recipe_attributes(self.get_queryset(), ('id',))
+
+    def _prefetch_recipe_attributes(self, queryset, fields,
+                                    relations=('tags', 'ingredients')):
+        """Prefetch tags and ingredients with only the given columns"""
+        return queryset.prefetch_related(*(
+            Prefetch(
+                relation,
+                queryset=self.bulk_related_fields[relation].objects.only(
+                    *fields
+                )
+            )
+            for relation in relations
+        ))
 
     def get_serializer_class(self):
         """Return appropriate serializer class"""
@@ -78,30 +308,136 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeDetailSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action in ('create_image_upload', 'image_upload'):
+            return serializers.RecipeImageUploadSerializer
+        elif self.action == 'bulk':
+            return serializers.RecipeBulkSerializer
 
         return self.serializer_class
 
+    def get_serializer(self, *args, **kwargs):
+        """Render reads with the requested fieldset"""
+        if self.action in ('list', 'retrieve'):
+            kwargs['fields'], kwargs['expand'] = self.get_fieldset()
+        return super().get_serializer(*args, **kwargs)
+
     def perform_create(self, serializer):
         """Create a new recipe"""
         serializer.save(user=self.request.user)
 
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @action(methods=['GET'], detail=False,
+            renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """Stream all recipes of the user with their tag and ingredient names
+
+        The format is negotiated, NDJSON by default, or CSV with
+        ?format=csv or an Accept: text/csv header.
+        """
+        queryset = self.queryset.filter(user=request.user).order_by('id')
+        # Pin the database now, the content is read after the view returned
+        queryset = queryset.using(queryset.db)
+        export_format = request.accepted_renderer.format
+        response = StreamingHttpResponse(
+            EXPORT_FORMATS[export_format](
+                export_chunks(queryset, settings.EXPORT_CHUNK_SIZE)
+            ),
+            content_type=request.accepted_renderer.media_type
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="recipes.{export_format}"'
+        return response
+
+    @action(methods=['GET', 'POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
-        """Upload an Image to a recipe"""
+        """Upload an Image to a recipe or show its processing state"""
+        handler = RecipeImageUploadHandler(request)
+        # Must be in place before the multipart body is parsed
+        request.upload_handlers = [handler]
         recipe = self.get_object()
+        if request.method == 'GET':
+            return Response(self.get_serializer(recipe).data)
+
         serializer = self.get_serializer(
             recipe,
             data=request.data
         )
+        if handler.rejection is not None:
+            return Response(
+                {'image': [handler.rejection.message]},
+                status=handler.rejection.status_code
+            )
 
         if serializer.is_valid():
-            serializer.save()
+            # The renditions are generated outside of the request
+            images.discard_renditions(recipe)
+            serializer.save(image_status=Recipe.IMAGE_PENDING)
+            images.enqueue_image_processing(recipe.pk)
             return Response(
                 serializer.data,
-                status=status.HTTP_200_OK
+                status=status.HTTP_202_ACCEPTED
             )
         else:
             return Response(
                 serializer.errors,
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+    @action(methods=['POST'], detail=True, url_path='image-uploads')
+    def create_image_upload(self, request, pk=None):
+        """Start a resumable, chunked image upload"""
+        recipe = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(recipe=recipe, expires_at=uploads.upload_expiry())
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(methods=['GET', 'PATCH'], detail=True,
+            url_path=r'image-uploads/(?P<upload_id>[0-9a-f-]+)')
+    def image_upload(self, request, pk=None, upload_id=None):
+        """Show the offset of or append a chunk to a resumable upload
+
+        A PATCH carries the raw bytes of the next chunk and has to repeat
+        the current offset in its Upload-Offset header. The completed
+        upload becomes the image of the recipe.
+        """
+        recipe = self.get_object()
+        upload = get_object_or_404(
+            RecipeImageUpload,
+            pk=upload_id,
+            recipe=recipe,
+            expires_at__gt=timezone.now()
+        )
+        if request.method == 'GET':
+            return Response(self.get_serializer(upload).data)
+
+        if request.META.get('HTTP_UPLOAD_OFFSET') != str(upload.offset):
+            return Response(
+                self.get_serializer(upload).data,
+                status=status.HTTP_409_CONFLICT
+            )
+
+        try:
+            image = uploads.append_chunks(upload, request.stream)
+        except uploads.UploadRejected as rejection:
+            return Response(
+                {'image': [rejection.message]},
+                status=rejection.status_code
+            )
+        if image is None:
+            return Response(self.get_serializer(upload).data)
+
+        images.discard_renditions(recipe)
+        recipe.image_status = Recipe.IMAGE_PENDING
+        with image:
+            recipe.image.save(upload.filename, image)
+        upload.delete()
+        images.enqueue_image_processing(recipe.pk)
+
+        return Response(
+            serializers.RecipeImageSerializer(
+                recipe,
+                context=self.get_serializer_context()
+            ).data,
+            status=status.HTTP_202_ACCEPTED
+        )
@@ -0,0 +1,36 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from core.async_views import run_in_pool
+
+_executor = None
+
+
+def _get_executor():
+    """Return the thread pool passwords are hashed in"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.LOGIN_WORKERS,
+            thread_name_prefix='login'
+        )
+    return _executor
+
+
+def offloaded_hashing(view):
+    """Turn a sync view hashing passwords into an async one
+
+    Under ASGI the requests of sync views share one thread per process,
+    which a login storm would keep busy hashing. The returned view hashes
+    in a pool of LOGIN_WORKERS threads instead, bounding the CPU taken
+    by logins while other requests carry on.
+    """
+    @functools.wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await run_in_pool(
+            _get_executor(), view, request, *args, **kwargs
+        )
+
+    return async_view
@@ -31,6 +31,15 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
+class UserStatsSerializer(serializers.ModelSerializer):
+    """Serializer for the usage counters of a user"""
+
+    class Meta:
+        model = get_user_model()
+        fields = ('recipe_count', 'tag_count', 'ingredient_count')
+        read_only_fields = fields
+
+
 class AuthTokenSerializer(serializers.Serializer):
     """ Serializer for Token Authentication """
     email = serializers.CharField()
@@ -5,10 +5,13 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.models import Recipe
+
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
+STATS_URL = reverse('user:stats')
 
 
 def create_user(**params):
@@ -65,3 +68,21 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_stats(self):
+        """Test retrieving the usage counters of the user"""
+        Recipe.objects.create(
+            user=self.user,
+            title='Gumbo',
+            time_minutes=5,
+            price=5.0
+        )
+
+        response = self.client.get(STATS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'recipe_count': 1,
+            'tag_count': 0,
+            'ingredient_count': 0,
+        })
@@ -1,10 +1,12 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.throttling import get_store
+
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
@@ -23,6 +25,7 @@ class PublicUserApiTests(TestCase):
     VALID_USERNAME = "Lustig, Peter"
 
     def setUp(self):
+        get_store().clear()
         self.client = APIClient()
 
     def test_create_valid_user_success(self):
@@ -82,6 +85,27 @@ class PublicUserApiTests(TestCase):
         self.assertIn('token', response.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_create_token_rehashes_password(self):
+        """Test that logging in moves the password to the current hasher"""
+        payload = {
+            'email': self.VALID_USER_EMAIL,
+            'password': self.VALID_PASSWORD
+        }
+        with override_settings(PASSWORD_HASHERS=[
+            'core.hashers.PBKDF2PasswordHasher'
+        ]):
+            user = create_user(**payload)
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+        with override_settings(ARGON2_TIME_COST=1):
+            response = self.client.post(TOKEN_URL, payload)
+            user.refresh_from_db()
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(user.password.startswith('argon2$'))
+            self.assertIn('t=1', user.password)
+            self.assertTrue(user.check_password(self.VALID_PASSWORD))
+
     def test_create_token_with_invalid_credentials(self):
         """Try if it is possible to get a Token with wrong credentials"""
         payload = {
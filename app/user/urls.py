@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.urls import path
 
+from core.async_views import concurrent_requests
 from user import views
+from user.async_views import offloaded_hashing
 
 # Required for the reverse function --> App Identification
 app_name = 'user'
@@ -9,4 +12,12 @@ urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
     path('me/', views.ManageUserView.as_view(), name='me'),
+    path('me/stats/', views.UserStatsView.as_view(), name='stats'),
 ]
+
+if settings.ASYNC_VIEWS:
+    for pattern in urlpatterns:
+        if pattern.name in ('create', 'token'):
+            pattern.callback = offloaded_hashing(pattern.callback)
+        else:
+            pattern.callback = concurrent_requests(pattern.callback)
@@ -1,27 +1,60 @@
-from rest_framework import generics, permissions, authentication
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+
+from rest_framework import generics, permissions
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.settings import api_settings
 from rest_framework.authtoken.views import ObtainAuthToken
 
-from user.serializers import UserSerializer, AuthTokenSerializer
+from core.authentication import CachedTokenAuthentication
+from core.db.routers import ReplicaReadMixin
+
+from user.serializers import UserSerializer, UserStatsSerializer, \
+    AuthTokenSerializer
 
 
 class CreateUserView(generics.CreateAPIView):
     """Create a new user in the System"""
     serializer_class = UserSerializer
+    throttle_scope = 'login'
 
 
 class CreateTokenView(ObtainAuthToken):
     """Create a new auth Token for the User"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken disables throttling
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    throttle_scope = 'login'
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(ReplicaReadMixin, generics.RetrieveUpdateAPIView):
     """Manages the authenticated Users"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_object(self):
+        """Retrieve and return authenticated user
+
+        Updates start from the primary's copy, saving the cached user
+        could revert changes made since it was cached.
+        """
+        if self.request.method in SAFE_METHODS:
+            return self.request.user
+        return get_user_model().objects.using(DEFAULT_DB_ALIAS).get(
+            pk=self.request.user.pk
+        )
+
+
+class UserStatsView(generics.RetrieveAPIView):
+    """Show the usage counters of the authenticated user"""
+    serializer_class = UserStatsSerializer
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
-        """Retrieve and return authenticated user"""
-        return self.request.user
+        """Read the counters, which the cached user may lack"""
+        return get_user_model().objects.only(
+            *UserStatsSerializer.Meta.fields
+        ).get(pk=self.request.user.pk)